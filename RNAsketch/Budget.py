@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+'''
+    Budget.py: Stopping criteria shared by optimization runs
+    This makes it possible to limit runs by wall clock time, backend calls and a target score.
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__version__ = "0.1"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import time
+from State import State
+
+class Budget(object):
+    '''
+    Budget limits optimization runs by wall clock time, number of backend calls and a target score.
+    The same object can be shared by several optimization runs, the clock and the call counter start
+    when the object is created or start() is called. Backend calls are counted by State.backend_calls
+    of this process, calls done in other processes have to be added with count().
+
+    After exhausted() returned True, reason tells which limit was reached: 'time', 'evaluations' or 'target'.
+
+    :param max_seconds: Maximal wall clock time in seconds (default: None, unlimited)
+    :param max_evaluations: Maximal number of backend calls (default: None, unlimited)
+    :param target_score: Stop as soon as a score lower or equal to this one is reached (default: None)
+    '''
+
+    def __init__(self, max_seconds=None, max_evaluations=None, target_score=None):
+        self.max_seconds = max_seconds
+        self.max_evaluations = max_evaluations
+        self.target_score = target_score
+        self.start()
+
+    def start(self):
+        '''
+        Restarts the clock and the backend call counter.
+        '''
+        self.reason = None
+        self._start_time = time.time()
+        self._start_calls = State.backend_calls
+        self._counted = 0
+
+    def count(self, evaluations):
+        '''
+        Adds backend calls done in other processes, e.g. by the replicas of parallel_tempering_optimization().
+
+        :param evaluations: Number of backend calls
+        '''
+        self._counted += evaluations
+
+    @property
+    def elapsed(self):
+        '''
+        :return: Seconds since the start of the budget
+        '''
+        return time.time() - self._start_time
+
+    @property
+    def evaluations(self):
+        '''
+        :return: Number of backend calls since the start of the budget
+        '''
+        return State.backend_calls - self._start_calls + self._counted
+
+    def exhausted(self, score=None):
+        '''
+        :param score: Current score of the optimization run, to compare against the target score
+        :return: Boolean whether the optimization run should stop
+        '''
+        if self.reason is None:
+            if self.target_score is not None and score is not None and score <= self.target_score:
+                self.reason = 'target'
+            elif self.max_seconds is not None and self.elapsed >= self.max_seconds:
+                self.reason = 'time'
+            elif self.max_evaluations is not None and self.evaluations >= self.max_evaluations:
+                self.reason = 'evaluations'
+        return self.reason is not None
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+'''
+    Checkpoint.py: Periodically saved state of optimization runs
+    This makes it possible to resume long optimization runs after they got interrupted.
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__version__ = "0.1"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import os
+import time
+import random
+import tempfile
+import cPickle as pickle
+import numpy as np
+from State import State
+from Memo import EvaluationMemo
+
+class Checkpoint(object):
+    '''
+    Checkpoint writes the values of an optimization run to a file at most every interval seconds,
+    together with the state of the random number generators and, if requested, the entries of State.memo.
+    The file is written to a temporary file first and then renamed, so an interrupted write
+    never destroys the previous checkpoint.
+
+    Only the states of the random and numpy.random modules are restored. The random number generator of the
+    RNAblueprint dependency graph object cannot be saved, a resumed run continues with the saved sequence,
+    but samples different sequences than the original run would have.
+
+    :param filename: Filename of the checkpoint file
+    :param interval: Minimal number of seconds between two writes (default: 60)
+    :param resume: Whether load() reads an existing checkpoint file, otherwise it is overwritten (default: True)
+    :param memo: Whether to save the entries held in memory by State.memo together with the run and add them to State.memo on load (default: False)
+    '''
+
+    def __init__(self, filename, interval=60, resume=True, memo=False):
+        self.filename = filename
+        self.interval = interval
+        self.resume = resume
+        self.memo = memo
+        self._last = time.time()
+
+    def derive(self, suffix):
+        '''
+        :param suffix: Suffix appended to the filename, e.g. the number of the optimization run
+        :return: New Checkpoint object with the same settings writing to its own file
+        '''
+        return Checkpoint(self.filename + '.' + str(suffix), self.interval, self.resume, self.memo)
+
+    def load(self, name):
+        '''
+        Reads the checkpoint file and restores the states of the random and numpy.random modules.
+        Saved memo entries are added to State.memo, a new EvaluationMemo is installed if there is none.
+
+        :param name: Name of the optimizer which wrote the checkpoint
+        :return: Dict of the saved values, or None if there is nothing to resume
+        '''
+        if not self.resume or not os.path.exists(self.filename):
+            return None
+        with open(self.filename, 'rb') as f:
+            data = pickle.load(f)
+        if data['name'] != name:
+            raise ValueError('Checkpoint ' + self.filename + ' was written by ' + data['name'] + ', not by ' + name)
+        random.setstate(data['random'])
+        np.random.set_state(data['numpy'])
+        if data['memo'] is not None:
+            if State.memo is None:
+                State.memo = EvaluationMemo()
+            State.memo.update(data['memo'])
+        self._last = time.time()
+        return data['values']
+
+    def save(self, name, **values):
+        '''
+        Writes the checkpoint file.
+
+        :param name: Name of the optimizer writing the checkpoint
+        :param values: Values needed to resume the optimization run, e.g. sequence and score
+        '''
+        data = {'name': name,
+                'values': values,
+                'random': random.getstate(),
+                'numpy': np.random.get_state(),
+                'memo': State.memo.items() if self.memo and State.memo is not None else None}
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        (fd, tmp) = tempfile.mkstemp(dir=directory, prefix='.checkpoint')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.filename)
+        except:
+            os.remove(tmp)
+            raise
+        self._last = time.time()
+
+    def update(self, name, **values):
+        '''
+        Writes the checkpoint file, if the last write is at least interval seconds ago.
+
+        :param name: Name of the optimizer writing the checkpoint
+        :param values: Values needed to resume the optimization run, e.g. sequence and score
+        '''
+        if time.time() - self._last >= self.interval:
+            self.save(name, **values)
@@ -12,7 +12,12 @@ __maintainer__ = "Stefan Hammer"
 __email__ = "s.hammer@univie.ac.at"
 
 
+import os
 import re
+import copy
+import numbers
+import multiprocessing
+import numpy as np
 from State import *
 
 class Design(object):
@@ -21,11 +26,18 @@ class Design(object):
     or to return a solution. It is used as a container between the different
     functions.
 
+    If executor is set to an object with a map function, e.g. a multiprocessing.pool.ThreadPool
+    or Pool, all states are calculated concurrently. Backend calls done by the threads or worker
+    processes are counted in State.backend_calls of this process.
+
     :param structures: RNA secondary structure string in dot-bracket notation
     :param sequence: RNA sequence string in IUPAC notation [AUGC]
     '''
+    executor = None
+
     def __init__(self, structures, sequence=''):
         self._number_of_structures = None
+        self._snapshots = []
         self.state = {}
 
         if isinstance(structures, list):
@@ -43,6 +55,12 @@ class Design(object):
     def classtype(self):
         return None
 
+    def __getstate__(self):
+        # executors cannot be pickled, the copy calculates its states one after the other
+        state = self.__dict__.copy()
+        state.pop('executor', None)
+        return state
+
     def _parseStructures(self, key, struct):
         '''
         Function to create a new state given the state-name and the structure in dot-bracket notation
@@ -96,6 +114,32 @@ class Design(object):
         else:
             raise TypeError('Sequence must be a string containing a IUPAC RNA sequence')
 
+    def push_snapshot(self):
+        '''
+        Remembers the current sequence together with all values calculated for it so far.
+        Call this before assigning a new candidate sequence, to be able to go back to it with pop_snapshot().
+        '''
+        self._snapshots.append((self._sequence, dict((k, s._snapshot()) for k, s in self.state.items())))
+
+    def pop_snapshot(self, restore=True):
+        '''
+        Removes the last snapshot taken with push_snapshot(). If restore is set, the design goes back
+        to the remembered sequence and all its calculated values are available again without any
+        recalculation.
+
+        :param restore: Boolean whether to restore the snapshot or just to drop it (default: True)
+        :return: Sequence of the snapshot
+        '''
+        (sequence, states) = self._snapshots.pop()
+        if restore:
+            self._sequence = sequence
+            for k, state in self.state.items():
+                if k in states:
+                    state._restore(states[k])
+                else:
+                    state.reset()
+        return sequence
+
     @property
     def number_of_structures(self):
         '''
@@ -160,87 +204,171 @@ class Design(object):
         '''
         :return: Dict of energy of structure values of all states with state names as keys
         '''
-        result = {}
-        for s in self.state:
-            result[s] = self.state[s].eos
-        return result
+        return self._collect('eos')
 
     @property
     def pos(self):
         '''
         :return: Dict of probability of structure values of all states with state names as keys
         '''
-        result = {}
-        for s in self.state:
-            result[s] = self.state[s].pos
-        return result
+        return self._collect('pos')
 
     @property
     def eos_diff_mfe(self):
         '''
         :return: Dict of energy of structure to MFE difference values of all states with state names as keys
         '''
-        result = {}
-        for s in self.state:
-            result[s] = self.state[s].eos_diff_mfe
-        return result
+        return self._collect('eos_diff_mfe')
 
     @property
     def eos_reached_mfe(self):
         '''
         :return: Dict of booleans telling if the energy of struct equals the mfe energy of all states with state names as keys
         '''
-        result = {}
-        for s in self.state:
-            result[s] = self.state[s].eos_reached_mfe
-        return result
+        return self._collect('eos_reached_mfe')
 
     @property
     def mfe_structure(self):
         '''
         :return: Dict of mfe structures of all states with state names as keys
         '''
-        result = {}
-        for s in self.state:
-            result[s] = self.state[s].mfe_structure
-        return result
+        return self._collect('mfe_structure')
 
     @property
     def mfe_energy(self):
         '''
         :return: Dict of mfe values of all states with state names as keys
         '''
-        result = {}
-        for s in self.state:
-            result[s] = self.state[s].mfe_energy
-        return result
+        return self._collect('mfe_energy')
     @property
     def pf_structure(self):
         '''
         :return: Dict of partition function consensus structures of all states with state names as keys
         '''
-        result = {}
-        for s in self.state:
-            result[s] = self.state[s].pf_structure
-        return result
+        return self._collect('pf_structure')
     @property
     def pf_energy(self):
         '''
         :return: Dict of partition function energy values of all states with state names as keys
         '''
-        result = {}
-        for s in self.state:
-            result[s] = self.state[s].pf_energy
-        return result
+        return self._collect('pf_energy')
 
     @property
     def ensemble_defect(self):
         '''
         :return: Dict of ensemble defect values of all states with state names as keys
         '''
+        return self._collect('ensemble_defect')
+
+    def evaluate(self, properties=None):
+        '''
+        Calculates eos, mfe, partition function and ensemble defect of all states in one sweep per state.
+        Afterwards all the properties of this design can be read without further calculations.
+        If an executor is set, the states are calculated concurrently.
+
+        :param properties: List of property names to calculate, e.g. ['eos', 'pf_energy'] (default: all)
+        '''
+        self._evaluate_states([self.state[k] for k in sorted(self.state)], properties)
+
+    def evaluate_many(self, sequences, properties=('eos', 'mfe', 'pf'), jobs=None, keys=None):
+        '''
+        Calculates the given properties of all states for many sequences, without building a Design object
+        for each of them. One copy of this design is reused for all sequences. Backends with batch calls
+        calculate all sequences of a chunk at once, the others evaluate one sequence after the other.
+        If jobs is larger than one, chunks of the sequences are calculated in a pool of worker processes.
+
+        :param sequences: List of sequence strings
+        :param properties: Property names: eos, mfe, pf, ensemble_defect or any other state property (default: eos, mfe, pf)
+        :param jobs: Number of worker processes (default: None, calculate in this process)
+        :param keys: List of state keys defining the order of the states (default: sorted state keys)
+        :return: Numpy structured array (number of sequences x number of states) with one field per property, float for
+            numeric properties and object for structures or values not available for some states
+        '''
+        if keys is None:
+            keys = sorted(self.state)
+        properties = [str(p) for p in properties]
+        attributes = [_short_properties.get(p, p) for p in properties]
+        for p, a in zip(properties, attributes):
+            if not isinstance(getattr(State, a, None), property):
+                raise ValueError('Unknown state property: ' + p)
+        template = copy.deepcopy(self)
+        if jobs is None or jobs < 2 or len(sequences) < 2:
+            rows = _evaluate_sequences((template, sequences, keys, attributes))
+        else:
+            chunksize = max(1, -(-len(sequences) // (jobs * 4)))
+            chunks = [(template, sequences[i:i+chunksize], keys, attributes) for i in range(0, len(sequences), chunksize)]
+            pool = multiprocessing.Pool(jobs)
+            try:
+                rows = [row for chunk in pool.map(_evaluate_sequences, chunks) for row in chunk]
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        dtype = [(p, _field_dtype([values[n] for row in rows for values in row])) for n, p in enumerate(properties)]
+        result = np.zeros((len(sequences), len(keys)), dtype=dtype)
+        for i, row in enumerate(rows):
+            for j, values in enumerate(row):
+                result[i, j] = values
+        return result
+
+    def _evaluate_batch(self, sequences, keys, attributes):
+        '''
+        Calculates state properties for a list of sequences by setting one after the other as the sequence of
+        this design. Designs of backends with batch calls override this to calculate all sequences at once.
+
+        :param sequences: List of sequence strings
+        :param keys: List of state keys
+        :param attributes: List of state property names
+        :return: List with a list of value tuples, one for each state, for every sequence
+        '''
+        rows = []
+        for sequence in sequences:
+            self.sequence = sequence
+            self.evaluate(attributes)
+            rows.append(self._values(keys, attributes))
+        return rows
+
+    def _values(self, keys, attributes):
+        '''
+        :param keys: List of state keys
+        :param attributes: List of state property names
+        :return: List of value tuples of the given properties, one for each state
+        '''
+        return [tuple(getattr(self.state[k], a) for a in attributes) for k in keys]
+
+    def _evaluate_states(self, states, properties=None):
+        '''
+        Calculates the given properties of the given states, using the executor if there is one.
+        The results are merged back in the order of the given states.
+
+        :param states: List of state objects of this design
+        :param properties: List of property names to calculate (default: all)
+        '''
+        if self.executor is None or len(states) < 2:
+            for state in states:
+                _evaluate_state((state, properties, os.getpid()))
+        else:
+            results = self.executor.map(_evaluate_state, [(state, properties, os.getpid()) for state in states])
+            for state, (snapshot, backend_calls) in zip(states, results):
+                state._restore(snapshot)
+                State.count_backend_calls(backend_calls)
+
+    def _collect(self, name):
+        '''
+        Collects the given property of all states. If an executor is set, all states not having
+        this value yet are calculated concurrently first.
+
+        :param name: Name of the state property, e.g. 'eos'
+        :return: Dict of property values of all states with state names as keys
+        '''
+        if self.executor is not None and self.sequence:
+            todo = [self.state[k] for k in sorted(self.state) if getattr(self.state[k], '_' + name) is None]
+            self._evaluate_states(todo, [name])
         result = {}
         for s in self.state:
-            result[s] = self.state[s].ensemble_defect
+            result[s] = getattr(self.state[s], name)
         return result
 
     @property
@@ -266,13 +394,170 @@ class nupackDesign(Design):
     def newState(self, key, struct, temperature=37.0, ligand=None, constraint=None, enforce_constraint=False):
         self.state[key] = nupackState(self, structure=struct, temperature=temperature, ligand=ligand, constraint=constraint, enforce_constraint=enforce_constraint)
 
+    def _evaluate_batch(self, sequences, keys, attributes):
+        '''
+        Calculates state properties for a list of sequences with the nupack executables of all
+        sequences and states running concurrently in one batch.
+
+        :param sequences: List of sequence strings
+        :param keys: List of state keys
+        :param attributes: List of state property names
+        :return: List with a list of value tuples, one for each state, for every sequence
+        '''
+        batches = []
+        calls = []
+        for sequence in sequences:
+            self.sequence = sequence
+            batch = []
+            for k in keys:
+                (todo, values) = self.state[k]._batch_calls(attributes)
+                batch.append((k, todo, values))
+                calls.extend(call for (_, _, call) in todo)
+            batches.append(batch)
+        results = []
+        if calls:
+            results = get_backend('nupack').run_batch(calls)
+            State.count_backend_calls(len(calls))
+        rows = []
+        n = 0
+        for sequence, batch in zip(sequences, batches):
+            self.sequence = sequence
+            for (k, todo, values) in batch:
+                self.state[k]._apply_batch(todo, results[n:n+len(todo)], values, attributes)
+                n += len(todo)
+            rows.append(self._values(keys, attributes))
+        return rows
+
 class pkissDesign(Design):
     @property
     def classtype(self):
         return 'pkiss'
 
     def newState(self, key, struct, temperature=37.0, ligand=None, constraint=None, enforce_constraint=False):
-        self.state[key] = pkissState(self, structure=struct, temperature=temperature, ligand=ligand, constraint=constraint, enforce_constraint=enforce_constraint)
+        self.state[key] = pKissState(self, structure=struct, temperature=temperature, ligand=ligand, constraint=constraint, enforce_constraint=enforce_constraint)
+
+    def evaluate(self, properties=None):
+        '''
+        Calculates eos, mfe and partition function of all states with one pKiss call per temperature
+        for the mfe and one batch call per temperature for all eos values, instead of one call per
+        state and value. Values found in State.memo are not calculated again.
+        pKiss cannot calculate partition functions, the mfe is used instead.
+
+        :param properties: List of property names to calculate, e.g. ['eos', 'pf_energy'] (default: eos, mfe and partition function)
+        '''
+        if self.executor is not None or not self.sequence:
+            return super(pkissDesign, self).evaluate(properties)
+        names = _pkiss_names(properties)
+        temperatures = {}
+        for k in sorted(self.state):
+            if not self.state[k]._evaluated:
+                temperatures.setdefault(self.state[k].temperature, []).append(self.state[k])
+        pKiss = get_backend('pKiss')
+        for temperature, states in sorted(temperatures.items()):
+            sequence = states[0]._change_cuts(self.sequence)
+            todo = [state for state in states if 'mfe' in names and (state._mfe_energy is None or state._pf_energy is None)]
+            if todo:
+                results = State._memoized_many(todo, 'mfe', False,
+                    lambda missing: [pKiss.mfe(sequence, temperature = temperature)] * len(missing))
+                for state, result in zip(todo, results):
+                    _set_pkiss_mfe(state, result)
+            todo = [state for state in states if 'eos' in names and state._eos is None and state.structure]
+            if todo:
+                results = State._memoized_many(todo, 'eos', True,
+                    lambda missing: [eos for (shape, eos, _) in pKiss.eval_batch([sequence] * len(missing), [state._change_cuts(state.structure) for state in missing], temperature = temperature)])
+                for state, eos in zip(todo, results):
+                    state._eos = eos
+            if properties is None:
+                for state in states:
+                    state._evaluated = True
+        if properties is not None:
+            # other properties are derived from these values or raise as pKiss cannot calculate them
+            for k in sorted(self.state):
+                self.state[k].evaluate(properties)
+
+    def _evaluate_batch(self, sequences, keys, attributes):
+        '''
+        Calculates state properties for a list of sequences with one pKiss call per temperature for
+        the mfe of all sequences and one for the eos of all sequences and states.
+        Values found in State.memo are not calculated again.
+
+        :param sequences: List of sequence strings
+        :param keys: List of state keys
+        :param attributes: List of state property names
+        :return: List with a list of value tuples, one for each state, for every sequence
+        '''
+        names = _pkiss_names(attributes)
+        values = {}
+        # per temperature, the (sequence index, state key, value name, memo key) of all values to calculate
+        todo = {}
+        for i, sequence in enumerate(sequences):
+            self.sequence = sequence
+            for k in keys:
+                state = self.state[k]
+                for name in sorted(names):
+                    if name == 'eos' and not state.structure:
+                        continue
+                    key = state._memo_key(name, state._structure if name == 'eos' else None)
+                    if State.memo is not None and key in State.memo:
+                        values[(i, k, name)] = State.memo[key]
+                    else:
+                        todo.setdefault(state.temperature, []).append((i, k, name, key))
+        pKiss = get_backend('pKiss')
+        for temperature, items in sorted(todo.items()):
+            # the mfe does not depend on the state, one per sequence is enough
+            mfe_items = [item for item in items if item[2] == 'mfe']
+            if mfe_items:
+                indices = sorted(set(i for (i, _, _, _) in mfe_items))
+                results = dict(zip(indices, pKiss.mfe_batch([self.state[mfe_items[0][1]]._change_cuts(sequences[i]) for i in indices], temperature = temperature)))
+                State.count_backend_calls()
+                for (i, k, name, key) in mfe_items:
+                    values[(i, k, name)] = results[i]
+            eos_items = [item for item in items if item[2] == 'eos']
+            if eos_items:
+                results = pKiss.eval_batch([self.state[k]._change_cuts(sequences[i]) for (i, k, _, _) in eos_items],
+                    [self.state[k]._change_cuts(self.state[k].structure) for (i, k, _, _) in eos_items], temperature = temperature)
+                State.count_backend_calls()
+                for (i, k, name, key), (shape, eos, _) in zip(eos_items, results):
+                    values[(i, k, name)] = eos
+            if State.memo is not None:
+                for (i, k, name, key) in items:
+                    State.memo[key] = values[(i, k, name)]
+        rows = []
+        for i, sequence in enumerate(sequences):
+            self.sequence = sequence
+            for k in keys:
+                state = self.state[k]
+                if (i, k, 'eos') in values:
+                    state._eos = values[(i, k, 'eos')]
+                if (i, k, 'mfe') in values:
+                    _set_pkiss_mfe(state, values[(i, k, 'mfe')])
+            rows.append(self._values(keys, attributes))
+        return rows
+
+def _pkiss_names(properties):
+    '''
+    :param properties: List of property names, None for eos, mfe and partition function
+    :return: Set of the values pKiss has to calculate for them: eos and mfe, which is used as partition function as well
+    '''
+    if properties is None:
+        return set(['eos', 'mfe'])
+    names = set(n for p in properties for n in State._requires.get(p, []))
+    if 'pf' in names:
+        names.add('mfe')
+    return names & set(['eos', 'mfe'])
+
+def _set_pkiss_mfe(state, result):
+    '''
+    Sets the mfe of a pKiss state, which is its partition function as well.
+
+    :param state: pKissState object
+    :param result: Tuple of mfe structure and energy
+    '''
+    (structure, energy) = result
+    state._mfe_structure = state._pf_structure = structure
+    state._mfe_energy = state._pf_energy = energy
+    if State.memo is not None:
+        State.memo[state._memo_key('pf', None)] = result
 
 class hotknotsDesign(Design):
     @property
@@ -282,6 +567,46 @@ class hotknotsDesign(Design):
     def newState(self, key, struct, temperature=37.0, ligand=None, constraint=None, enforce_constraint=False):
         self.state[key] = hotknotsState(self, structure=struct, temperature=temperature, ligand=ligand, constraint=constraint, enforce_constraint=enforce_constraint)
 
+def _evaluate_state(task):
+    '''
+    Calculates the requested properties of one state. This is the function the executor of
+    a Design object maps over its states, so it has to live on module level to be picklable.
+
+    :param task: Tuple of state object, list of property names (None for all) and process id of the caller
+    :return: Dict of all values calculated for the current sequence of this state
+    :return: Number of backend calls done in a worker process, they are not counted by the caller otherwise
+    '''
+    (state, properties, pid) = task
+    backend_calls = State.backend_calls
+    state.evaluate(properties)
+    if os.getpid() == pid:
+        # threads count their calls in State.backend_calls of the caller already
+        backend_calls = State.backend_calls
+    return (dict((a, getattr(state, a)) for a in State._snapshot_attributes), State.backend_calls - backend_calls)
+
+# short names of evaluate_many() properties
+_short_properties = {'mfe': 'mfe_energy', 'pf': 'pf_energy'}
+
+def _evaluate_sequences(task):
+    '''
+    Calculates state properties for a list of sequences. This is the function evaluate_many()
+    maps over chunks of sequences, so it has to live on module level to be picklable.
+
+    :param task: Tuple of design object, list of sequences, list of state keys and list of state attribute names
+    :return: List with a list of value tuples, one for each state, for every sequence
+    '''
+    (design, sequences, keys, attributes) = task
+    return design._evaluate_batch(sequences, keys, attributes)
+
+def _field_dtype(values):
+    '''
+    :param values: List of the values of one property of evaluate_many()
+    :return: Numpy type of the field holding them: float for numbers, object otherwise
+    '''
+    if all(isinstance(v, numbers.Real) for v in values):
+        return float
+    return object
+
 def get_Design(structures, sequence, package, temperature=None):
     '''
     Convenience function to build and return the right Design object
@@ -171,9 +171,12 @@ def eval(sequence, structure, allowGU = True, model = 'DP'):
 
     return structure, _parse_output(output)
 
-# Test for binary precense
-try:
-    output = _call_with_pipe([_get_exec_path('HotKnots'), '-h'], None, raiseOnError = False)
-    output = _call_with_pipe([_get_exec_path('computeEnergy'), '-h'], None, raiseOnError = False)
-except:
-    raise ImportError('HotKnots not found. Please install HotKnots and speficy the HotKnots folder path in an environmental variable called HOTKNOTS!')
+def _check_binaries():
+    '''
+    Tests for the presence of the HotKnots binaries, raises an ImportError otherwise.
+    '''
+    try:
+        output = _call_with_pipe([_get_exec_path('HotKnots'), '-h'], None, raiseOnError = False)
+        output = _call_with_pipe([_get_exec_path('computeEnergy'), '-h'], None, raiseOnError = False)
+    except:
+        raise ImportError('HotKnots not found. Please install HotKnots and speficy the HotKnots folder path in an environmental variable called HOTKNOTS!')
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+'''
+    Memo.py: Least recently used memo for evaluation results
+    This makes it possible to share energy evaluations between Design objects and optimization runs.
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__version__ = "0.1"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import shelve
+import threading
+from collections import OrderedDict
+
+class EvaluationMemo(object):
+    '''
+    EvaluationMemo is a size bounded least recently used store for evaluation results.
+    Keys are tuples containing all parameters of an evaluation, e.g. package, sequence, structure,
+    temperature, ligand, constraint and enforce flag. If a spill file is given, entries that get
+    evicted from memory are written to this on-disk shelve and are looked up there on a miss.
+
+    :param maxsize: Maximal number of entries held in memory (default: 100000)
+    :param spill: Filename of an on-disk shelve for evicted entries (default: None)
+    '''
+
+    def __init__(self, maxsize=100000, spill=None):
+        if maxsize < 1:
+            raise ValueError('Memo size must be at least 1')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._spill_filename = spill
+        self._spill = None
+        self._dropped_spill = None
+        # states might be evaluated concurrently by the executor of a Design object
+        self._lock = threading.RLock()
+        if spill:
+            self._spill = shelve.open(spill)
+
+    def __getstate__(self):
+        # locks and open shelves cannot be pickled, the copy reopens the spill file
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_spill'] = None
+        state['_dropped_spill'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        if self._spill_filename:
+            self._spill = shelve.open(self._spill_filename)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._cache or (self._spill is not None and repr(key) in self._spill)
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                value = self._cache.pop(key)
+            except KeyError:
+                if self._spill is None or repr(key) not in self._spill:
+                    self.misses += 1
+                    raise KeyError(key)
+                value = self._spill[repr(key)]
+            # move to the most recently used end
+            self._cache[key] = value
+            self._evict()
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = value
+            self._evict()
+
+    def _evict(self):
+        while len(self._cache) > self.maxsize:
+            key, value = self._cache.popitem(last=False)
+            if self._spill is not None:
+                self._spill[repr(key)] = value
+
+    @property
+    def hit_rate(self):
+        '''
+        :return: Fraction of lookups that were answered by the memo
+        '''
+        if self.hits + self.misses == 0:
+            return 0.0
+        return float(self.hits) / (self.hits + self.misses)
+
+    def items(self):
+        '''
+        :return: List of the (key, value) pairs held in memory, from the least to the most recently used one
+        '''
+        with self._lock:
+            return list(self._cache.items())
+
+    def update(self, items):
+        '''
+        Adds the given entries as the most recently used ones, e.g. the items() of another memo.
+
+        :param items: Iterable of (key, value) pairs
+        '''
+        with self._lock:
+            for key, value in items:
+                self[key] = value
+
+    def clear(self):
+        '''
+        Removes all entries from memory and from the spill file and resets the counters.
+        '''
+        with self._lock:
+            self._cache.clear()
+            if self._spill is not None:
+                self._spill.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def drop_spill(self):
+        '''
+        Continues without the spill file, evicted entries are discarded from now on. Forked worker processes
+        call this, as their copies of the memo would otherwise write to the same shelve as the parent process.
+        The shelve is neither written nor closed by this object anymore.
+        '''
+        with self._lock:
+            # keep a reference, so the shelve of the parent process is not closed by the garbage collector
+            self._dropped_spill = self._spill
+            self._spill = None
+            self._spill_filename = None
+
+    def close(self):
+        '''
+        Writes back and closes the spill file, if there is one.
+        '''
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+'''
+    Motifs.py: Scanner for sequence motifs which should be avoided in a design.
+    All motifs are compiled once and checked in one pass over the sequence, or after
+    local changes only in the windows around the changed positions.
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__version__ = "0.1"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import re
+import bisect
+import sre_parse
+import numpy as np
+from collections import OrderedDict
+
+class MotifFilter(object):
+    '''
+    MotifFilter checks whether a sequence contains any of the motifs to avoid outside of the
+    white positions. A motif hit is ignored if it lies completely inside one of the white
+    position intervals.
+
+    If the previous sequence is given to reject() and it is known to be free of motifs, only
+    the windows of maximal motif length around the changed positions are scanned again. This
+    needs all motifs to have a bounded length and no lookaround assertions, otherwise the whole
+    sequence is always scanned.
+
+    :param avoid_motifs: List of regex pattern specifiying sequence motifs to avoid
+    :param white_positions: List of [start, end] positions in the sequence where the avoid_motifs pattern should be ignored
+    :param history: Number of motif free sequences to remember as base for incremental checks (default: 16)
+    '''
+
+    def __init__(self, avoid_motifs=None, white_positions=None, history=16):
+        if avoid_motifs is None:
+            avoid_motifs = []
+        if white_positions is None:
+            white_positions = []
+        self.avoid_motifs = list(avoid_motifs)
+        self.white_positions = [list(w) for w in white_positions]
+
+        self._prefilter = None
+        self._detail = None
+        if self.avoid_motifs:
+            # finds all positions where at least one motif starts
+            self._prefilter = re.compile('(?=' + '|'.join(['(?:' + m + ')' for m in self.avoid_motifs]) + ')')
+            # matched at such a position, tells which motifs start there and how long they are
+            self._detail = re.compile(''.join(['(?:(?=(?P<m' + str(i) + '>' + m + ')))?' for i, m in enumerate(self.avoid_motifs)]))
+            self._groups = ['m' + str(i) for i in range(len(self.avoid_motifs))]
+
+        # longest possible motif hit, None if some motif is unbounded or looks around
+        self._width = 0
+        for m in self.avoid_motifs:
+            width = sre_parse.parse(m).getwidth()[1]
+            if width >= sre_parse.MAXREPEAT or re.search(r'\(\?<?[=!]', m):
+                self._width = None
+                break
+            self._width = max(self._width, width)
+
+        # recently checked sequences without any motif, in least recently used order
+        self._history = history
+        self._clean = OrderedDict()
+
+        # interval index: starts sorted ascending, with the maximal end of all intervals up to there
+        intervals = sorted(self.white_positions)
+        self._white_starts = [w[0] for w in intervals]
+        self._white_max_ends = []
+        max_end = None
+        for w in intervals:
+            max_end = w[1] if max_end is None else max(max_end, w[1])
+            self._white_max_ends.append(max_end)
+
+    def __nonzero__(self):
+        return bool(self.avoid_motifs)
+
+    def _is_white(self, start, end):
+        '''
+        :param start: First position of a motif hit
+        :param end: Last position of a motif hit
+        :return: Boolean whether the hit lies completely inside one of the white positions
+        '''
+        i = bisect.bisect_right(self._white_starts, start) - 1
+        return i >= 0 and self._white_max_ends[i] >= end
+
+    def reject(self, sequence, previous=None):
+        '''
+        :param sequence: Sequence string to check
+        :param previous: Sequence string before the last local change, to scan only around the changed positions (default: None, scan everything)
+        :return: Boolean whether the sequence contains any motif to avoid outside of the white positions
+        '''
+        if self._prefilter is None:
+            return False
+        if sequence in self._clean:
+            self._clean[sequence] = self._clean.pop(sequence)
+            return False
+
+        if (previous is not None and self._width is not None and
+                previous in self._clean and len(previous) == len(sequence)):
+            changed = np.flatnonzero(np.frombuffer(sequence, dtype=np.uint8) != np.frombuffer(previous, dtype=np.uint8))
+            rejected = False
+            for (lo, hi) in self._windows(changed):
+                if self._scan(sequence, lo, hi):
+                    rejected = True
+                    break
+        else:
+            rejected = self._scan(sequence, 0, len(sequence))
+
+        if not rejected:
+            self._clean[sequence] = True
+            if len(self._clean) > self._history:
+                self._clean.popitem(last=False)
+        return rejected
+
+    def _windows(self, changed):
+        '''
+        :param changed: Sorted array of changed positions
+        :return: List of merged [lo, hi] ranges of start positions of all hits which might touch a changed position
+        '''
+        windows = []
+        for c in changed:
+            # one more position to the left, a greedy repeat might have read the changed one
+            lo = max(int(c) - self._width, 0)
+            if windows and lo <= windows[-1][1] + 1:
+                windows[-1][1] = int(c)
+            else:
+                windows.append([lo, int(c)])
+        return windows
+
+    def _scan(self, sequence, lo, hi):
+        '''
+        :param sequence: Sequence string to check
+        :param lo: First start position of hits to check
+        :param hi: Last start position of hits to check
+        :return: Boolean whether a motif hit starting in this range lies outside of the white positions
+        '''
+        # hits starting up to hi end before this position, the rest of the sequence is not read
+        endpos = len(sequence) if self._width is None else min(len(sequence), hi + self._width + 1)
+        for f in self._prefilter.finditer(sequence, lo, endpos):
+            start = f.start()
+            if start > hi:
+                break
+            d = self._detail.match(sequence, start, endpos)
+            for g in self._groups:
+                hit = d.group(g)
+                if hit is not None and not self._is_white(start, start + len(hit) - 1):
+                    return True
+        return False
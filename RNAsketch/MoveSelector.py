@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+'''
+    MoveSelector.py: Adaptive choice of the sampling mode during an optimization run
+    The modes are the arms of a multi-armed bandit which are chosen by the UCB1 rule.
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__version__ = "0.1"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import math
+
+class MoveSelector(object):
+    '''
+    MoveSelector chooses the sampling mode of the next move of an optimization run by the UCB1 rule.
+    The reward of a move is the improvement of the score per backend call it needed, so modes which
+    improve the score often and cheaply are chosen more often, while the others are still tried now and then.
+    Rewards are scaled by the best mean reward of all modes, so the exploration weight does not depend
+    on the scale of the objective function.
+
+    :param modes: List of sampling modes to choose from (default: sample, sample_clocal, sample_plocal, sample_unpaired, sample_pairs)
+    :param exploration: Weight of the exploration term (default: sqrt(2))
+    '''
+    modes_available = ['sample', 'sample_clocal', 'sample_plocal', 'sample_unpaired', 'sample_pairs']
+
+    def __init__(self, modes=None, exploration=math.sqrt(2)):
+        self.modes = list(modes) if modes else list(self.modes_available)
+        self.exploration = exploration
+        self.last = None
+        self._moves = dict((m, 0) for m in self.modes)
+        self._improved = dict((m, 0) for m in self.modes)
+        self._improvement = dict((m, 0.0) for m in self.modes)
+        self._evaluations = dict((m, 0) for m in self.modes)
+
+    def choose(self):
+        '''
+        :return: String of the sampling mode to use for the next move
+        '''
+        untried = [m for m in self.modes if not self._moves[m]]
+        if untried:
+            self.last = untried[0]
+        else:
+            rewards = dict((m, self._improvement[m] / max(self._evaluations[m], 1)) for m in self.modes)
+            scale = max(rewards.values()) or 1.0
+            log_total = math.log(sum(self._moves.values()))
+            self.last = max(self.modes, key=lambda m: rewards[m] / scale + self.exploration * math.sqrt(log_total / self._moves[m]))
+        self._moves[self.last] += 1
+        return self.last
+
+    def reward(self, improvement, evaluations=1):
+        '''
+        Records the outcome of the last chosen move.
+
+        :param improvement: Decrease of the score by the move, values below zero count as no improvement
+        :param evaluations: Number of backend calls needed to evaluate the move
+        '''
+        if self.last is None:
+            raise ValueError('No move was chosen yet')
+        if improvement > 0:
+            self._improved[self.last] += 1
+            self._improvement[self.last] += improvement
+        self._evaluations[self.last] += max(evaluations, 1)
+
+    @property
+    def statistics(self):
+        '''
+        :return: Dict with the sampling modes as keys and dicts with the number of moves, improving moves, the total improvement and the backend calls as values
+        '''
+        return dict((m, {'moves': self._moves[m],
+                        'improved': self._improved[m],
+                        'improvement': self._improvement[m],
+                        'evaluations': self._evaluations[m]}) for m in self.modes)
+
+    def write_out(self):
+        '''
+        Generates a nice human readable output of the statistics of all sampling modes.
+
+        :return: String containing the statistics with one mode per line
+        '''
+        lines = []
+        for m in self.modes:
+            lines.append('# {0:15s} moves: {1:7d} | improved: {2:7d} | improvement: {3:9.2f} | per evaluation: {4:.5f}'.format(m,
+                self._moves[m], self._improved[m], self._improvement[m], self._improvement[m] / max(self._evaluations[m], 1)))
+        return '\n'.join(lines)
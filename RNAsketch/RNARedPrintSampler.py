@@ -10,13 +10,15 @@ __version__ = "0.1"
 __maintainer__ = "Stefan Hammer"
 __email__ = "s.hammer@univie.ac.at"
 
-from distutils.dir_util import copy_tree
 import os
 import sys
-import uuid
+import random
 import shutil
+import collections
 import timeit
+import tempfile
 import subprocess as sp
+from multiprocessing.pool import ThreadPool
 import math
 from RNAsketch import *
 
@@ -37,11 +39,15 @@ class RPSampler(object):
     :param gcweight: Integer specifying the GC-weight, ]0, +infinity]
     :param temperature: Temperature for the folding predictions (default: 37.0 degree celsius)
     :param stacksize: Size of one sequence sampling batch (default: 1000 sequences)
-    :param StopConstruct: Bool specifying if we want to benchmark the construction time. Measured time can be obtained from construction_time after construction (default: False)
-    :param RedPrintFolder: Location of the RNARedPrint project folder (default: './RNARedPrint/')
+    :param StopConstruct: Bool specifying if we want to benchmark the construction time. Measured time can be obtained from construction_time after construction, which every later RNARedPrint call updates with its own construction time (default: False)
+    :param RedPrintFolder: Location of the RNARedPrint project folder, it is only read and can be shared by all instances (default: './RNARedPrint/')
+    :param prefetch: Factor of sequences requested from RNARedPrint per call, the surplus is kept for following calls with unchanged weights (default: 1)
+    :param shards: Maximal number of RNARedPrint processes sampling one large request in parallel, each with its own seed. Every process samples at least min_shard sequences (default: 1)
     :param debug: Bool to print debug statements (default: False)
     '''
-    def __init__(self, structures, constraint='', model='nussinov', weights=[], gcweight=1, temperature=37.0, stacksize=1000, StopConstruct=False, RedPrintFolder = None, debug=False):
+    min_shard = 500
+
+    def __init__(self, structures, constraint='', model='nussinov', weights=[], gcweight=1, temperature=37.0, stacksize=1000, StopConstruct=False, RedPrintFolder = None, prefetch=1, shards=1, debug=False):
         self._structures = structures
         self._constraint = constraint
         self.model = model
@@ -55,20 +61,29 @@ class RPSampler(object):
         self._temperature = temperature
         self.weights = weights
         self._debug = debug
+        self.prefetch = prefetch
+        self.shards = shards
+        # sampling and construction times of the processes of the last sharded RNARedPrint call
+        self.shard_times = []
+        self.shard_construction_times = []
+        # sequences sampled with the weights of the key but not used yet: (key, deque of (sequence, energies))
+        self._surplus = None
 
         if not RedPrintFolder:
             RedPrintFolder = self._get_path('')
             if not RedPrintFolder:
                 RedPrintFolder = './RNARedPrint/'
-        # copy RNARedprint binary to temp toDirectory for multithread
-        self._copy_RNAredprint_folder(RedPrintFolder)
+        self._RedPrintFolder = os.path.abspath(RedPrintFolder)
+        # files written by RNARedPrint go to a scratch directory of this instance
+        self._link_RNAredprint_folder()
 
         # call RNAredprint to get construction time
         if StopConstruct:
             self._call_RNAredprint(0)
 
     def __del__(self):
-         shutil.rmtree(self._RedPrintFolder, ignore_errors=True)
+        if getattr(self, '_scratch', None):
+            shutil.rmtree(self._scratch, ignore_errors=True)
 
     def _get_path(self, subfolder):
         '''
@@ -148,9 +163,26 @@ class RPSampler(object):
         self._samplestack = []
         self._current = 0
 
-        newseqs, energies = self._call_RNAredprint(number=(self._stacksize))
+        newseqs = []
+        energies = []
+        for (seq, energy) in self._stream(self._stacksize):
+            newseqs.append(seq)
+            energies.append(energy)
         return newseqs, energies
 
+    def stream_new_stack(self, number=None):
+        '''
+        Draws a sample from RNARedPrint and yields the generated sequences one by one, as soon as RNARedPrint writes them.
+        If the generator is closed early, RNARedPrint is stopped.
+
+        :param number: Amount of sequences (default: stacksize)
+        :return: Generator of tuples of RNA sequence string and dict of structure energies
+        '''
+        if number is None:
+            number = self._stacksize
+        for item in self._stream(number):
+            yield item
+
 
     def sample(self):
         '''
@@ -211,17 +243,130 @@ class RPSampler(object):
         # generate list of sequences with RNAredprint
         if (self._debug):
             print('# getting new sequences: ', self._stacksize, len(self._samplestack), str(self._stacksize - len(self._samplestack)))
-        newseqs, _ = self._call_RNAredprint(number=(self._stacksize - len(self._samplestack)))
-        self._samplestack.extend(newseqs)
+        self._samplestack.extend([seq for (seq, _) in self._stream(self._stacksize - len(self._samplestack))])
 
-    def _copy_RNAredprint_folder(self, RedPrintFolder):
-        # copy subdirectory example
-        fromDirectory = RedPrintFolder
-        toDirectory = "/tmp/RNARedPrint-" + str(uuid.uuid4())
-        self._RedPrintFolder = toDirectory
-        copy_tree(fromDirectory, toDirectory)
+    def _link_RNAredprint_folder(self):
+        '''
+        Creates a scratch directory which mirrors the RNARedPrint project folder with symbolic links.
+        RNARedPrint runs in its bin/ subfolder, so relative paths are read from the shared project folder,
+        while newly written files end up in the scratch directory and parallel instances do not interfere.
+        '''
+        self._scratch = tempfile.mkdtemp(prefix='RNARedPrint-')
+        try:
+            for name in os.listdir(self._RedPrintFolder):
+                if name != 'bin':
+                    os.symlink(os.path.join(self._RedPrintFolder, name), os.path.join(self._scratch, name))
+            os.mkdir(os.path.join(self._scratch, 'bin'))
+            binFolder = os.path.join(self._RedPrintFolder, 'bin')
+            if os.path.isdir(binFolder):
+                for name in os.listdir(binFolder):
+                    os.symlink(os.path.join(binFolder, name), os.path.join(self._scratch, 'bin', name))
+        except:
+            # e.g. a missing project folder, do not leave a half linked scratch directory behind
+            shutil.rmtree(self._scratch, ignore_errors=True)
+            self._scratch = None
+            raise
+
+    def _surplus_key(self):
+        return (tuple(self._weights), self._gcweight, self._modelarg)
+
+    def _stream(self, number):
+        '''
+        Yields the requested amount of sequences, first from the surplus of previous calls with the same weights
+        and then from a new RNARedPrint call. With prefetch larger than one, more sequences are requested and the
+        rest is kept as surplus for the next call.
+
+        :param number: Amount of sequences
+        :return: Generator of tuples of RNA sequence string and dict of structure energies
+        '''
+        key = self._surplus_key()
+        buffered = collections.deque()
+        if self._surplus is not None and self._surplus[0] == key:
+            buffered = self._surplus[1]
+        self._surplus = None
+        try:
+            while buffered and number > 0:
+                number -= 1
+                yield buffered.popleft()
+            if number > 0:
+                for i, item in enumerate(self._sample_RNAredprint(int(math.ceil(number * self.prefetch)))):
+                    if i < number:
+                        yield item
+                    else:
+                        buffered.append(item)
+        finally:
+            if buffered:
+                self._surplus = (key, buffered)
+
+    def _sample_RNAredprint(self, number):
+        '''
+        Splits large requests into shards sampled by parallel RNARedPrint processes, smaller ones are streamed from one process.
+
+        :param number: Amount of sequences
+        :return: Iterable of tuples of RNA sequence string and dict of structure energies
+        '''
+        shards = min(self.shards, number // self.min_shard)
+        if shards > 1:
+            return self._shard_RNAredprint(number, shards)
+        return self._stream_RNAredprint(number)
+
+    def _shard_RNAredprint(self, number, shards):
+        '''
+        Runs one RNARedPrint process per shard with independent seeds and merges their samples.
+        sample_time grows by the sampling time of the slowest process and construction_time is the longest construction time of the processes,
+        the times of every process are kept in shard_times and shard_construction_times.
+
+        :param number: Amount of sequences
+        :param shards: Number of RNARedPrint processes
+        :return: List of tuples of RNA sequence string and dict of structure energies
+        '''
+        tasks = [(number // shards + (1 if i < number % shards else 0), random.randint(0, 2**31-1)) for i in range(0, shards)]
+        # the threads only wait for the RNARedPrint processes
+        pool = ThreadPool(shards)
+        try:
+            results = pool.map(self._call_RNAredprint_shard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+        for (_, _, err) in results:
+            if err:
+                exit(err)
+        self.shard_times = [timing['sample_time'] for (_, timing, _) in results]
+        self.shard_construction_times = [timing['construction_time'] for (_, timing, _) in results]
+        self.sample_time += max(self.shard_times)
+        self.construction_time = max(self.shard_construction_times)
+        return [item for (items, _, _) in results for item in items]
+
+    def _call_RNAredprint_shard(self, task):
+        (number, seed) = task
+        timing = {'sample_time': 0, 'construction_time': 0}
+        try:
+            items = list(self._stream_RNAredprint(number, seed=seed, timing=timing))
+        except SystemExit as e:
+            # exit() in a thread of the pool would not stop the program, the error is raised again by the caller
+            return [], timing, e.code
+        return items, timing, None
 
     def _call_RNAredprint(self, number=1000):
+        sequences = []
+        energies = []
+        for (seq, energy) in self._stream_RNAredprint(number):
+            sequences.append(seq)
+            energies.append(energy)
+        return sequences, energies
+
+    def _stream_RNAredprint(self, number=1000, seed=None, timing=None):
+        '''
+        Starts RNARedPrint and yields the sequences as soon as they are written.
+        The time until RNARedPrint writes its first line is taken as construction time, the remaining time as sampling time.
+
+        :param number: Amount of sequences
+        :param seed: Seed of the random number generator of RNARedPrint (default: None, chosen by RNARedPrint)
+        :param timing: Dict which sums up sample_time and construction_time instead of the attributes of this object, used by parallel shards (default: None)
+        :return: Generator of tuples of RNA sequence string and dict of structure energies
+        '''
+        sample_time = 0
+        construction_time = None
         # resolve PKs
         structuresNoPK = {}
         weights = {}
@@ -234,53 +379,73 @@ class RPSampler(object):
         weights_cmd = []
         for struct, NoPKs in structuresNoPK.items():
             for NoPK in NoPKs:
-                structures_cmd.append('"'+str(NoPK)+'"')
+                structures_cmd.append(str(NoPK))
                 weights_cmd.append(weights[struct])
 
-        cmd = ['./RNARedPrint'] + structures_cmd + ['--num', str(number), '--model', str(self._modelarg), '-gcw', str(self._gcweight), '--weights', ','.join(map(str, weights_cmd))]
-        #cmd=['ls']
-        cmdstring = " ".join(cmd)
+        cmd = [os.path.join(self._RedPrintFolder, 'bin', 'RNARedPrint')] + structures_cmd + ['--num', str(number), '--model', str(self._modelarg), '-gcw', str(self._gcweight), '--weights', ','.join(map(str, weights_cmd))]
+        if seed is not None:
+            cmd += ['--seed', str(seed)]
         if (self._debug):
-            print("# ", cmdstring)
-        #cmd = ['RNAblueprint', '-n', str(number)]
-        #stdin = '\n'.join(structures+[constraint])
-        #p = sp.Popen(cmd, stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.PIPE)
+            print("# ", " ".join(cmd))
         start = timeit.default_timer()
-        p = sp.Popen(cmdstring, stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.PIPE, shell=True, cwd=self._RedPrintFolder + "/bin/")
-        #out, err = p.communicate(input=stdin)
-        out, err = p.communicate(input=None)
-        if err:
-            exit(err)
-        if number == 0:
-            self.construction_time = timeit.default_timer() - start
-        else:
-            self.sample_time += timeit.default_timer() - start
+        # stderr goes to a file, so a full pipe cannot block RNARedPrint while we read stdout
+        err_file = tempfile.TemporaryFile()
+        p = sp.Popen(cmd, stdout=sp.PIPE, stderr=err_file, cwd=os.path.join(self._scratch, 'bin'))
 
-        if (self._debug):
-            print("# ", out, err)
-        lines = out.splitlines()
         seqpattern = re.compile(r"^[AUGC]+")
         strucpattern = re.compile(r"^[\.\(\)]+$")
         epattern = re.compile(r"E(\d)=(-?[\d]+\.?[\d]*)")
 
         structures = []
-        sequences = []
-        energies = []
-        for l in lines:
-            s = re.search(strucpattern, l, flags=0)
-            if s:
-                structures.append(s.group(0))
-            else:
-                s = re.search(seqpattern, l, flags=0)
+        try:
+            for l in iter(p.stdout.readline, b''):
+                # the first line is written as soon as the construction is done
+                if construction_time is None and number > 0:
+                    construction_time = timeit.default_timer() - start
+                    start = timeit.default_timer()
+                l = l.rstrip('\n')
+                if (self._debug):
+                    print("# ", l)
+                s = re.search(strucpattern, l, flags=0)
                 if s:
-                    sequences.append(s.group(0))
-                    struct_energy = {}
-                    for e in re.finditer(epattern, l, flags=0):
-                        struct_energy[structures[int(e.group(1))-1]] = float(e.group(2))
-                    energy = {}
-                    for i, s in enumerate(self._structures):
-                        energy[i] = 0
-                        for sNoPKs in structuresNoPK[s]:
-                            energy[i] += struct_energy[sNoPKs]
-                    energies.append(energy)
-        return sequences, energies
+                    structures.append(s.group(0))
+                else:
+                    s = re.search(seqpattern, l, flags=0)
+                    if s:
+                        seq = s.group(0)
+                        struct_energy = {}
+                        for e in re.finditer(epattern, l, flags=0):
+                            struct_energy[structures[int(e.group(1))-1]] = float(e.group(2))
+                        energy = {}
+                        for i, s in enumerate(self._structures):
+                            energy[i] = 0
+                            for sNoPKs in structuresNoPK[s]:
+                                energy[i] += struct_energy[sNoPKs]
+                        # the time for sampling is not measured while the caller works on the sequence
+                        sample_time += timeit.default_timer() - start
+                        yield (seq, energy)
+                        start = timeit.default_timer()
+            p.wait()
+            err_file.seek(0)
+            err = err_file.read()
+            if err:
+                exit(err)
+            if construction_time is None:
+                construction_time = timeit.default_timer() - start
+            else:
+                sample_time += timeit.default_timer() - start
+        finally:
+            # the generator was closed before all sequences were read
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+            p.stdout.close()
+            err_file.close()
+            if timing is None:
+                self.sample_time += sample_time
+                if construction_time is not None:
+                    self.construction_time = construction_time
+            else:
+                timing['sample_time'] += sample_time
+                if construction_time is not None:
+                    timing['construction_time'] = construction_time
@@ -15,11 +15,10 @@ __email__ = "s.hammer@univie.ac.at"
 import re
 import math
 import sys
+import threading
+import numpy as np
 
 vrna_available = True
-nupack_available = True
-pKiss_available = True
-HotKnots_available = True
 
 try:
     import RNA
@@ -29,38 +28,58 @@ except ImportError as e:
     sys.stderr.write("-" * 60 + "\nWARNING: " + str(e) + "!!!\n" + "-" * 60 + "\n")
     sys.stderr.flush()
 
-try:
-    import nupack
-except ImportError as e:
-    nupack_available = False
-    sys.stderr.write("-" * 60 + "\nWARNING: " + str(e) + "!!!\n" + "-" * 60 + "\n")
-    sys.stderr.flush()
+# wrapper modules of the command line packages, imported and checked on first use
+_backends = {}
+# errors of packages found missing on first use, so their binaries are not probed again
+_backend_errors = {}
 
-try:
-    import pKiss
-except ImportError as e:
-    pKiss_available = False
-    sys.stderr.write("-" * 60 + "\nWARNING: " + str(e) + "!!!\n" + "-" * 60 + "\n")
-    sys.stderr.flush()
-
-try:
-    import HotKnots
-except ImportError as e:
-    HotKnots_available = False
-    sys.stderr.write("-" * 60 + "\nWARNING: " + str(e) + "!!!\n" + "-" * 60 + "\n")
-    sys.stderr.flush()
+def get_backend(name):
+    '''
+    Returns the wrapper module of a command line package. The module is imported and the
+    presence of its binaries is checked on first use only, so importing RNAsketch does not
+    start any processes. A missing package raises the same ImportError on every later use
+    without checking again.
 
-if not (vrna_available or nupack_available or pKiss_available or HotKnots_available):
-    raise ImportError("Neither ViennaRNA package, Nupack or pKiss found!")
+    :param name: Name of the wrapper module: 'nupack', 'pKiss' or 'HotKnots'
+    :return: Wrapper module of the package
+    '''
+    try:
+        return _backends[name]
+    except KeyError:
+        pass
+    if name in _backend_errors:
+        raise _backend_errors[name]
+    if name not in ('nupack', 'pKiss', 'HotKnots'):
+        raise ValueError('Unknown package: ' + name)
+    module = __import__(name, globals(), locals(), [], -1)
+    try:
+        module._check_binaries()
+    except ImportError as e:
+        _backend_errors[name] = e
+        raise
+    _backends[name] = module
+    return module
 
 class State(object):
     '''
     State object holds structure, ligand, constraints and calculates
     all values for this state.
 
+    All backend calls are looked up in State.memo first, if an EvaluationMemo is assigned to it,
+    so results are shared between Design objects and optimization runs. State.backend_calls counts
+    the backend calls actually done in this process, use count_backend_calls() to change it, as states
+    might be evaluated by several threads at once.
+
     :param structure: Dot-bracket structure string
     :param parent: Parent Design object
     '''
+    memo = None
+    backend_calls = 0
+    _backend_calls_lock = threading.Lock()
+
+    # values calculated by the backends, needed by each property
+    _requires = {'eos': ['eos'], 'pos': ['eos', 'pf'], 'eos_diff_mfe': ['eos', 'mfe'], 'eos_reached_mfe': ['eos', 'mfe'],
+        'mfe_energy': ['mfe'], 'mfe_structure': ['mfe'], 'pf_energy': ['pf'], 'pf_structure': ['pf'], 'ensemble_defect': ['ensemble_defect']}
 
     def __init__(self, parent, structure=None, temperature=37.0, ligand=None, constraint=None, enforce_constraint=False):
         if not isinstance(structure, basestring):
@@ -87,6 +106,26 @@ class State(object):
         self._pf_structure = None
         self._pf_energy = None
         self._ensemble_defect = None
+        self._evaluated = False
+
+    # attributes holding the values calculated for the current sequence
+    _snapshot_attributes = ('_eos', '_pos', '_eos_diff_mfe', '_eos_reached_mfe', '_mfe_structure', '_mfe_energy',
+        '_pf_structure', '_pf_energy', '_ensemble_defect', '_evaluated')
+
+    def _snapshot(self):
+        '''
+        :return: Dict containing all values calculated for the current sequence
+        '''
+        return dict((a, getattr(self, a)) for a in self._snapshot_attributes)
+
+    def _restore(self, snapshot):
+        '''
+        Restores the values calculated for a previous sequence without recalculating them.
+
+        :param snapshot: Dict as returned by _snapshot()
+        '''
+        for a, value in snapshot.items():
+            setattr(self, a, value)
 
     @property
     def structure(self):
@@ -192,7 +231,7 @@ class State(object):
         :return: Energy of structure given all the properties of this state (constraints, temperature,...)
         '''
         if not self._eos and self._parent.sequence and self._structure:
-            self._eos = self._get_eos(self._parent.sequence, self._structure, self.temperature, self.ligand)
+            self._eos = self._memoized('eos', self._structure, self._get_eos, self._parent.sequence, self._structure, self.temperature, self.ligand)
         return self._eos
 
     @property
@@ -244,7 +283,7 @@ class State(object):
         return self._mfe_structure
 
     def _calculate_mfe_energy_structure(self):
-        (structure, energie) = self._get_fold(self._parent.sequence, self.temperature, self.ligand, self.constraint)
+        (structure, energie) = self._memoized('mfe', None, self._get_fold, self._parent.sequence, self.temperature, self.ligand, self.constraint)
         self._mfe_energy = energie
         self._mfe_structure = structure
 
@@ -269,7 +308,7 @@ class State(object):
         return self._pf_structure
 
     def _calculate_pf_energy_structure(self):
-        (structure, energie) = self._get_pf_fold(self._parent.sequence, self.temperature, self.ligand, self.constraint)
+        (structure, energie) = self._memoized('pf', None, self._get_pf_fold, self._parent.sequence, self.temperature, self.ligand, self.constraint)
         self._pf_energy = energie
         self._pf_structure = structure
 
@@ -281,9 +320,111 @@ class State(object):
         if not self._ensemble_defect and self._parent.sequence and self._structure:
             if (len(self._parent.sequence) != len(self._structure)):
                 raise ValueError('sequence and structure must have equal length to calculate the ensemble defect!')
-            self._ensemble_defect = self._get_ensemble_defect(self._parent.sequence, self._structure, self.temperature, self.ligand)
+            self._ensemble_defect = self._memoized('ensemble_defect', self._structure, self._get_ensemble_defect, self._parent.sequence, self._structure, self.temperature, self.ligand)
         return self._ensemble_defect
 
+    def evaluate(self, properties=None):
+        '''
+        Calculates mfe, partition function and ensemble defect of this state in one sweep and
+        fills all the corresponding values at once. Use this if an objective needs all of them,
+        the single properties otherwise compute them separately.
+
+        :param properties: List of property names to calculate instead of all, e.g. ['eos', 'pf_energy'] (default: all)
+        '''
+        if not self._parent.sequence:
+            return
+        if properties is not None:
+            for name in properties:
+                getattr(self, name)
+            return
+        if not self._evaluated:
+            (self._mfe_structure, self._mfe_energy,
+            self._pf_structure, self._pf_energy,
+            self._ensemble_defect) = self._memoized('evaluate', self._structure, self._get_full_evaluation, self._parent.sequence, self._structure, self.temperature, self.ligand, self.constraint)
+            self._evaluated = True
+            # make the single values available to later lookups as well
+            if State.memo is not None:
+                State.memo[self._memo_key('mfe', None)] = (self._mfe_structure, self._mfe_energy)
+                State.memo[self._memo_key('pf', None)] = (self._pf_structure, self._pf_energy)
+                if self._ensemble_defect is not None:
+                    State.memo[self._memo_key('ensemble_defect', self._structure)] = self._ensemble_defect
+        self.eos
+
+    def _get_full_evaluation(self, sequence, structure, temperature, ligand, constraint):
+        (mfe_structure, mfe_energy) = self._get_fold(sequence, temperature, ligand, constraint)
+        (pf_structure, pf_energy) = self._get_pf_fold(sequence, temperature, ligand, constraint)
+        ensemble_defect = None
+        if structure and len(sequence) == len(structure):
+            try:
+                ensemble_defect = self._get_ensemble_defect(sequence, structure, temperature, ligand)
+            except NotImplementedError:
+                pass
+        return (mfe_structure, mfe_energy, pf_structure, pf_energy, ensemble_defect)
+
+    def _memo_key(self, name, structure):
+        # values that do not depend on the structure of this state are stored with structure None
+        return (self.classtype, self._parent.sequence, structure, self.temperature,
+            tuple(self.ligand) if self.ligand else None, self.constraint, self.enforce_constraint, name)
+
+    def _memoized(self, name, structure, function, *args):
+        '''
+        Calls the given backend function, unless State.memo already holds its result.
+
+        :param name: Name of the calculated value, part of the memo key
+        :param structure: Structure the value depends on, or None
+        :param function: Backend function to call on a miss
+        :param args: Arguments for the backend function
+        :return: Result of the backend function
+        '''
+        if State.memo is None:
+            State.count_backend_calls()
+            return function(*args)
+        key = self._memo_key(name, structure)
+        try:
+            return State.memo[key]
+        except KeyError:
+            State.count_backend_calls()
+            value = function(*args)
+            State.memo[key] = value
+            return value
+
+    @staticmethod
+    def _memoized_many(states, name, by_structure, function):
+        '''
+        Like _memoized() for a value of several states, which the backend calculates for all of them in one call.
+
+        :param states: List of state objects
+        :param name: Name of the calculated value, part of the memo key
+        :param by_structure: Boolean whether the value depends on the structure of the state
+        :param function: Backend function taking the list of states not found in State.memo and returning a list with one result for each of them
+        :return: List of results, one for each state
+        '''
+        keys = [s._memo_key(name, s._structure if by_structure else None) for s in states]
+        results = [None] * len(states)
+        todo = []
+        for i, key in enumerate(keys):
+            if State.memo is not None and key in State.memo:
+                results[i] = State.memo[key]
+            else:
+                todo.append(i)
+        if todo:
+            State.count_backend_calls()
+            for i, value in zip(todo, function([states[i] for i in todo])):
+                results[i] = value
+                if State.memo is not None:
+                    State.memo[keys[i]] = value
+        return results
+
+    @staticmethod
+    def count_backend_calls(number=1):
+        '''
+        Adds backend calls to State.backend_calls.
+
+        :param number: Number of backend calls done
+        '''
+        with State._backend_calls_lock:
+            State.backend_calls += number
+
     def _get_KT(self, temperature):
         # KT = (betaScale*((temperature+K0)*GASCONST))/1000.0; /* in Kcal */
         return ((temperature + 273.15)*1.98717)/1000.0;
@@ -302,14 +443,39 @@ class State(object):
 
 if vrna_available:
     class vrnaState(State):
+        _snapshot_attributes = State._snapshot_attributes + ('_fold_compounds', '_fold_compound_results')
+
         @property
         def classtype(self):
             return 'vrna'
 
+        def reset(self):
+            super(vrnaState, self).reset()
+            # fold compounds of the current sequence, shared by eos, mfe, pf and ensemble defect
+            self._fold_compounds = {}
+            self._fold_compound_results = {}
+
+        def __getstate__(self):
+            # fold compounds cannot be pickled, they are simply created again if needed
+            state = self.__dict__.copy()
+            state['_fold_compounds'] = {}
+            state['_fold_compound_results'] = {}
+            return state
+
         def _change_cuts(self, input):
             return re.sub('[+]', '&', input)
 
-        def _get_fold_compound(self, sequence, temperature, ligand=None, constraint=None, options=RNA.OPTION_PF):
+        def _fold_compound_key(self, sequence, temperature, ligand, constraint, options):
+            return (sequence, temperature, tuple(ligand) if ligand else None, constraint, options)
+
+        def _get_fold_compound(self, sequence, temperature, ligand=None, constraint=None, options=RNA.OPTION_MFE | RNA.OPTION_PF):
+            '''
+            Returns a fold compound for the given parameters. Fold compounds are cached until the
+            next reset of this state, so the energy parameters are only prepared once per sequence.
+            '''
+            key = self._fold_compound_key(sequence, temperature, ligand, constraint, options)
+            if key in self._fold_compounds:
+                return self._fold_compounds[key]
             md = RNA.md()
             md.temperature = temperature
             md.dangles = 2
@@ -321,149 +487,245 @@ if vrna_available:
                     fc.hc_add_from_db(remove_cuts(constraint), RNA.CONSTRAINT_DB_DEFAULT | RNA.CONSTRAINT_DB_ENFORCE_BP)
                 else:
                     fc.hc_add_from_db(remove_cuts(constraint))
+            self._fold_compounds[key] = fc
             return fc
 
         def _get_eos(self, sequence, structure, temperature, ligand=None):
             if self.multifold > 1:
                 raise NotImplementedError
-            fc = self._get_fold_compound(sequence, temperature, ligand, options=RNA.OPTION_MFE | RNA.OPTION_EVAL_ONLY)
+            # a compound prepared for the partition function evaluates as well, otherwise
+            # an eval only compound avoids allocating the partition function matrices
+            fc = self._fold_compounds.get(self._fold_compound_key(sequence, temperature, ligand, None, RNA.OPTION_MFE | RNA.OPTION_PF))
+            if fc is None:
+                fc = self._get_fold_compound(sequence, temperature, ligand, options=RNA.OPTION_MFE | RNA.OPTION_EVAL_ONLY)
             return fc.eval_structure(remove_cuts(structure))
 
+        def _get_fold_compound_result(self, fc, mode):
+            '''
+            Runs the mfe or partition function algorithm on the given fold compound, but only
+            once. Results are kept together with the cached fold compounds until the next reset.
+
+            :param fc: Fold compound as returned by _get_fold_compound
+            :param mode: String 'mfe' or 'pf'
+            :return: Tuple as returned by the corresponding fold compound function
+            '''
+            key = (id(fc), mode)
+            if key not in self._fold_compound_results:
+                if self.multifold > 1:
+                    raise NotImplementedError
+                if mode == 'mfe':
+                    result = fc.mfe() if self.multifold == 0 else fc.mfe_dimer()
+                else:
+                    result = fc.pf() if self.multifold == 0 else fc.pf_dimer()
+                self._fold_compound_results[key] = result
+            return self._fold_compound_results[key]
+
         def _get_fold(self, sequence, temperature, ligand=None, constraint=None):
-            fc = self._get_fold_compound(sequence, temperature, ligand, constraint, options=RNA.OPTION_MFE)
-            if self.multifold == 0:
-                (structure, energie) = fc.mfe()
+            fc = self._get_fold_compound(sequence, temperature, ligand, constraint)
+            (structure, energie) = self._get_fold_compound_result(fc, 'mfe')
             if self.multifold == 1:
-                (structure, energie) = fc.mfe_dimer()
                 structure = add_cuts(structure, self.cut_points)
-            if self.multifold > 1:
-                raise NotImplementedError
             return (structure, energie)
 
         def _get_pf_fold(self, sequence, temperature, ligand=None, constraint=None):
             fc = self._get_fold_compound(sequence, temperature, ligand, constraint)
             if self.multifold == 0:
-                (structure, energie) = fc.pf()
-            if self.multifold == 1:
+                (structure, energie) = self._get_fold_compound_result(fc, 'pf')
+            else:
                 # returns (string structure, float *FA, float *FB, float *FcAB, float *FAB)
-                (structure, _, _, energie, _) = fc.pf_dimer()
+                (structure, _, _, energie, _) = self._get_fold_compound_result(fc, 'pf')
                 structure = add_cuts(structure, self.cut_points)
-            elif self.multifold > 1:
-                raise NotImplementedError
             return (structure, energie)
 
         def _get_ensemble_defect(self, sequence, structure, temperature, ligand=None):
-            #TODO finish implementation with pairing matrix. need to ask ronny how it is done now or use old interface
             fc = self._get_fold_compound(sequence, temperature, ligand)
-            if self.multifold == 0:
-                _,_ = fc.pf()
-            if self.multifold == 1:
-                _,_ = fc.pf_dimer()
-                structure = add_cuts(structure, self.cut_points)
-            elif self.multifold > 1:
-                raise NotImplementedError
-            # get base pairing probability matrix
-            bpm = fc.bpp()
-            # get base pair table
-            bpt = create_bp_table(structure)
-            # delta(i,j, s) = 1 if (i,j) in s, 0 otherwise
-            # d(s1, s2) = sum{i,j in s1}(1-delta{i,j}(s2)) + sum{i,j not in s1}(delta{i,j}(s2))
-            # ensemble defect = sum{i,j in structure}(1-P(i,j)) + sum{i,j not in structure}(P(i,j))
-            result = 0
-            for i in range(0, len(structure)):
-                for j in range(i, len(structure)):
-                    if (bpt[i] == j):
-                        #print('{0:1.0f}/{1:1.0f}: {2:10.10f}'.format(i, j, bpm[i+1][j+1]))
-                        result += 1-bpm[i+1][j+1]
-                    else:
-                        result += bpm[i+1][j+1]
-            return 2 * result
-
-if nupack_available:
-    class nupackState(State):
-        @property
-        def classtype(self):
-            return 'nupack'
+            self._get_fold_compound_result(fc, 'pf')
+            return calculate_ensemble_defect(create_bpp_array(fc.bpp()), remove_cuts(structure))
 
-        def _change_cuts(self, input):
-            return re.sub('[&]', '+', input)
-
-        def _get_eos(self, sequence, structure, temperature, ligand=None):
-            #TODO nupack.energy can not handle unconnected cofold structures
-            return nupack.energy([self._change_cuts(sequence)], self._change_cuts(structure), material = 'rna', pseudo = True, T = temperature)
-
-        def _get_fold(self, sequence, temperature, ligand=None, constraint=None):
-            nupack_mfe = nupack.mfe([self._change_cuts(sequence)], material = 'rna', pseudo = True, T = temperature) # if str, 0, no error
-
-            pattern = re.compile('(\[\(\')|(\',)|(\'\)\])')
-            temp_mfe = pattern.sub('', "%s" %nupack_mfe)
-            temp_mfe = temp_mfe.replace("'", "")
-            mfe_list = temp_mfe.split()
-
-            mfe_struct = mfe_list[0]
-            mfe_energy = float(mfe_list[1])
-            return mfe_struct, mfe_energy
-
-        def _get_pf_fold(self, sequence, temperature, ligand=None, constraint=None):
-            # Nupack doesn't return ensemble structure
-            return re.sub('[^\+]', '?', self._change_cuts(sequence)), nupack.pfunc([sequence], material = 'rna', pseudo = True, T = temperature)
-
-        def _get_ensemble_defect(self, sequence, structure, temperature, ligand=None):
-            return nupack.defect([self._change_cuts(sequence)], structure, material = 'rna', pseudo = True, T = temperature)
+        def _get_full_evaluation(self, sequence, structure, temperature, ligand=None, constraint=None):
+            # one fold compound: mfe first, rescale the Boltzmann factors with it, then pf and bpp
+            fc = self._get_fold_compound(sequence, temperature, ligand, constraint)
+            (mfe_structure, mfe_energy) = self._get_fold_compound_result(fc, 'mfe')
+            if (id(fc), 'pf') not in self._fold_compound_results:
+                fc.exp_params_rescale(mfe_energy)
+            pf_result = self._get_fold_compound_result(fc, 'pf')
+            if self.multifold == 0:
+                (pf_structure, pf_energy) = pf_result
+            else:
+                (pf_structure, _, _, pf_energy, _) = pf_result
+                mfe_structure = add_cuts(mfe_structure, self.cut_points)
+                pf_structure = add_cuts(pf_structure, self.cut_points)
+            ensemble_defect = None
+            if structure and len(sequence) == len(structure):
+                if constraint:
+                    # the ensemble defect is defined on the unconstrained ensemble
+                    ensemble_defect = self._get_ensemble_defect(sequence, structure, temperature, ligand)
+                else:
+                    ensemble_defect = calculate_ensemble_defect(create_bpp_array(fc.bpp()), remove_cuts(structure))
+            return (mfe_structure, mfe_energy, pf_structure, pf_energy, ensemble_defect)
 
-if pKiss_available:
-    class pKissState(State):
-        @property
-        def classtype(self):
-            return 'pKiss'
+class nupackState(State):
+    @property
+    def classtype(self):
+        return 'nupack'
+
+    def _change_cuts(self, input):
+        return re.sub('[&]', '+', input)
+
+    def _get_eos(self, sequence, structure, temperature, ligand=None):
+        #TODO nupack.energy can not handle unconnected cofold structures
+        return get_backend('nupack').energy([self._change_cuts(sequence)], self._change_cuts(structure), material = 'rna', pseudo = True, T = temperature)
+
+    def _get_fold(self, sequence, temperature, ligand=None, constraint=None):
+        nupack_mfe = get_backend('nupack').mfe([self._change_cuts(sequence)], material = 'rna', pseudo = True, T = temperature) # if str, 0, no error
+
+        pattern = re.compile('(\[\(\')|(\',)|(\'\)\])')
+        temp_mfe = pattern.sub('', "%s" %nupack_mfe)
+        temp_mfe = temp_mfe.replace("'", "")
+        mfe_list = temp_mfe.split()
+
+        mfe_struct = mfe_list[0]
+        mfe_energy = float(mfe_list[1])
+        return mfe_struct, mfe_energy
+
+    def _get_pf_fold(self, sequence, temperature, ligand=None, constraint=None):
+        # Nupack doesn't return ensemble structure
+        return re.sub('[^\+]', '?', self._change_cuts(sequence)), get_backend('nupack').pfunc([sequence], material = 'rna', pseudo = True, T = temperature)
+
+    def _get_ensemble_defect(self, sequence, structure, temperature, ligand=None):
+        return get_backend('nupack').defect([self._change_cuts(sequence)], structure, material = 'rna', pseudo = True, T = temperature)
+
+    def evaluate(self, properties=None):
+        '''
+        Calculates the given properties with all nupack executables needed running concurrently in one batch.
+        Values already calculated or found in State.memo are not calculated again.
+
+        :param properties: List of property names to calculate, e.g. ['eos', 'pf_energy'] (default: eos, mfe, partition function and ensemble defect)
+        '''
+        if not self._parent.sequence:
+            return
+        (todo, values) = self._batch_calls(properties)
+        results = []
+        if todo:
+            results = get_backend('nupack').run_batch([call for (_, _, call) in todo])
+            State.count_backend_calls(len(todo))
+        self._apply_batch(todo, results, values, properties)
+
+    def _batch_calls(self, properties=None):
+        '''
+        Collects the nupack calls needed for the given properties of the current sequence, so the calls
+        of several states and sequences can run in one batch.
+
+        :param properties: List of property names to calculate (default: eos, mfe, partition function and ensemble defect)
+        :return: List of (name, structure, call) tuples of the calls to run
+        :return: Dict of the values found in State.memo
+        '''
+        names = set(['eos', 'mfe', 'pf', 'ensemble_defect'])
+        if properties is not None:
+            names = set(n for p in properties for n in self._requires.get(p, []))
+        nupack = get_backend('nupack')
+        sequences = [self._change_cuts(self._parent.sequence)]
+        calls = []
+        for name in sorted(names):
+            if name == 'eos' and self._eos is None and self._structure:
+                calls.append((name, self._structure, nupack.energy_call(sequences, self._change_cuts(self._structure), material = 'rna', pseudo = True, T = self.temperature)))
+            elif name == 'mfe' and self._mfe_energy is None:
+                calls.append((name, None, nupack.mfe_call(sequences, material = 'rna', pseudo = True, T = self.temperature)))
+            elif name == 'pf' and self._pf_energy is None:
+                calls.append((name, None, nupack.pfunc_call(sequences, material = 'rna', pseudo = True, T = self.temperature)))
+            elif name == 'ensemble_defect' and self._ensemble_defect is None and self._structure and len(self._parent.sequence) == len(self._structure):
+                calls.append((name, self._structure, nupack.defect_call(sequences, self._structure, material = 'rna', pseudo = True, T = self.temperature)))
+        values = {}
+        todo = []
+        for (name, structure, call) in calls:
+            key = self._memo_key(name, structure)
+            if State.memo is not None and key in State.memo:
+                values[name] = State.memo[key]
+            else:
+                todo.append((name, structure, call))
+        return todo, values
+
+    def _apply_batch(self, todo, results, values, properties=None):
+        '''
+        Sets the values of the current sequence from the results of the calls returned by _batch_calls().
+
+        :param todo: List of (name, structure, call) tuples as returned by _batch_calls()
+        :param results: List of the results of these calls as returned by nupack.run_batch()
+        :param values: Dict of the values found in State.memo as returned by _batch_calls()
+        :param properties: List of property names calculated (default: all)
+        '''
+        for (name, structure, _), result in zip(todo, results):
+            if name == 'mfe':
+                (mfe_structure, mfe_energy) = result[0]
+                result = (mfe_structure, float(mfe_energy))
+            elif name == 'pf':
+                # Nupack doesn't return ensemble structure
+                result = (re.sub('[^\+]', '?', self._change_cuts(self._parent.sequence)), result)
+            values[name] = result
+            if State.memo is not None:
+                State.memo[self._memo_key(name, structure)] = result
+        if 'eos' in values:
+            self._eos = values['eos']
+        if 'mfe' in values:
+            (self._mfe_structure, self._mfe_energy) = values['mfe']
+        if 'pf' in values:
+            (self._pf_structure, self._pf_energy) = values['pf']
+        if 'ensemble_defect' in values:
+            self._ensemble_defect = values['ensemble_defect']
+        if properties is None:
+            self._evaluated = True
+
+class pKissState(State):
+    @property
+    def classtype(self):
+        return 'pKiss'
 
-        def _change_cuts(self, input):
-            if re.match(r'[&+]', input):
-                raise IOError('pKiss cannot handle concatenated RNAs')
-            return input
+    def _change_cuts(self, input):
+        if re.match(r'[&+]', input):
+            raise IOError('pKiss cannot handle concatenated RNAs')
+        return input
 
-        def _get_eos(self, sequence, structure, temperature, ligand=None):
-            #TODO pKiss cannot handle ligands
-            # pkiss eval returns multiple answers to the eval question, take lowest energy!
-            shape, energy, structure = pKiss.eval(self._change_cuts(sequence), self._change_cuts(structure), temperature = temperature)
-            return energy
+    def _get_eos(self, sequence, structure, temperature, ligand=None):
+        #TODO pKiss cannot handle ligands
+        # pkiss eval returns multiple answers to the eval question, take lowest energy!
+        shape, energy, structure = get_backend('pKiss').eval(self._change_cuts(sequence), self._change_cuts(structure), temperature = temperature)
+        return energy
 
-        def _get_fold(self, sequence, temperature, ligand=None, constraint=None):
-            return pKiss.mfe(self._change_cuts(sequence), temperature = temperature)
+    def _get_fold(self, sequence, temperature, ligand=None, constraint=None):
+        return get_backend('pKiss').mfe(self._change_cuts(sequence), temperature = temperature)
 
-        def _get_pf_fold(self, sequence, temperature, ligand=None, constraint=None):
-            #TODO return mfe as a bad approximation it cannot calculate the partition function
-            return pKiss.mfe(self._change_cuts(sequence), temperature = temperature)
+    def _get_pf_fold(self, sequence, temperature, ligand=None, constraint=None):
+        #TODO return mfe as a bad approximation it cannot calculate the partition function
+        return get_backend('pKiss').mfe(self._change_cuts(sequence), temperature = temperature)
 
-        def _get_ensemble_defect(self, sequence, structure, temperature, ligand=None):
-            raise NotImplementedError
+    def _get_ensemble_defect(self, sequence, structure, temperature, ligand=None):
+        raise NotImplementedError
 
-if HotKnots_available:
-    class hotknotsState(State):
-        @property
-        def classtype(self):
-            return 'hotknots'
+class hotknotsState(State):
+    @property
+    def classtype(self):
+        return 'hotknots'
 
-        def _change_cuts(self, input):
-            if re.match(r'[&+]', input):
-                raise IOError('Hotknots cannot handle concatenated RNAs')
-            return input
+    def _change_cuts(self, input):
+        if re.match(r'[&+]', input):
+            raise IOError('Hotknots cannot handle concatenated RNAs')
+        return input
 
-        def _get_eos(self, sequence, structure, temperature, ligand=None):
-            #TODO Hotknots cannot handle ligands and temperature
-            structure, energy = HotKnots.eval(self._change_cuts(sequence), self._change_cuts(structure))
-            return energy
+    def _get_eos(self, sequence, structure, temperature, ligand=None):
+        #TODO Hotknots cannot handle ligands and temperature
+        structure, energy = get_backend('HotKnots').eval(self._change_cuts(sequence), self._change_cuts(structure))
+        return energy
 
-        def _get_fold(self, sequence, temperature, ligand=None, constraint=None):
-            #TODO Hotknots cannot handle ligands and temperature
-            return HotKnots.mfe(self._change_cuts(sequence))
+    def _get_fold(self, sequence, temperature, ligand=None, constraint=None):
+        #TODO Hotknots cannot handle ligands and temperature
+        return get_backend('HotKnots').mfe(self._change_cuts(sequence))
 
-        def _get_pf_fold(self, sequence, temperature, ligand=None, constraint=None):
-            #TODO return mfe as a bad approximation it cannot calculate the partition function
-            return HotKnots.mfe(self._change_cuts(sequence))
+    def _get_pf_fold(self, sequence, temperature, ligand=None, constraint=None):
+        #TODO return mfe as a bad approximation it cannot calculate the partition function
+        return get_backend('HotKnots').mfe(self._change_cuts(sequence))
 
-        def _get_ensemble_defect(self, sequence, structure, temperature, ligand=None):
-            raise NotImplementedError
+    def _get_ensemble_defect(self, sequence, structure, temperature, ligand=None):
+        raise NotImplementedError
 
 def remove_cuts(input):
     '''
@@ -507,3 +769,51 @@ def create_bp_table(structure):
     if len(bpo) > 0:
         raise ValueError('Unbalanced brackets: too few closing brackets')
     return bpt
+
+def create_bpp_array(bpm):
+    '''
+    Takes a base pair probability matrix as returned by the ViennaRNA fold compound (1-based
+    tuple of tuples) and converts it into a 0-based upper triangular numpy array.
+
+    :param bpm: base pair probability matrix of the fold compound
+    :return: numpy array of shape (n, n) with the base pair probabilities P(i,j) for i<j
+    '''
+    return np.triu(np.array(bpm, dtype=float)[1:, 1:])
+
+def calculate_ensemble_defect(bpp, structure):
+    '''
+    Calculates the ensemble defect of a structure given a base pair probability array.
+    ensemble defect = 2 * (sum{i,j in structure}(1-P(i,j)) + sum{i,j not in structure}(P(i,j)))
+
+    :param bpp: upper triangular numpy array of base pair probabilities, see create_bpp_array
+    :param structure: string with dot-bracket notation of the structure
+    :return: ensemble defect of the structure
+    '''
+    return calculate_ensemble_defects(bpp, [structure])[0]
+
+def calculate_ensemble_defects(bpp, structures):
+    '''
+    Calculates the ensemble defects of many structures against the same base pair probability array at once.
+
+    :param bpp: upper triangular numpy array of base pair probabilities, see create_bpp_array
+    :param structures: list of strings with dot-bracket notations of the structures
+    :return: numpy array containing the ensemble defect of each structure
+    '''
+    bpp = np.asarray(bpp)
+    ids = []
+    opening = []
+    closing = []
+    for k, structure in enumerate(structures):
+        if len(structure) != bpp.shape[0]:
+            raise ValueError('structure and base pair probabilities must have equal length to calculate the ensemble defect!')
+        bpt = np.array(create_bp_table(structure), dtype=int)
+        i = np.flatnonzero(bpt > -1)
+        ids.append(np.full(len(i), k, dtype=int))
+        opening.append(i)
+        closing.append(bpt[i])
+    ids = np.concatenate(ids) if ids else np.array([], dtype=int)
+    paired = bpp[np.concatenate(opening), np.concatenate(closing)] if ids.size else np.array([], dtype=float)
+    # sum of P(i,j) over the pairs of each structure and the number of these pairs
+    paired_sum = np.bincount(ids, weights=paired, minlength=len(structures))
+    paired_count = np.bincount(ids, minlength=len(structures))
+    return 2 * (bpp.sum() - 2 * paired_sum + paired_count)
@@ -10,14 +10,24 @@ __maintainer__ = "Stefan Hammer"
 __email__ = "s.hammer@univie.ac.at"
 
 import sys
+import time
+import copy
+import itertools
 import random
+import multiprocessing
 import collections
 import numpy as np
 import math
+import weakref
 
 import RNAblueprint as rbp
 from Design import *
 from Structure import RNAStructure
+from Memo import EvaluationMemo
+from Budget import Budget
+from Checkpoint import Checkpoint
+from Motifs import MotifFilter
+from MoveSelector import MoveSelector
 from RNARedPrintSampler import RPSampler
 
 '''
@@ -162,6 +172,8 @@ def calculate_objective_1(design):
     :type design: Object of type Design
     :return: score calculated by the objective function
     '''
+    # backends able to batch their calls calculate both values of all states at once
+    design.evaluate(['eos', 'pf_energy'])
     return (sum(design.eos.values()) - sum(design.pf_energy.values())) / design.number_of_structures
 
 def calculate_objective_2(design):
@@ -203,27 +215,222 @@ def calculate_objective_2_squared(design):
         return objective_difference_part * 2 / (design.number_of_structures * (design.number_of_structures-1))
 
 
-def sample_sequence(dg, design, mode, sample_steps=1, avoid_motifs=None, white_positions=None):
+def get_energy_matrices(designs):
+    '''
+    Collects the energies of many designs with the same states into matrices for the batch objective functions.
+
+    :param designs: List of Design objects with the same state keys
+    :return: Numpy matrix (number of designs x number of states) of the eos values, states in sorted key order
+    :return: Numpy matrix (number of designs x number of states) of the partition function energies
+    '''
+    keys = sorted(designs[0].state) if designs else []
+    for d in designs:
+        d.evaluate(['eos', 'pf_energy'])
+    eos = np.array([[d.eos[k] for k in keys] for d in designs], dtype=float).reshape(len(designs), len(keys))
+    pf = np.array([[d.pf_energy[k] for k in keys] for d in designs], dtype=float).reshape(len(designs), len(keys))
+    return eos, pf
+
+def calculate_objective_batch(eos, pf, weight=0.5):
+    '''
+    Calculates calculate_objective() for many designs at once.
+
+    :param eos: Matrix (number of designs x number of states) of the eos values
+    :param pf: Matrix (number of designs x number of states) of the partition function energies
+    :param weight: To wheight the influence of the eos diffences
+    :return: Numpy array with the score of every design
+    '''
+    return calculate_objective_1_batch(eos, pf) + weight * calculate_objective_2_batch(eos)
+
+def calculate_objective_1_batch(eos, pf):
+    '''
+    Calculates calculate_objective_1() for many designs at once.
+
+    :param eos: Matrix (number of designs x number of states) of the eos values
+    :param pf: Matrix (number of designs x number of states) of the partition function energies
+    :return: Numpy array with the score of every design
+    '''
+    eos = np.atleast_2d(np.asarray(eos, dtype=float))
+    pf = np.atleast_2d(np.asarray(pf, dtype=float))
+    return (eos - pf).sum(axis=1) / eos.shape[1]
+
+def calculate_objective_2_batch(eos):
+    '''
+    Calculates calculate_objective_2() for many designs at once. The sum of all pairwise absolute
+    differences is taken from the sorted eos values, where the k-th smallest of n values is added k
+    times and subtracted n-1-k times.
+
+    :param eos: Matrix (number of designs x number of states) of the eos values
+    :return: Numpy array with the score of every design
+    '''
+    eos = np.sort(np.atleast_2d(np.asarray(eos, dtype=float)), axis=1)
+    n = eos.shape[1]
+    objective_difference_part = eos.dot(2 * np.arange(n) - n + 1)
+    if n == 1:
+        return objective_difference_part
+    return objective_difference_part * 2 / (n * (n-1))
+
+def calculate_objective_2_squared_batch(eos):
+    '''
+    Calculates calculate_objective_2_squared() for many designs at once. The sum of all pairwise squared
+    differences of n values is n times the sum of squares minus the square of the sum.
+
+    :param eos: Matrix (number of designs x number of states) of the eos values
+    :return: Numpy array with the score of every design
+    '''
+    eos = np.atleast_2d(np.asarray(eos, dtype=float))
+    n = eos.shape[1]
+    objective_difference_part = n * (eos ** 2).sum(axis=1) - eos.sum(axis=1) ** 2
+    if n == 1:
+        return objective_difference_part
+    return objective_difference_part * 2 / (n * (n-1))
+
+def sample_admissibility(sequences, energies, target_energies, target_GC, target_energy_eps=0.1, target_GC_eps=0.1, sigma=2.0):
+    '''
+    Checks a Boltzmann sample, e.g. of RPSampler, for eps-admissibility and calculates the updates of the
+    sampling weights towards the targets. A sequence is admissible if its GC content and all its structure energies
+    are within a relative distance of eps to the targets. The GC content is counted on the raw bytes of all
+    sequences at once, with a pseudo count of sigma per nucleotide (laplace).
+
+    :param sequences: Numpy array or list of RNA sequence strings
+    :param energies: Matrix (number of sequences x number of structures) of the structure energies
+    :param target_energies: List of target energies, one per structure, or dict with the structure indices 0, 1, ... as keys
+    :param target_GC: Target GC content
+    :param target_energy_eps: Allowed relative deviation from the target energies (default: 0.1)
+    :param target_GC_eps: Allowed relative deviation from the target GC content (default: 0.1)
+    :param sigma: Pseudo count added to the GC content (default: 2.0)
+    :return: Tuple of a boolean numpy array marking the admissible sequences, a numpy array of factors for the structure weights and the factor for the GC weight
+    '''
+    sequences = np.asarray(sequences, dtype=np.string_)
+    energies = np.atleast_2d(np.asarray(energies, dtype=float))
+    if isinstance(target_energies, collections.Mapping):
+        target_energies = [target_energies[i] for i in range(0, len(target_energies))]
+    target_energies = np.asarray(target_energies, dtype=float)
+    # one row of bytes per sequence, shorter sequences are padded with zero bytes
+    codes = np.frombuffer(sequences.tobytes(), dtype=np.uint8).reshape(len(sequences), sequences.itemsize)
+    gc = ((codes == ord('G')) | (codes == ord('C'))).sum(axis=1)
+    GC = (gc + sigma) / ((codes != 0).sum(axis=1) + 2*sigma)
+    admissible = np.abs(GC/target_GC - 1) <= target_GC_eps
+    admissible &= np.all(np.abs(energies/target_energies - 1) <= target_energy_eps, axis=1)
+    # exp version of the weight update, 1.1 to the power of the distance of the energy mean to the target
+    weight_factors = 1.1 ** (energies.mean(axis=0) - target_energies)
+    return admissible, weight_factors, target_GC / GC.mean()
+
+def calculate_objective_lower_bound(design, threshold=None, weight=0.5, difference_objective=calculate_objective_2):
+    '''
+    Calculates a lower bound of calculate_objective(design, weight) using as few partition functions as possible.
+    As the ensemble energy is never higher than the energy of any structure, every state adds eos - gibbs >= 0
+    to the first part of the objective. Starting from the cheap eos difference part, the partition functions
+    are calculated state by state until the bound exceeds the threshold. Without threshold or if the threshold
+    is never exceeded, this is the exact value of the objective function.
+    States with a hard constraint or a cofold/multifold state are always calculated first, as their part can be
+    negative: the constrained ensemble may have a higher energy than the structure, and the ViennaRNA dimer
+    ensemble only contains true hybrid structures, so a structure without intermolecular pairs is not part of it.
+
+    :param design: Design object containing the sequence and structures
+    :param threshold: Stop calculating partition functions as soon as the bound is higher than this score (default: None)
+    :param weight: To wheight the influence of the eos diffences
+    :param difference_objective: Function calculating the eos difference part, e.g. calculate_objective_2_squared (default: calculate_objective_2)
+    :return: Lower bound of the score calculated by the objective function
+    '''
+    bound = weight * difference_objective(design)
+    eos = design.eos
+    exact = [k for k in sorted(design.state) if design.state[k].constraint or design.state[k].multifold]
+    for k in exact:
+        bound += (eos[k] - design.state[k].pf_energy) / design.number_of_structures
+    for k in sorted(design.state):
+        if k in exact:
+            continue
+        if threshold is not None and bound > threshold:
+            break
+        bound += (eos[k] - design.state[k].pf_energy) / design.number_of_structures
+    return bound
+
+class BoundedObjective(object):
+    '''
+    BoundedObjective wraps an objective function together with a cheap lower bound of it. If the optimizer
+    passes the highest score it would still accept, a candidate is rejected as soon as the lower bound
+    exceeds this threshold, without calculating the full objective function. The number of candidates
+    rejected this way is counted in saved, together with the ones rejected by copies of this object in the
+    worker processes of run_designs(), parallel_tempering_optimization() and genetic_optimization().
+
+    :param objective_function: Function which takes a design object and returns a score for evaluation (default: calculate_objective)
+    :param lower_bound: Function which takes a design object and a threshold and returns a lower bound of the score, needed for every objective function other than calculate_objective (default: calculate_objective_lower_bound)
+    '''
+
+    def __init__(self, objective_function=calculate_objective, lower_bound=None):
+        if lower_bound is None:
+            if objective_function is not calculate_objective:
+                raise ValueError('The lower bound of the objective function must be given, calculate_objective_lower_bound is valid for calculate_objective only')
+            lower_bound = calculate_objective_lower_bound
+        self.objective_function = objective_function
+        self.lower_bound = lower_bound
+        self.saved = 0
+
+    def __call__(self, design, threshold=None):
+        '''
+        :param design: Design object containing the sequence and structures
+        :param threshold: Highest score the optimizer would still accept (default: None, always calculate the full score)
+        :return: Score calculated by the objective function, or a lower bound higher than the threshold
+        '''
+        if threshold is not None:
+            bound = self.lower_bound(design, threshold)
+            if bound > threshold:
+                self.saved += 1
+                return bound
+        return self.objective_function(design)
+
+def _objective(objective_function, design, threshold):
+    '''
+    Calls the objective function, with the threshold for early rejection if it is a BoundedObjective.
+    '''
+    if isinstance(objective_function, BoundedObjective):
+        return objective_function(design, threshold)
+    return objective_function(design)
+
+def _saved(objective_function):
+    '''
+    :return: Number of candidates rejected early by the objective function so far, 0 if it is no BoundedObjective
+    '''
+    if isinstance(objective_function, BoundedObjective):
+        return objective_function.saved
+    return 0
+
+def _count_saved(objective_function, saved):
+    '''
+    Adds the candidates rejected early by a copy of the objective function in another process.
+    '''
+    if isinstance(objective_function, BoundedObjective):
+        objective_function.saved += saved
+
+def sample_sequence(dg, design, mode, sample_steps=1, avoid_motifs=None, white_positions=None, motif_filter=None, move_selector=None):
     '''
     This function samples a sequence with the given mode from the dependency graph object
     and writes it into the design object
 
     :param dg: RNAdesign dependency graph object
     :param design: design object
-    :param mode: mode how to sample, this is a string
+    :param mode: mode how to sample, this is a string: sample, sample_clocal, sample_plocal, sample_unpaired, sample_pairs, random or adaptive
     :param sample_steps: count how many times to do the sample operation
     :param avoid_motifs: list of regex pattern specifiying sequence motifs to avoid
     :param white_positions: list of [start, end] positions in the sequence where the avoid_motifs pattern should be ignored
+    :param motif_filter: precompiled MotifFilter object, used instead of avoid_motifs and white_positions
+    :param move_selector: MoveSelector object choosing the mode if mode is adaptive
     :return: mut_nos is the solution space we drew from
     :return: sample_count is how many times we sampled a solution from the dependency graph object (important for revert later)
     '''
-    if avoid_motifs is None:
-        avoid_motifs=[]
-    if white_positions is None:
-        white_positions=[]
+    if motif_filter is None:
+        motif_filter = MotifFilter(avoid_motifs, white_positions)
     # remember the solution space we drew from
     mut_nos = 1
     dg.set_history_size(sample_steps + 100)
+    # local moves only need a motif check around the changed positions
+    previous = dg.get_sequence()
+    # if adaptive choice is requested let the move selector pick the most promising mode once,
+    # samples rejected because of motifs are retried with this mode, so the move selector counts one move per call
+    if mode == "adaptive":
+        if move_selector is None:
+            raise ValueError("The adaptive mode needs a MoveSelector object\n")
+        adaptive_mode = move_selector.choose()
     while True:
         # count how many samples we did to be able to revert this later
         sample_count = 0
@@ -234,6 +441,8 @@ def sample_sequence(dg, design, mode, sample_steps=1, avoid_motifs=None, white_p
         if mode == "random":
             modes = ['sample','sample_clocal','sample_plocal']
             chosen_mode = random.choice(modes)
+        elif mode == "adaptive":
+            chosen_mode = adaptive_mode
 
         if sample_steps == 0:
             sample_steps = random.randrange(1, dg.number_of_connected_components())
@@ -263,24 +472,8 @@ def sample_sequence(dg, design, mode, sample_steps=1, avoid_motifs=None, white_p
         else:
             raise ValueError("Wrong mode argument: " + mode + "\n")
 
-        # check if motifs to avoid are present, if so sample a new sequence, else return
-        motiv_present = False
-        seq = dg.get_sequence()
-        # search for all motivs and ignore all hits inside any white_position
-        for m in avoid_motifs:
-            for f in re.finditer(re.compile(r'(?=('+m+'))'), seq, flags=0):
-                motiv_present = True
-                for white in white_positions:
-                    if ((white[0] <= f.start() <= white[1]) and (white[0] <= f.start()+len(f.group(1))-1 <= white[1])):
-                        motiv_present = False
-                        break
-                if motiv_present:
-                    break
-            if motiv_present:
-                break
-
-        # if the motivs are not present, exit while and return
-        if not motiv_present:
+        # check if motifs to avoid are present outside the white positions, if so sample a new sequence, else return
+        if not motif_filter.reject(dg.get_sequence(), previous if chosen_mode != 'sample' else None):
             break
         else:
             # revert to previous sequence
@@ -290,170 +483,258 @@ def sample_sequence(dg, design, mode, sample_steps=1, avoid_motifs=None, white_p
     design.sequence = dg.get_sequence()
     return (mut_nos, sample_count)
 
-def adaptive_walk_optimization(dg, design, objective_function=calculate_objective, stop=1000, mode='sample', avoid_motifs=None, white_positions=None, progress=False):
+def _revert_sequence(dg, design, sample_count):
+    '''
+    Reverts the dependency graph object by the given amount of samples and restores the design object
+    to the snapshot taken before sampling, so the values calculated for this sequence are not calculated again.
+
+    :param dg: RNAdesign dependency graph object
+    :param design: design object with a snapshot taken by push_snapshot()
+    :param sample_count: how many times we sampled a solution from the dependency graph object
+    '''
+    dg.revert_sequence(sample_count)
+    sequence = dg.get_sequence()
+    if design.pop_snapshot() != sequence:
+        design.sequence = sequence
+
+def adaptive_walk_optimization(dg, design, objective_function=calculate_objective, stop=1000, mode='sample', avoid_motifs=None, white_positions=None, move_selector=None, budget=None, checkpoint=None, progress=False):
     '''
     Takes a Design object and does a adaptive walk optimization of this sequence.
 
     :param dg: RNAdesign DependencyGraph object
     :param design: Design object containing the sequence and structures
-    :param objective_functions: array of functions which takes a design object and returns a score for evaluation
+    :param objective_functions: array of functions which takes a design object and returns a score for evaluation, a BoundedObjective rejects candidates early
     :param stop: Number of unsuccessful new sequences before stoping the optimization
-    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal
+    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal, random, adaptive
     :param avoid_motifs: list of regex pattern specifiying sequence motifs to avoid
     :param white_positions: list of [start, end] positions in the sequence where the avoid_motifs pattern should be ignored
+    :param move_selector: MoveSelector object choosing the sampling mode in adaptive mode, e.g. to read its statistics afterwards (default: new MoveSelector)
+    :param budget: Budget object stopping the optimization as soon as one of its limits is reached (default: None)
+    :param checkpoint: Checkpoint object to save the run to regularly and to resume it from (default: None)
     :param progress: Whether or not to print the progress to the console
     :return: Optimization score reached for the final sequence
     :return: Number of samples neccessary to reach this result
     '''
-    if avoid_motifs is None:
-        avoid_motifs=[]
-    if white_positions is None:
-        white_positions=[]
+    # compile the motifs to avoid only once for the whole run
+    motif_filter = MotifFilter(avoid_motifs, white_positions)
+    # in adaptive mode choose the sampling mode of every move by the success of the modes so far
+    if mode != 'adaptive':
+        move_selector = None
+    elif move_selector is None:
+        move_selector = MoveSelector()
     # if the design has no sequence yet, sample one from scratch
     if not design.sequence:
-        sample_sequence(dg, design, 'sample', avoid_motifs=avoid_motifs, white_positions=white_positions)
+        sample_sequence(dg, design, 'sample', motif_filter=motif_filter)
     else:
         dg.set_sequence(design.sequence)
 
-    score = objective_function(design)
     # count for stop condition
     count = 0
     # remember how may mutations were done
     number_of_samples = 0
+    # continue a previous run, only a new run needs the score of the start sequence
+    resumed = _resume(checkpoint, 'adaptive_walk_optimization', dg, design)
+    if resumed is not None:
+        (score, count, number_of_samples) = (resumed['score'], resumed['count'], resumed['number_of_samples'])
+        if resumed['finished']:
+            return score, number_of_samples
+    else:
+        score = objective_function(design)
 
     # main optimization loop
     while stop:
+        if budget is not None and budget.exhausted(score):
+            break
         # count up the mutations
         number_of_samples += 1
         # sample a new sequence
-        (mut_nos, sample_count) = sample_sequence(dg, design, mode, avoid_motifs=avoid_motifs, white_positions=white_positions)
+        design.push_snapshot()
+        (mut_nos, sample_count) = sample_sequence(dg, design, mode, motif_filter=motif_filter, move_selector=move_selector)
 
         # write progress
         if progress:
             sys.stderr.write("\rMutate: {0:7.0f}/{1:5.0f} | Score: {2:5.2f} | NOS: {3:.5e} | Mode: {4:s}".format(number_of_samples, count, score, mut_nos, mode) + " " * 20)
             sys.stderr.flush()
 
-        this_score = objective_function(design)
+        backend_calls = State.backend_calls
+        # candidates not better than the current score can be rejected early
+        this_score = _objective(objective_function, design, score)
+        if move_selector is not None:
+            move_selector.reward(score - this_score, State.backend_calls - backend_calls)
         # evaluate
         if (this_score < score):
             score = this_score
             count = 0
+            design.pop_snapshot(restore=False)
         else:
-            dg.revert_sequence(sample_count)
-            design.sequence = dg.get_sequence()
+            _revert_sequence(dg, design, sample_count)
             count += 1
             if count > stop:
                 break
+        if checkpoint is not None:
+            checkpoint.update('adaptive_walk_optimization', sequence=design.sequence, score=score, count=count, number_of_samples=number_of_samples, finished=False)
 
+    if checkpoint is not None:
+        checkpoint.save('adaptive_walk_optimization', sequence=design.sequence, score=score, count=count, number_of_samples=number_of_samples, finished=(budget is None or budget.reason is None))
     # clear the console
     if (progress):
         sys.stderr.write("\r" + " " * 60 + "\r")
+        if move_selector is not None:
+            sys.stderr.write(move_selector.write_out() + "\n")
+        if isinstance(objective_function, BoundedObjective):
+            sys.stderr.write("# Evaluations saved by early rejection: {0:d}\n".format(objective_function.saved))
         sys.stderr.flush()
     # finally return the result
     return score, number_of_samples
 
-def adaptive_walk_fixed(dg, design, objective_function=calculate_objective, number=1000, mode='sample_clocal', avoid_motifs=None, white_positions=None, progress=False):
+def adaptive_walk_fixed(dg, design, objective_function=calculate_objective, number=1000, mode='sample_clocal', avoid_motifs=None, white_positions=None, move_selector=None, budget=None, checkpoint=None, progress=False):
     '''
     Takes a Design object and does a adaptive walk optimization with a fixed amount of move steps.
 
     :param dg: RNAdesign DependencyGraph object
     :param design: Design object containing the sequence and structures
-    :param objective_functions: array of functions which takes a design object and returns a score for evaluation
+    :param objective_functions: array of functions which takes a design object and returns a score for evaluation, a BoundedObjective rejects candidates early
     :param number: Number of sampling new sequences before stoping the optimization
-    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal
+    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal, random, adaptive
     :param avoid_motifs: list of regex pattern specifiying sequence motifs to avoid
     :param white_positions: list of [start, end] positions in the sequence where the avoid_motifs pattern should be ignored
+    :param move_selector: MoveSelector object choosing the sampling mode in adaptive mode, e.g. to read its statistics afterwards (default: new MoveSelector)
+    :param budget: Budget object stopping the optimization as soon as one of its limits is reached (default: None)
+    :param checkpoint: Checkpoint object to save the run to regularly and to resume it from (default: None)
     :param progress: Whether or not to print the progress to the console
     :return: Optimization score reached for the final sequence
     :return: Number of samples neccessary to reach this result
     '''
-    if avoid_motifs is None:
-        avoid_motifs=[]
-    if white_positions is None:
-        white_positions=[]
+    # compile the motifs to avoid only once for the whole run
+    motif_filter = MotifFilter(avoid_motifs, white_positions)
+    # in adaptive mode choose the sampling mode of every move by the success of the modes so far
+    if mode != 'adaptive':
+        move_selector = None
+    elif move_selector is None:
+        move_selector = MoveSelector()
     # if the design has no sequence yet, sample one from scratch
     if not design.sequence:
-        sample_sequence(dg, design, 'sample', avoid_motifs=avoid_motifs, white_positions=white_positions)
+        sample_sequence(dg, design, 'sample', motif_filter=motif_filter)
     else:
         dg.set_sequence(design.sequence)
 
-    score = objective_function(design)
     # remember how may mutations were done
     number_of_samples = 0
+    # continue a previous run, only a new run needs the score of the start sequence
+    resumed = _resume(checkpoint, 'adaptive_walk_fixed', dg, design)
+    if resumed is not None:
+        (score, number_of_samples) = (resumed['score'], resumed['number_of_samples'])
+    else:
+        score = objective_function(design)
 
     # main optimization loop
-    for _ in range(0, number):
+    for _ in range(number_of_samples, number):
+        if budget is not None and budget.exhausted(score):
+            break
         # count up the mutations
         number_of_samples += 1
         # sample a new sequence
-        (mut_nos, sample_count) = sample_sequence(dg, design, mode, avoid_motifs=avoid_motifs, white_positions=white_positions)
+        design.push_snapshot()
+        (mut_nos, sample_count) = sample_sequence(dg, design, mode, motif_filter=motif_filter, move_selector=move_selector)
 
         # write progress
         if progress:
             sys.stderr.write("\rMutate: {0:7.0f} | Score: {1:5.2f} | NOS: {2:.5e} | Mode: {3:s}".format(number_of_samples, score, mut_nos, mode) + " " * 20)
             sys.stderr.flush()
 
-        this_score = objective_function(design)
+        backend_calls = State.backend_calls
+        # candidates not better than the current score can be rejected early
+        this_score = _objective(objective_function, design, score)
+        if move_selector is not None:
+            move_selector.reward(score - this_score, State.backend_calls - backend_calls)
         # evaluate
         if (this_score < score):
             score = this_score
+            design.pop_snapshot(restore=False)
         else:
-            dg.revert_sequence(sample_count)
-            design.sequence = dg.get_sequence()
+            _revert_sequence(dg, design, sample_count)
+        if checkpoint is not None:
+            checkpoint.update('adaptive_walk_fixed', sequence=design.sequence, score=score, number_of_samples=number_of_samples)
 
+    if checkpoint is not None:
+        checkpoint.save('adaptive_walk_fixed', sequence=design.sequence, score=score, number_of_samples=number_of_samples)
     # clear the console
     if (progress):
         sys.stderr.write("\r" + " " * 60 + "\r")
+        if move_selector is not None:
+            sys.stderr.write(move_selector.write_out() + "\n")
+        if isinstance(objective_function, BoundedObjective):
+            sys.stderr.write("# Evaluations saved by early rejection: {0:d}\n".format(objective_function.saved))
         sys.stderr.flush()
     # finally return the result
     return score, number_of_samples
 
-def simulated_annealing_optimization(dg, design, objective_function=calculate_objective, temperature_gradient=None, cooling_step=50, mode='sample', avoid_motifs=None, white_positions=None, progress=False):
+def simulated_annealing_optimization(dg, design, objective_function=calculate_objective, temperature_gradient=None, cooling_step=50, mode='sample', avoid_motifs=None, white_positions=None, move_selector=None, budget=None, checkpoint=None, progress=False):
     '''
     Takes a Design object and does a simulated annealing optimization of this sequence.
 
     :param dg: RNAdesign DependencyGraph object
     :param design: Design object containing the sequence and structures
-    :param objective_functions: array of functions which takes a design object and returns a score for evaluation
+    :param objective_functions: array of functions which takes a design object and returns a score for evaluation, a BoundedObjective rejects candidates early
     :param temperature_gradient: Iterable containing the temperatures in descend order
     :param cooling_steps: Use the current temperature that many times before cooling down
-    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal
+    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal, random, adaptive
     :param avoid_motifs: list of regex pattern specifiying sequence motifs to avoid
     :param white_positions: list of [start, end] positions in the sequence where the avoid_motifs pattern should be ignored
+    :param move_selector: MoveSelector object choosing the sampling mode in adaptive mode, e.g. to read its statistics afterwards (default: new MoveSelector)
+    :param budget: Budget object stopping the optimization as soon as one of its limits is reached (default: None)
+    :param checkpoint: Checkpoint object to save the run to regularly and to resume it from (default: None)
     :param progress: Whether or not to print the progress to the console
     :return: Optimization score reached for the final sequence
     :return: Number of samples neccessary to reach this result
     '''
-    if avoid_motifs is None:
-        avoid_motifs=[]
-    if white_positions is None:
-        white_positions=[]
+    # compile the motifs to avoid only once for the whole run
+    motif_filter = MotifFilter(avoid_motifs, white_positions)
+    # in adaptive mode choose the sampling mode of every move by the success of the modes so far
+    if mode != 'adaptive':
+        move_selector = None
+    elif move_selector is None:
+        move_selector = MoveSelector()
     if temperature_gradient is None:
         temperature_gradient=np.concatenate([np.arange(1,0,-0.0002),[1e-15]*100])
     # generate iterator (can call next() on it)
     temp_iter = iter(temperature_gradient)
     temperature = temp_iter.next()
+    # remember how many temperatures we took from the iterator
+    temperature_index = 1
 
     # if the design has no sequence yet, sample one from scratch
     if not design.sequence:
-        sample_sequence(dg, design, 'sample', avoid_motifs=avoid_motifs, white_positions=white_positions)
+        sample_sequence(dg, design, 'sample', motif_filter=motif_filter)
     else:
         dg.set_sequence(design.sequence)
 
-    score = objective_function(design)
     # remember how may mutations were done
     number_of_samples = 0
     # remember how often we used the temperature already
     number_of_same_temp = 0
+    # continue a previous run, only a new run needs the score of the start sequence
+    resumed = _resume(checkpoint, 'simulated_annealing_optimization', dg, design)
+    if resumed is not None:
+        (score, number_of_samples, number_of_same_temp) = (resumed['score'], resumed['number_of_samples'], resumed['number_of_same_temp'])
+        (temperature, temperature_index) = (resumed['temperature'], resumed['temperature_index'])
+        temp_iter = itertools.islice(iter(temperature_gradient), temperature_index, None)
+        if resumed['finished']:
+            return score, number_of_samples
+    else:
+        score = objective_function(design)
 
     # main optimization loop
     while True:
+        if budget is not None and budget.exhausted(score):
+            break
         # check if we have to cool down
         number_of_same_temp += 1
         if number_of_same_temp > cooling_step:
             number_of_same_temp = 0
             try:
                 temperature = temp_iter.next()
+                temperature_index += 1
             except StopIteration:
                 # end of temperature scale reached... stop optimization
                 break
@@ -461,16 +742,22 @@ def simulated_annealing_optimization(dg, design, objective_function=calculate_ob
         # count up the mutations
         number_of_samples += 1
         # sample a new sequence
-        (mut_nos, sample_count) = sample_sequence(dg, design, mode, avoid_motifs=avoid_motifs, white_positions=white_positions)
+        design.push_snapshot()
+        (mut_nos, sample_count) = sample_sequence(dg, design, mode, motif_filter=motif_filter, move_selector=move_selector)
 
         # write progress
         if progress:
             sys.stderr.write("\rMutate: {0:7.0f}/{1:5.0f} | Score: {2:5.2f} | NOS: {3:.5e} | Mode: {4:s} | Temp: {5:5.8f}".format(number_of_samples, number_of_same_temp, score, mut_nos, mode, temperature) + " " * 20)
             sys.stderr.flush()
 
-        this_score = objective_function(design)
-        # evaluate probability
+        # candidates are accepted if their score is not higher than the threshold given by the random number
         rand = random.uniform(0, 1)
+        threshold = score - temperature * math.log(rand) if rand > 0 else None
+        backend_calls = State.backend_calls
+        this_score = _objective(objective_function, design, threshold)
+        if move_selector is not None:
+            move_selector.reward(score - this_score, State.backend_calls - backend_calls)
+        # evaluate probability
         if (this_score-score) < 0:
             prob = 1
         else:
@@ -480,61 +767,263 @@ def simulated_annealing_optimization(dg, design, objective_function=calculate_ob
             score = this_score
             # go to next temperature step
             number_of_same_temp = cooling_step+1
+            design.pop_snapshot(restore=False)
         else:
-            dg.revert_sequence(sample_count)
-            design.sequence = dg.get_sequence()
-
+            _revert_sequence(dg, design, sample_count)
+        if checkpoint is not None:
+            checkpoint.update('simulated_annealing_optimization', sequence=design.sequence, score=score, number_of_samples=number_of_samples,
+                number_of_same_temp=number_of_same_temp, temperature=temperature, temperature_index=temperature_index, finished=False)
+
+    if checkpoint is not None:
+        checkpoint.save('simulated_annealing_optimization', sequence=design.sequence, score=score, number_of_samples=number_of_samples,
+            number_of_same_temp=number_of_same_temp, temperature=temperature, temperature_index=temperature_index, finished=(budget is None or budget.reason is None))
     # clear the console
     if (progress):
         sys.stderr.write("\r" + " " * 60 + "\r")
+        if move_selector is not None:
+            sys.stderr.write(move_selector.write_out() + "\n")
+        if isinstance(objective_function, BoundedObjective):
+            sys.stderr.write("# Evaluations saved by early rejection: {0:d}\n".format(objective_function.saved))
         sys.stderr.flush()
     # finally return the result
     return score, number_of_samples
 
-def constraint_generation_optimization(dg, design, objective_function=calculate_objective, stop=1000, mode='sample', num_neg_constraints=100, max_eos_diff=0, avoid_motifs=None, white_positions=None, progress=False):
+def parallel_tempering_optimization(dg_factory, design_factory, temperatures, swap_interval=50, rounds=100, objective_function=calculate_objective, mode='sample', avoid_motifs=None, white_positions=None, seed=None, budget=None, progress=False):
+    '''
+    Does a parallel tempering (replica exchange) optimization. Every temperature gets a replica running
+    in its own process with its own dependency graph object, which does Metropolis moves at its current
+    temperature. After every swap_interval moves, replicas at neighbouring temperatures exchange their
+    temperatures with the Metropolis probability min(1, exp((1/T_i - 1/T_j) * (score_i - score_j))).
+
+    :param dg_factory: Picklable callable taking the seed of a replica and returning a new RNAdesign DependencyGraph object, e.g. functools.partial(rbp.DependencyGraphMT, structures, constraint)
+    :param design_factory: Picklable callable returning a new Design object containing the structures and the start sequence
+    :param temperatures: List of temperatures, one replica is started for each of them
+    :param swap_interval: Number of moves every replica does between two swap attempts
+    :param rounds: Number of swap attempts before stopping the optimization
+    :param objective_function: function which takes a design object and returns a score for evaluation, a BoundedObjective rejects candidates early
+    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal, random, adaptive
+    :param avoid_motifs: list of regex pattern specifiying sequence motifs to avoid
+    :param white_positions: list of [start, end] positions in the sequence where the avoid_motifs pattern should be ignored
+    :param seed: Seed of the swap decisions and the first replica, following replicas get seed+1, seed+2, ... (default: random seeds)
+    :param budget: Budget object stopping the optimization as soon as one of its limits is reached (default: None)
+    :param progress: Whether or not to print the progress to the console
+    :return: Optimization score reached for the best sequence
+    :return: Number of samples of all replicas neccessary to reach this result
+    :return: Dict of statistics: 'acceptance' - ratio of accepted moves per replica, 'swap_acceptance' - ratio of
+        accepted swaps per pair of neighbouring temperatures, 'sequence' - best sequence, 'design' - new design object holding the best sequence
+    '''
+    temperatures = sorted(temperatures)
+    if not temperatures or temperatures[0] <= 0:
+        raise ValueError('Parallel tempering needs at least one temperature and all of them must be positive')
+    if seed is None:
+        seed = random.SystemRandom().randint(0, 2**31 - 1 - len(temperatures))
+    # swap decisions do not depend on the random state of the caller, so seeded runs are reproducible
+    rng = random.Random(seed)
+
+    replicas = []
+    try:
+        for r in range(0, len(temperatures)):
+            (conn, child_conn) = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_tempering_replica, args=(child_conn, dg_factory, design_factory, objective_function, mode, avoid_motifs, white_positions, seed + r))
+            process.daemon = True
+            process.start()
+            replicas.append((process, conn))
+
+        # replica r currently runs at temperatures[position[r]]
+        position = range(0, len(temperatures))
+        start = [_tempering_receive(conn) for (_, conn) in replicas]
+        scores = [score for (score, sequence) in start]
+        (best_score, best_sequence) = min(start)
+        moves = [0] * len(replicas)
+        accepted = [0] * len(replicas)
+        swaps = [0] * (len(temperatures) - 1)
+        swaps_accepted = [0] * (len(temperatures) - 1)
+
+        for n in range(0, rounds):
+            if budget is not None and budget.exhausted(best_score):
+                break
+            for r, (_, conn) in enumerate(replicas):
+                conn.send((temperatures[position[r]], swap_interval))
+            for r, (_, conn) in enumerate(replicas):
+                (scores[r], replica_accepted, replica_best_score, replica_best_sequence, replica_calls, replica_saved) = _tempering_receive(conn)
+                if budget is not None:
+                    budget.count(replica_calls)
+                _count_saved(objective_function, replica_saved)
+                moves[r] += swap_interval
+                accepted[r] += replica_accepted
+                if replica_best_score < best_score:
+                    best_score = replica_best_score
+                    best_sequence = replica_best_sequence
+
+            # try to swap neighbouring temperatures, alternating between even and odd pairs
+            replica_at = dict((position[r], r) for r in range(0, len(replicas)))
+            for t in range(n % 2, len(temperatures) - 1, 2):
+                (i, j) = (replica_at[t], replica_at[t+1])
+                swaps[t] += 1
+                delta = (1.0/temperatures[t] - 1.0/temperatures[t+1]) * (scores[i] - scores[j])
+                if delta >= 0 or rng.uniform(0, 1) <= math.exp(delta):
+                    swaps_accepted[t] += 1
+                    (position[i], position[j]) = (position[j], position[i])
+
+            # write progress
+            if progress:
+                sys.stderr.write("\rRound: {0:5d}/{1:5d} | Best score: {2:5.2f} | Scores: {3:s}".format(n+1, rounds, best_score, " ".join(["{0:5.2f}".format(scores[replica_at[t]]) for t in range(0, len(temperatures))])) + " " * 20)
+                sys.stderr.flush()
+
+        for (_, conn) in replicas:
+            conn.send(None)
+        for (process, _) in replicas:
+            process.join()
+    finally:
+        for (process, _) in replicas:
+            if process.is_alive():
+                process.terminate()
+
+    # clear the console
+    if (progress):
+        sys.stderr.write("\r" + " " * 60 + "\r")
+        sys.stderr.flush()
+
+    design = design_factory()
+    design.sequence = best_sequence
+    statistics = {
+        'acceptance': [float(a) / m if m else 0.0 for a, m in zip(accepted, moves)],
+        'swap_acceptance': [float(a) / s if s else 0.0 for a, s in zip(swaps_accepted, swaps)],
+        'sequence': design.sequence,
+        'design': design
+    }
+    return best_score, sum(moves), statistics
+
+def _tempering_receive(conn):
+    '''
+    Receives a message of a replica process and raises the exceptions raised there.
+    '''
+    message = conn.recv()
+    if isinstance(message, Exception):
+        raise message
+    return message
+
+def _tempering_replica(conn, dg_factory, design_factory, objective_function, mode, avoid_motifs, white_positions, seed):
+    '''
+    Runs one replica of parallel_tempering_optimization() in its own process. It sends its start score and
+    then waits for (temperature, steps) messages, does that many Metropolis moves and answers with its current
+    score, the number of accepted moves, its best score and sequence so far and the number of backend calls
+    and early rejections since the last answer. None stops the replica.
+    '''
+    try:
+        _init_worker()
+        random.seed(seed)
+        np.random.seed(seed)
+        backend_calls = State.backend_calls
+        saved = _saved(objective_function)
+        dg = dg_factory(seed)
+        design = design_factory()
+        motif_filter = MotifFilter(avoid_motifs, white_positions)
+        move_selector = MoveSelector() if mode == 'adaptive' else None
+
+        # if the design has no sequence yet, sample one from scratch
+        if not design.sequence:
+            sample_sequence(dg, design, 'sample', motif_filter=motif_filter)
+        else:
+            dg.set_sequence(design.sequence)
+        score = objective_function(design)
+        (best_score, best_sequence) = (score, design.sequence)
+        conn.send((score, design.sequence))
+
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            (temperature, steps) = message
+            accepted = 0
+            for _ in range(0, steps):
+                design.push_snapshot()
+                (mut_nos, sample_count) = sample_sequence(dg, design, mode, motif_filter=motif_filter, move_selector=move_selector)
+                # candidates are accepted if their score is not higher than the threshold given by the random number
+                rand = random.uniform(0, 1)
+                threshold = score - temperature * math.log(rand) if rand > 0 else None
+                backend_calls_move = State.backend_calls
+                this_score = _objective(objective_function, design, threshold)
+                if move_selector is not None:
+                    move_selector.reward(score - this_score, State.backend_calls - backend_calls_move)
+                # compare and make decision
+                if (this_score-score) < 0 or rand <= math.exp(-1*(this_score-score)/temperature):
+                    score = this_score
+                    accepted += 1
+                    design.pop_snapshot(restore=False)
+                    if score < best_score:
+                        (best_score, best_sequence) = (score, design.sequence)
+                else:
+                    _revert_sequence(dg, design, sample_count)
+            conn.send((score, accepted, best_score, best_sequence, State.backend_calls - backend_calls, _saved(objective_function) - saved))
+            backend_calls = State.backend_calls
+            saved = _saved(objective_function)
+    except Exception as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+def constraint_generation_optimization(dg, design, objective_function=calculate_objective, stop=1000, mode='sample', num_neg_constraints=100, max_eos_diff=0, avoid_motifs=None, white_positions=None, move_selector=None, budget=None, checkpoint=None, progress=False):
     '''
     Takes a Design object and does a constraint generation optimization of this sequence.
 
     :param dg: RNAdesign DependencyGraph object
     :param design: Design object containing the sequence and structures
-    :param objective_functions: array of functions which takes a design object and returns a score for evaluation
+    :param objective_functions: array of functions which takes a design object and returns a score for evaluation, a BoundedObjective rejects candidates early
     :param stop: Number of unsuccessful new sequences before stoping the optimization
-    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal
+    :param mode: String defining the sampling mode: sample, sample_clocal, sample_plocal, random, adaptive
     :param num_neg_constraints: Maximal number of negative constraints to accumulate during the optimization process
     :param max_eos_diff: Maximal difference between eos of the negative and positive constraints
     :param avoid_motifs: list of regex pattern specifiying sequence motifs to avoid
     :param white_positions: list of [start, end] positions in the sequence where the avoid_motifs pattern should be ignored
+    :param move_selector: MoveSelector object choosing the sampling mode in adaptive mode, e.g. to read its statistics afterwards (default: new MoveSelector)
+    :param budget: Budget object stopping the optimization as soon as one of its limits is reached (default: None)
+    :param checkpoint: Checkpoint object to save the run to regularly and to resume it from (default: None)
     :param progress: Whether or not to print the progress to the console
     :return: Optimization score reached for the final sequence
     :return: Number of samples neccessary to reach this result
     '''
-    if avoid_motifs is None:
-        avoid_motifs=[]
-    if white_positions is None:
-        white_positions=[]
+    # compile the motifs to avoid only once for the whole run
+    motif_filter = MotifFilter(avoid_motifs, white_positions)
+    # in adaptive mode choose the sampling mode of every move by the success of the modes so far
+    if mode != 'adaptive':
+        move_selector = None
+    elif move_selector is None:
+        move_selector = MoveSelector()
     dg.set_history_size(100)
     neg_constraints = collections.deque(maxlen=num_neg_constraints)
 
     # if the design has no sequence yet, sample one from scratch
     if not design.sequence:
-        sample_sequence(dg, design, 'sample', avoid_motifs=avoid_motifs, white_positions=white_positions)
+        sample_sequence(dg, design, 'sample', motif_filter=motif_filter)
     else:
         dg.set_sequence(design.sequence)
 
-    score = objective_function(design)
     # count for stop condition
     count = 0
     # remember how may mutations were done
     number_of_samples = 0
+    # continue a previous run, only a new run needs the score of the start sequence
+    resumed = _resume(checkpoint, 'constraint_generation_optimization', dg, design)
+    if resumed is not None:
+        (score, count, number_of_samples) = (resumed['score'], resumed['count'], resumed['number_of_samples'])
+        neg_constraints.extend(resumed['neg_constraints'])
+        if resumed['finished']:
+            return score, number_of_samples
+    else:
+        score = objective_function(design)
 
     # main optimization loop
     while stop:
         # constraint generation loop
         while True:
+            if budget is not None and budget.exhausted(score):
+                break
             # count up the mutations
             number_of_samples += 1
             # sample a new sequence
-            (mut_nos, sample_count) = sample_sequence(dg, design, mode, avoid_motifs=avoid_motifs, white_positions=white_positions)
+            design.push_snapshot()
+            (mut_nos, sample_count) = sample_sequence(dg, design, mode, motif_filter=motif_filter, move_selector=move_selector)
 
             # write progress
             if progress:
@@ -549,7 +1038,7 @@ def constraint_generation_optimization(dg, design, objective_function=calculate_
                     if design.classtype == 'vrna':
                         neg_eos = RNA.energy_of_struct(design.sequence, negc)
                     elif design.classtype == 'nupack':
-                        neg_eos = nupack.energy([design.sequence], negc, material = 'rna', pseudo = True)
+                        neg_eos = get_backend('nupack').energy([design.sequence], negc, material = 'rna', pseudo = True)
                     else:
                         raise ValueError('Could not figure out the classtype of the Design object.')
                     # test if the newly sampled sequence eos for pos constraints is lower than
@@ -558,28 +1047,36 @@ def constraint_generation_optimization(dg, design, objective_function=calculate_
                         if float(neg_eos) - float(eos) < max_eos_diff:
                             # this is no better solution, revert!
                             perfect = False
-                            dg.revert_sequence(sample_count)
-                            design.sequence = dg.get_sequence()
+                            _revert_sequence(dg, design, sample_count)
                             break
                 # if this is no perfect solution, stop evaluating and sample a new one
                 if not perfect:
                     break
+            # a move rejected by the negative constraints did not improve anything
+            if not perfect and move_selector is not None:
+                move_selector.reward(0)
             # if solution is perfect, stop the optimization and go down to score calculation
             if perfect:
                 break
+        if budget is not None and budget.reason is not None:
+            break
 
         # count this as a solution to analyse
         count += 1
         # calculate objective
-        this_score = objective_function(design)
+        backend_calls = State.backend_calls
+        # candidates not better than the current score can be rejected early
+        this_score = _objective(objective_function, design, score)
+        if move_selector is not None:
+            move_selector.reward(score - this_score, State.backend_calls - backend_calls)
 
         if (this_score < score):
             score = this_score
             # reset values
             count = 0
+            design.pop_snapshot(restore=False)
         else:
-            dg.revert_sequence(sample_count)
-            design.sequence = dg.get_sequence()
+            _revert_sequence(dg, design, sample_count)
         # else if current mfe is not in negative constraints, add to it
         for mfe_str in design.mfe_structure.values():
             if mfe_str not in design.structures:
@@ -590,15 +1087,297 @@ def constraint_generation_optimization(dg, design, objective_function=calculate_
         # stop condition
         if count > stop:
             break
+        if checkpoint is not None:
+            checkpoint.update('constraint_generation_optimization', sequence=design.sequence, score=score, count=count, number_of_samples=number_of_samples,
+                neg_constraints=list(neg_constraints), finished=False)
 
+    if checkpoint is not None:
+        checkpoint.save('constraint_generation_optimization', sequence=design.sequence, score=score, count=count, number_of_samples=number_of_samples,
+            neg_constraints=list(neg_constraints), finished=(budget is None or budget.reason is None))
     # clear the console
     if (progress):
         sys.stderr.write("\r" + " " * 60 + "\r")
+        if move_selector is not None:
+            sys.stderr.write(move_selector.write_out() + "\n")
+        if isinstance(objective_function, BoundedObjective):
+            sys.stderr.write("# Evaluations saved by early rejection: {0:d}\n".format(objective_function.saved))
         sys.stderr.flush()
     # finally return the result
     return score, number_of_samples
 
 
+def genetic_optimization(dg, design, objective_function=calculate_objective, population_size=20, generations=1000, stop=20, crossover_rate=0.5, mode='sample_clocal', evaluator=None, avoid_motifs=None, white_positions=None, budget=None, checkpoint=None, progress=False):
+    '''
+    Takes a Design object and does an evolutionary optimization with a population of sequences.
+    New candidates are derived from two parents by taking every connected component of the dependency graph
+    from one of them (crossover) or by a local sampling move from one parent (mutation), so all candidates
+    stay compatible to all structures. Each generation is evaluated as one batch using the evaluator, the best
+    population_size sequences of parents and offspring form the next generation.
+
+    :param dg: RNAdesign DependencyGraph object
+    :param design: Design object containing the sequence and structures
+    :param objective_function: function which takes a design object and returns a score for evaluation, a BoundedObjective rejects candidates early
+    :param population_size: Number of sequences in the population and number of offspring per generation
+    :param generations: Maximal number of generations
+    :param stop: Number of generations without a better solution before stoping the optimization
+    :param crossover_rate: Probability to create an offspring by crossover instead of mutation
+    :param mode: String defining the sampling mode of mutations: sample, sample_clocal, sample_plocal
+    :param evaluator: Object with a map function evaluating a generation, e.g. a multiprocessing.Pool (default: None, evaluate one after the other)
+    :param avoid_motifs: list of regex pattern specifiying sequence motifs to avoid
+    :param white_positions: list of [start, end] positions in the sequence where the avoid_motifs pattern should be ignored
+    :param budget: Budget object stopping the optimization as soon as one of its limits is reached (default: None)
+    :param checkpoint: Checkpoint object to save the run to regularly and to resume it from (default: None)
+    :param progress: Whether or not to print the progress to the console
+    :return: Optimization score reached for the final sequence
+    :return: Number of samples neccessary to reach this result
+    '''
+    # compile the motifs to avoid only once for the whole run
+    motif_filter = MotifFilter(avoid_motifs, white_positions)
+    # if the design has no sequence yet, sample one from scratch
+    if not design.sequence:
+        sample_sequence(dg, design, 'sample', motif_filter=motif_filter)
+    else:
+        dg.set_sequence(design.sequence)
+
+    components = [dg.component_vertices(c) for c in range(0, dg.number_of_connected_components())]
+    # scores of all sequences evaluated so far
+    scores = {}
+
+    def evaluate(sequences, threshold=None):
+        sequences = [seq for seq in set(sequences) if seq not in scores]
+        candidates = []
+        for seq in sequences:
+            candidate = copy.deepcopy(design)
+            candidate.sequence = seq
+            candidates.append((candidate, objective_function, threshold))
+        backend_calls = State.backend_calls
+        saved = _saved(objective_function)
+        if evaluator is not None:
+            results = evaluator.map(_evaluate_candidate, candidates)
+        else:
+            results = map(_evaluate_candidate, candidates)
+        scores.update((seq, score) for seq, (score, calls, rejected) in zip(sequences, results))
+        # calls and early rejections done in worker processes of the evaluator are not counted in this process
+        if budget is not None and State.backend_calls == backend_calls:
+            budget.count(sum(calls for (score, calls, rejected) in results))
+        if _saved(objective_function) == saved:
+            _count_saved(objective_function, sum(rejected for (score, calls, rejected) in results))
+        return len(candidates)
+
+    def sample(sequence, chosen_mode):
+        dg.set_sequence(sequence)
+        sample_sequence(dg, design, chosen_mode, motif_filter=motif_filter)
+        return design.sequence
+
+    # continue a previous run
+    resumed = _resume(checkpoint, 'genetic_optimization', dg, design)
+    if resumed is not None:
+        scores.update(resumed['scores'])
+        (population, score, count, number_of_samples, generations_done) = (resumed['population'], resumed['score'],
+            resumed['count'], resumed['number_of_samples'], resumed['generation'])
+        if resumed['finished']:
+            return score, number_of_samples
+    else:
+        # start with the given sequence and random samples from the whole solution space
+        scores[design.sequence] = objective_function(design)
+        population = [design.sequence] + [sample(design.sequence, 'sample') for _ in range(1, population_size)]
+        number_of_samples = evaluate(population)
+        population = sorted(set(population), key=lambda seq: scores[seq])
+        score = scores[population[0]]
+        # count for stop condition
+        count = 0
+        generations_done = 0
+
+    for generation in range(generations_done, generations):
+        if budget is not None and budget.exhausted(score):
+            break
+        offspring = []
+        while len(offspring) < population_size:
+            parent = _tournament(population, scores)
+            if len(population) > 1 and random.uniform(0, 1) < crossover_rate:
+                child = list(parent)
+                other = _tournament(population, scores)
+                for vertices in components:
+                    if random.randint(0, 1):
+                        for v in vertices:
+                            child[v] = other[v]
+                child = ''.join(child)
+                # crossover of two motif free sequences might create a new motif
+                if not motif_filter.reject(child):
+                    offspring.append(child)
+                    continue
+            offspring.append(sample(parent, mode))
+        # offspring worse than the whole population cannot survive and can be rejected early
+        threshold = scores[population[-1]] if len(population) >= population_size else None
+        number_of_samples += evaluate(offspring, threshold)
+
+        # the best of parents and offspring survive
+        population = sorted(set(population + offspring), key=lambda seq: scores[seq])[:population_size]
+        generations_done = generation + 1
+
+        # write progress
+        if progress:
+            sys.stderr.write("\rGeneration: {0:5d} | Evaluated: {1:7d} | Score: {2:5.2f} | Mode: {3:s}".format(generation+1, number_of_samples, scores[population[0]], mode) + " " * 20)
+            sys.stderr.flush()
+
+        if scores[population[0]] < score:
+            score = scores[population[0]]
+            count = 0
+        else:
+            count += 1
+            if count > stop:
+                break
+        if checkpoint is not None:
+            checkpoint.update('genetic_optimization', sequence=population[0], population=population, scores=dict((seq, scores[seq]) for seq in population),
+                score=score, count=count, number_of_samples=number_of_samples, generation=generations_done, finished=False)
+
+    if checkpoint is not None:
+        checkpoint.save('genetic_optimization', sequence=population[0], population=population, scores=dict((seq, scores[seq]) for seq in population),
+            score=score, count=count, number_of_samples=number_of_samples, generation=generations_done, finished=(budget is None or budget.reason is None))
+
+    # clear the console
+    if (progress):
+        sys.stderr.write("\r" + " " * 60 + "\r")
+        sys.stderr.flush()
+    # assign the best sequence and return the result
+    dg.set_sequence(population[0])
+    design.sequence = population[0]
+    return score, number_of_samples
+
+def _evaluate_candidate(task):
+    '''
+    Calculates the score of one candidate design. This is the function the evaluator of
+    genetic_optimization() maps over a generation.
+
+    :param task: Tuple of the design object, the objective function and the threshold for early rejection
+    :return: Score of the design
+    :return: Number of backend calls done for this evaluation
+    :return: Number of early rejections done for this evaluation, 0 or 1
+    '''
+    (candidate, objective_function, threshold) = task
+    backend_calls = State.backend_calls
+    saved = _saved(objective_function)
+    score = _objective(objective_function, candidate, threshold)
+    return (score, State.backend_calls - backend_calls, _saved(objective_function) - saved)
+
+def _tournament(population, scores, size=2):
+    '''
+    Selects a parent sequence by a tournament of randomly chosen members of the population.
+
+    :param population: List of sequences
+    :param scores: Dict with the scores of the sequences
+    :param size: Number of members competing in the tournament
+    :return: Sequence string with the best score of the competitors
+    '''
+    return min([random.choice(population) for _ in range(0, size)], key=lambda seq: scores[seq])
+
+def _resume(checkpoint, name, dg, design):
+    '''
+    Loads the checkpoint of a previous optimization run, if there is one, and sets the dependency graph
+    and the design object to the saved sequence.
+
+    :param checkpoint: Checkpoint object or None
+    :param name: Name of the optimizer which wrote the checkpoint
+    :param dg: RNAdesign DependencyGraph object
+    :param design: Design object
+    :return: Dict of the saved values, or None if there is nothing to resume
+    '''
+    if checkpoint is None:
+        return None
+    resumed = checkpoint.load(name)
+    if resumed is not None:
+        dg.set_sequence(resumed['sequence'])
+        design.sequence = resumed['sequence']
+    return resumed
+
+def run_designs(number, optimizer, structures, constraint='', design_factory=None, jobs=None, seed=None, **kwargs):
+    '''
+    Generator doing several independent optimization runs in parallel using a pool of worker processes.
+    Every run seeds its own random number generators and constructs its own dependency graph with its seed, so run n
+    gives the same result with any number of jobs. The results are yielded in the order the runs finish.
+    Worker processes do not use the spill file of State.memo.
+
+    :param number: Number of designs to generate
+    :param optimizer: Optimization function taking a dependency graph and a design object, e.g. adaptive_walk_optimization
+    :param structures: List of structures in dot-bracket notation to construct the dependency graph
+    :param constraint: Sequence constraint to construct the dependency graph
+    :param design_factory: Picklable callable returning a new Design object, e.g. functools.partial(get_Design, structures, '', 'vrna') (default: vrnaDesign(structures))
+    :param jobs: Number of worker processes, 1 does all runs in this process (default: number of CPUs)
+    :param seed: Seed of the first run, following runs get seed+1, seed+2, ... (default: random seeds)
+    :param kwargs: Additional keyword arguments passed on to the optimizer, e.g. objective_function, stop, mode. A checkpoint gets derived for every run with the run number as suffix
+    :return: Design object holding the final sequence
+    :return: Optimization score reached for the final sequence
+    :return: Number of samples neccessary to reach this result
+    :return: CPU time in seconds the optimization run took
+    '''
+    if seed is None:
+        seed = random.SystemRandom().randint(0, 2**31 - 1 - number)
+    tasks = []
+    for n in range(0, number):
+        if kwargs.get('checkpoint') is not None:
+            tasks.append((optimizer, structures, constraint, design_factory, seed + n, dict(kwargs, checkpoint=kwargs['checkpoint'].derive(n))))
+        else:
+            tasks.append((optimizer, structures, constraint, design_factory, seed + n, kwargs))
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if jobs == 1 or number < 2:
+        for task in tasks:
+            yield _run_design(task)
+        return
+
+    pool = multiprocessing.Pool(min(jobs, number), _init_worker)
+    try:
+        for (result, saved) in pool.imap_unordered(_run_design_worker, tasks):
+            _count_saved(kwargs.get('objective_function'), saved)
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def _init_worker():
+    '''
+    Initializes a forked worker process. The copy of State.memo would write to the same spill file
+    as the parent process, so the workers continue without it.
+    '''
+    if State.memo is not None:
+        State.memo.drop_spill()
+
+def _run_design_worker(task):
+    '''
+    Does one optimization run of run_designs() in a worker process.
+
+    :param task: Tuple of optimizer, structures, constraint, design_factory, seed and optimizer keyword arguments
+    :return: Tuple of design object, score, number of samples and CPU time of the run
+    :return: Number of candidates rejected early by the objective function during the run
+    '''
+    objective_function = task[5].get('objective_function')
+    saved = _saved(objective_function)
+    result = _run_design(task)
+    return (result, _saved(objective_function) - saved)
+
+def _run_design(task):
+    '''
+    Does one optimization run for run_designs().
+
+    :param task: Tuple of optimizer, structures, constraint, design_factory, seed and optimizer keyword arguments
+    :return: Tuple of design object, score, number of samples and CPU time of the run
+    '''
+    (optimizer, structures, constraint, design_factory, seed, kwargs) = task
+    random.seed(seed)
+    np.random.seed(seed)
+    dg = rbp.DependencyGraphMT(structures, constraint, seed)
+    if design_factory is None:
+        design = vrnaDesign(structures)
+    else:
+        design = design_factory()
+    start = time.clock()
+    (score, number_of_samples) = optimizer(dg, design, **kwargs)
+    return (design, score, number_of_samples, time.clock() - start)
+
 def _sample_connected_components(dg, amount=1):
     '''
     This function samples several connected component weighted by their number of solutions.
@@ -610,26 +1389,81 @@ def _sample_connected_components(dg, amount=1):
     :param amount: number of connected components to sample
     :return: list of connected component IDs which can be used for example for: dg.sample_clocal(ID)
     '''
-    result = []
-    noslist = {}
+    return _get_component_sampler(dg).draw(amount)
 
-    for c in range(0, dg.number_of_connected_components()):
-        #if dg.number_of_sequences(c) != 1:
-        noslist[c] = dg.number_of_sequences(c)
+# component samplers of the dependency graphs in use, a sampler is dropped together with its graph
+_component_samplers = weakref.WeakKeyDictionary()
 
-    if amount > len(noslist):
-        amount = len(noslist)
+def _get_component_sampler(dg):
+    '''
+    :param dg: Dependency Graph object from the RNAdesig library
+    :return: _ComponentSampler object holding the number of solutions of all connected components of this graph
+    '''
+    try:
+        return _component_samplers[dg]
+    except KeyError:
+        sampler = _ComponentSampler([dg.number_of_sequences(c) for c in range(0, dg.number_of_connected_components())])
+        _component_samplers[dg] = sampler
+        return sampler
+
+class _ComponentSampler(object):
+    '''
+    Fenwick tree over the weights of all connected components, to draw several of them weighted
+    and without replacement in O(k log C). Drawn components are removed from the tree during one
+    draw and added again afterwards, so the tree can be reused for every sample.
 
-    for _ in range(0, amount):
-        rand = random.randint(0, sum(noslist.values())-1)
-        keys = []
-        for c in noslist.keys():
-            keys.append(c)
-            if rand < sum([noslist[key] for key in keys]):
-                result.append(c)
-                del noslist[c]
-                break
-    return result
+    :param weights: List of weights (number of solutions) of all connected components
+    '''
+    def __init__(self, weights):
+        self._weights = list(weights)
+        self._size = len(self._weights)
+        self._total = sum(self._weights)
+        # build the tree in linear time
+        self._tree = [0] + self._weights
+        for i in range(1, self._size + 1):
+            j = i + (i & -i)
+            if j <= self._size:
+                self._tree[j] += self._tree[i]
+        self._top = 1
+        while self._top * 2 <= self._size:
+            self._top *= 2
+
+    def _add(self, c, delta):
+        i = c + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _find(self, rand):
+        '''
+        :param rand: Integer 0 <= rand < total weight
+        :return: First component whose cumulative weight is larger than rand
+        '''
+        i = 0
+        step = self._top
+        while step:
+            j = i + step
+            if j <= self._size and self._tree[j] <= rand:
+                i = j
+                rand -= self._tree[j]
+            step //= 2
+        return i
+
+    def draw(self, amount=1):
+        '''
+        :param amount: Number of connected components to draw
+        :return: List of the drawn connected component IDs
+        '''
+        result = []
+        total = self._total
+        for _ in range(0, min(amount, self._size)):
+            c = self._find(random.randint(0, total-1))
+            result.append(c)
+            self._add(c, -self._weights[c])
+            total -= self._weights[c]
+        for c in result:
+            self._add(c, self._weights[c])
+        return result
 
 def sample_count_unique_solutions(solution_space_size, sample_size):
     '''
@@ -28,6 +28,12 @@
 #  complexdefect
 #  sample
 #
+# The following functions run many calls concurrently in one batch:
+#  pfunc_batch
+#  mfe_batch
+#  energy_batch
+#  defect_batch
+#
 # The following functions may be wrapped in a future release:
 #  complexes
 #  concentrations
@@ -39,6 +45,7 @@
 import math
 import subprocess as sub
 import os
+import functools
 
 def dGadjust(T,N):
     """Adjust NUPACK's native free energy (with reference to mole fraction units) to be appropriate for molar units, assuming N strands in the complex."""
@@ -140,6 +147,80 @@ def call_with_pipe(args, cmd_input):
   output_lines = output.decode().split('\n')
   return (output_lines, error)
 
+
+def call_batch(calls, jobs = None, tries = 5):
+  """ Performs several NUPACK calls concurrently, at most jobs processes at a time
+  (default: number of CPUs). calls is a list of (args, cmd_input, outsuffix) tuples,
+  where outsuffix is None for calls returning their output through the pipe. Output
+  files of the whole batch are written to one temporary directory.
+  Returns the lines of the output of every call, in the order of calls.
+    Ex:
+      call_batch([(args1, input1, None), (args2, input2, '.mfe')])
+  """
+
+  import tempfile
+  import shutil
+  import multiprocessing
+
+  if jobs is None:
+    jobs = multiprocessing.cpu_count()
+  outdir = None
+  if any(c[2] for c in calls):
+    outdir = tempfile.mkdtemp(prefix = 'nupack')
+
+  outputs = [None] * len(calls)
+  pending = list(range(len(calls)))
+  devnull = open(os.devnull, 'w')
+  try:
+    while pending and tries > 0:
+      tries -= 1
+      retry = []
+      for start in range(0, len(pending), jobs):
+        chunk = pending[start:start+jobs]
+        ## Start all processes of this chunk and hand them their input, so they run concurrently
+        processes = []
+        for i in chunk:
+          (args, cmd_input, outsuffix) = calls[i]
+          args = [str(s) for s in args] # all argument elements must be strings
+          if outsuffix:
+            cmd_input = os.path.join(outdir, str(i)) + '\n' + cmd_input # prepend the output file prefix
+            p = sub.Popen(args, stdin=sub.PIPE, stdout=sub.PIPE, stderr=sub.STDOUT)
+          else:
+            p = sub.Popen(args, stdin=sub.PIPE, stdout=sub.PIPE, stderr=devnull)
+          p.stdin.write(cmd_input)
+          p.stdin.close()
+          processes.append((i, p))
+        ## Collect the output
+        for i, p in processes:
+          output = p.stdout.read()
+          p.wait()
+          outsuffix = calls[i][2]
+          if outsuffix:
+            filename = os.path.join(outdir, str(i)) + outsuffix
+            with open(filename, "rt") as out:
+              outputs[i] = out.readlines()
+            os.remove(filename)
+          else:
+            # decode is required for python3
+            outputs[i] = output.decode().split('\n')
+            if len(outputs[i]) < 4: # occasionally NUPACK returns empty-handed, subsequent tries seem to work
+              retry.append(i)
+      pending = retry
+  finally:
+    devnull.close()
+    if outdir is not None:
+      shutil.rmtree(outdir, ignore_errors = True)
+
+  return outputs
+
+
+def run_batch(calls, jobs = None):
+  """ Performs several NUPACK calls concurrently and returns their parsed results.
+  calls is a list of (args, cmd_input, outsuffix, parser) tuples as created by the
+  *_call functions below, e.g. pfunc_call(...). """
+  outputs = call_batch([c[:3] for c in calls], jobs)
+  return [c[3](output) for c, output in zip(calls, outputs)]
+
 def pfunc(sequences, ordering = None, material = 'rna',
           dangles = 'some', T = 37, multi = True, pseudo = False,
           sodium = 1.0, magnesium = 0.0):
@@ -147,24 +228,30 @@ def pfunc(sequences, ordering = None, material = 'rna',
        sequences is a list of the strand sequences
        See NUPACK User Manual for information on other arguments. """
 
-  ## Set up command-line arguments and input
+  ## Perform call, it is retried if NUPACK returns empty-handed
+  return run_batch([pfunc_call(sequences, ordering, material, dangles, T, multi, pseudo, sodium, magnesium)], jobs = 1)[0]
+
+def pfunc_call(sequences, ordering = None, material = 'rna',
+               dangles = 'some', T = 37, multi = True, pseudo = False,
+               sodium = 1.0, magnesium = 0.0):
+  """ Returns the call tuple of pfunc for run_batch. """
   args, cmd_input = \
     setup_nupack_input(exec_name = 'pfunc', sequences = sequences, ordering = ordering,
                        material = material, sodium = sodium, magnesium = magnesium,
                        dangles = dangles, T = T, multi = multi, pseudo = pseudo)
+  return (args, cmd_input, None, functools.partial(_parse_pfunc, T = T, N = len(sequences)))
 
-  ## Perform call until it works (should we have a max # of tries before quitting?)
-  output, error = call_with_pipe(args, cmd_input)
-  while len(output) < 4 : # can't figure out why, but occasionally NUPACK returns empty-handed.  Subsequent tries seem to work...
-      print('Retrying pfunc: NUPACK failed with output ' + output + ' and error ' + error +" .")
-      output, error = call_with_pipe(args, cmd_input)
-
-  ## Parse and return output
-  if output[-4] != "% Free energy (kcal/mol) and partition function:" :
+def _parse_pfunc(output, T, N):
+  if len(output) < 4 or output[-4] != "% Free energy (kcal/mol) and partition function:" :
       raise NameError('NUPACK output parsing problem')
 
   if float(output[-3])==float('inf') : return 0               # if these strands can't base-pair
-  else: return float(output[-3]) + dGadjust(T,len(sequences))
+  else: return float(output[-3]) + dGadjust(T,N)
+
+def pfunc_batch(sequences_list, jobs = None, **kargs):
+  """Calls NUPACK's pfunc concurrently for every list of strand sequences in sequences_list,
+     returns the list of dGs. See pfunc for the other arguments. """
+  return run_batch([pfunc_call(sequences, **kargs) for sequences in sequences_list], jobs)
 
 
 def pairs(sequences, ordering = None, material = 'rna',
@@ -211,17 +298,21 @@ def mfe(sequences, ordering = None, material = 'rna',
        See NUPACK User Manual for information on other arguments.
   """
 
-  ## Set up command-line arguments and input
+  ## Perform call
+  return run_batch([mfe_call(sequences, ordering, material, dangles, T, multi, pseudo, sodium, magnesium, degenerate)], jobs = 1)[0]
+
+def mfe_call(sequences, ordering = None, material = 'rna',
+             dangles = 'some', T = 37, multi = True, pseudo = False,
+             sodium = 1.0, magnesium = 0.0, degenerate = False):
+  """ Returns the call tuple of mfe for run_batch. """
   args, cmd_input = \
     setup_nupack_input(exec_name = 'mfe', sequences = sequences, ordering = ordering,
                        material = material, sodium = sodium, magnesium = magnesium,
                        dangles = dangles, T = T, multi = multi, pseudo = pseudo)
   if degenerate: args += ['-degenerate']
+  return (args, cmd_input, '.mfe', _parse_structures)
 
-  ## Perform call
-  output = call_with_file(args, cmd_input, '.mfe')
-
-  ## Parse and return output
+def _parse_structures(output):
   structs = []
   for i, l in enumerate(output):
     if l[0] == '.' or l[0] == '(':
@@ -231,6 +322,11 @@ def mfe(sequences, ordering = None, material = 'rna',
 
   return structs
 
+def mfe_batch(sequences_list, jobs = None, **kargs):
+  """Calls NUPACK's mfe concurrently for every list of strand sequences in sequences_list,
+     returns the list of mfe structure lists. See mfe for the other arguments. """
+  return run_batch([mfe_call(sequences, **kargs) for sequences in sequences_list], jobs)
+
 
 def subopt(sequences, energy_gap, ordering = None, material = 'rna',
            dangles = 'some', T = 37, multi = True, pseudo = False,
@@ -253,14 +349,7 @@ def subopt(sequences, energy_gap, ordering = None, material = 'rna',
   output = call_with_file(args, cmd_input, '.subopt')
 
   ## Parse and return output
-  structs = []
-  for i, l in enumerate(output):
-    if l[0] == '.' or l[0] == '(':
-      s = l.strip()
-      e = output[i-1].strip()
-      structs.append((s,e))
-
-  return structs
+  return _parse_structures(output)
 
 
 def count(sequences, ordering = None, material = 'rna',
@@ -297,22 +386,31 @@ def energy(sequences, structure, ordering = None, material = 'rna',
        See NUPACK User Manual for information on the other arguments.
   """
 
-  ## Set up command-line arguments and input
+  ## Perform call
+  return run_batch([energy_call(sequences, structure, ordering, material, dangles, T, multi, pseudo, sodium, magnesium)], jobs = 1)[0]
+
+def energy_call(sequences, structure, ordering = None, material = 'rna',
+                dangles = 'some', T = 37, multi = True, pseudo = False,
+                sodium = 1.0, magnesium = 0.0):
+  """ Returns the call tuple of energy for run_batch. """
   args, cmd_input = \
     setup_nupack_input(exec_name = 'energy', sequences = sequences, ordering = ordering,
                        structure = structure, material = material,
                        sodium = sodium, magnesium = magnesium,
                        dangles = dangles, T = T, multi = multi, pseudo = pseudo)
+  return (args, cmd_input, None, _parse_energy)
 
-  ## Perform call
-  output, error = call_with_pipe(args, cmd_input)
-
-  ## Parse and return output
-  if output[-3] != "% Energy (kcal/mol):" :
+def _parse_energy(output):
+  if len(output) < 3 or output[-3] != "% Energy (kcal/mol):" :
      raise ValueError('NUPACK output parsing problem')
 
   return float(output[-2])
 
+def energy_batch(sequences_list, structures, jobs = None, **kargs):
+  """Calls NUPACK's energy concurrently for every pair of strand sequences and structure,
+     returns the list of microstate dGs. See energy for the other arguments. """
+  return run_batch([energy_call(sequences, structure, **kargs) for sequences, structure in zip(sequences_list, structures)], jobs)
+
 
 def prob(sequences, structure, ordering = None, material = 'rna',
          dangles = 'some', T = 37, multi = True, pseudo = False,
@@ -351,25 +449,34 @@ def defect(sequences, structure, ordering = None, material = 'rna',
        See NUPACK User Manual for information on the other arguments.
   """
 
-  ## Set up command-line arguments and input
+  ## Perform call
+  return run_batch([defect_call(sequences, structure, ordering, material, dangles, T, multi, pseudo, sodium, magnesium, mfe)], jobs = 1)[0]
+
+def defect_call(sequences, structure, ordering = None, material = 'rna',
+                dangles = 'some', T = 37, multi = True, pseudo = False,
+                sodium = 1.0, magnesium = 0.0, mfe = False):
+  """ Returns the call tuple of defect for run_batch. """
   args, cmd_input = \
     setup_nupack_input(exec_name = 'complexdefect', sequences = sequences, ordering = ordering,
                        structure = structure, material = material,
                        sodium = sodium, magnesium = magnesium,
                        dangles = dangles, T = T, multi = multi, pseudo = pseudo)
   if mfe: args += ['-mfe']
+  return (args, cmd_input, None, _parse_defect)
 
-  ## Perform call
-  output, error = call_with_pipe(args, cmd_input)
-
-  ## Parse and return output
-  if "% Ensemble defect" not in output[-4] and \
-        "% Fraction of correct nucleotides vs. MFE" not in output[-4]:
+def _parse_defect(output):
+  if len(output) < 4 or ("% Ensemble defect" not in output[-4] and \
+        "% Fraction of correct nucleotides vs. MFE" not in output[-4]):
     raise ValueError('NUPACK output parsing problem')
 
   # We don't return the normalized ensemble defect, because that is easily calculable on your own
   return float(output[-3])
 
+def defect_batch(sequences_list, structures, jobs = None, **kargs):
+  """Calls NUPACK's defect concurrently for every pair of strand sequences and structure,
+     returns the list of ensemble defects. See defect for the other arguments. """
+  return run_batch([defect_call(sequences, structure, **kargs) for sequences, structure in zip(sequences_list, structures)], jobs)
+
 
 def sample(sequences, samples, ordering = None, material = 'rna',
            dangles = 'some', T = 37, multi = True,
@@ -400,8 +507,9 @@ def sample(sequences, samples, ordering = None, material = 'rna',
   sampled = [l.strip() for l in output[14:]]
   return sampled
 
-# Test for binary precense
-try:
+def _check_binaries():
+  """ Tests for the presence of the NUPACK binaries, raises an ImportError otherwise. """
+  try:
     output, error = call_with_pipe([get_nupack_exec_path('energy'), '--help'], None)
-except:
+  except:
     raise ImportError('Nupack binaries not found. Please install Nupack!')
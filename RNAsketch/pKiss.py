@@ -166,6 +166,36 @@ def _parse_output(output, multistate = False, window = False):
     else:
         return values
 
+def _fasta_input(records):
+    '''
+    Generates a multi-record FASTA input, the records are named by their index.
+
+    :param records: List of lists of strings, e.g. [[sequence, structure], ...]
+    :return: String with the FASTA formatted input
+    '''
+    return '\n'.join(['\n'.join(['>' + str(i)] + list(r)) for i, r in enumerate(records)]) + '\n'
+
+def _parse_batch_output(output, number, multistate = False):
+    '''
+    Splits the output of a multi-record FASTA input at the record headers and parses every record.
+
+    :param output: Output string of the pKiss program
+    :param number: Number of records in the input
+    :param multistate: Boolean stating if it is a multistate output
+    :return: List of parsed results, in the order of the input records
+    '''
+    records = {}
+    name = None
+    for line in output.split('\n'):
+        if line.startswith('>'):
+            name = line[1:].strip()
+            records[name] = []
+        elif name is not None:
+            records[name].append(line)
+    if len(records) != number:
+        raise IOError('Something went wrong calling pKiss:\n' + output)
+    return [_parse_output('\n'.join(records[str(i)]) + '\n', multistate=multistate, window=False) for i in range(number)]
+
 def mfe(sequence, temperature = 37.0, lonelyPairs = True, pkStrategy = 'A', pkMinHairpin = 2, pkMaxKnot = None):
     '''
     Computes the single energetically most stable secondary structure for the
@@ -193,6 +223,30 @@ def mfe(sequence, temperature = 37.0, lonelyPairs = True, pkStrategy = 'A', pkMi
 
     return _parse_output(output, multistate=False, window=False)
 
+def mfe_batch(sequences, temperature = 37.0, lonelyPairs = True, pkStrategy = 'A', pkMinHairpin = 2, pkMaxKnot = None):
+    '''
+    Batch version of mfe. All sequences are folded by one pKiss process using a multi-record FASTA input.
+
+    :param sequences: List of strings containing the RNA sequences [AUGC]
+    :param temperature: Float temperature in degree celsius (default: 37.0)
+    :param lonelyPairs: Boolean stating whether lonely pairs are allowed (default: True)
+    :param pkStrategy: String stating the pseudoknot evaluation strategy [A,B,C,D,P] (default: A)
+    :param pkMinHairpin: Integer length of initial PK hairpin, less is better but slower. (default: 2)
+    :param pkMaxKnot: Int maximal PK size (default: Length of the longest sequence)
+    :return: List of tuples of string and float containing the mfe structure and energy of each sequence
+    '''
+    if not sequences:
+        return []
+    if pkMaxKnot is None:
+        pkMaxKnot = max([len(s) for s in sequences])
+
+    args, cmd_input = \
+    _setup_args(mode = 'mfe', sequence = '', temperature = temperature, lonelyPairs = lonelyPairs, pkStrategy = pkStrategy, pkMinHairpin = pkMinHairpin, pkMaxKnot = pkMaxKnot)
+
+    output = _call_with_file(args, _fasta_input([[s] for s in sequences]))
+
+    return _parse_batch_output(output, len(sequences), multistate=False)
+
 def mfe_window(sequence, temperature = 37.0, lonelyPairs = True, pkStrategy = 'A', pkMinHairpin = 2, pkMaxKnot = None, windowSize = 5, windowIncrement = 1):
     '''
     Window mode of mfe.
@@ -335,6 +389,33 @@ def shapes(sequence, temperature = 37.0, lonelyPairs = True, pkStrategy = 'A', p
 
     return _parse_output(output, multistate=True, window=False)
 
+def shapes_batch(sequences, temperature = 37.0, lonelyPairs = True, pkStrategy = 'A', pkMinHairpin = 2, pkMaxKnot = None, relativeDeviation = True, deviation=20.0, shapeLevel = 2):
+    '''
+    Batch version of shapes. All sequences are folded by one pKiss process using a multi-record FASTA input.
+
+    :param sequences: List of strings containing the RNA sequences [AUGC]
+    :param temperature: Float temperature in degree celsius (default: 37.0)
+    :param lonelyPairs: Boolean stating whether lonely pairs are allowed (default: True)
+    :param pkStrategy: String stating the pseudoknot evaluation strategy [A,B,C,D,P] (default: A)
+    :param pkMinHairpin: Integer length of initial PK hairpin, less is better but slower. (default: 2)
+    :param pkMaxKnot: Int maximal PK size (default: Length of the longest sequence)
+    :param relativeDeviation: Boolean stating whether the energy deviation should is given in percent of the mfe energy (default: True)
+    :param deviation: Float energy deviation above the mfe energy either in kcal/mol or in percent of the mfe energy (default: 20%)
+    :param shapeLevel: Int abstraction level of the shape representation (default: 2)
+    :return: List with the states of each sequence, in lists of tuples of string, float and string representing the shape, energy and structure.
+    '''
+    if not sequences:
+        return []
+    if pkMaxKnot is None:
+        pkMaxKnot = max([len(s) for s in sequences])
+
+    args, cmd_input = \
+    _setup_args(mode = 'shapes', sequence = '', temperature = temperature, lonelyPairs = lonelyPairs, pkStrategy = pkStrategy, pkMinHairpin = pkMinHairpin, pkMaxKnot = pkMaxKnot, relativeDeviation = relativeDeviation, deviation = deviation, shapeLevel = shapeLevel)
+
+    output = _call_with_file(args, _fasta_input([[s] for s in sequences]))
+
+    return _parse_batch_output(output, len(sequences), multistate=True)
+
 def shapes_window(sequence, temperature = 37.0, lonelyPairs = True, pkStrategy = 'A', pkMinHairpin = 2, pkMaxKnot = None, relativeDeviation = True, deviation=20.0, shapeLevel = 2, windowSize = 5, windowIncrement = 1):
     '''
     Window version of shapes.
@@ -471,6 +552,35 @@ def eval(sequence, structure, temperature = 37.0, lonelyPairs = True, pkStrategy
 
     return _parse_output(output, multistate=False, window=False)
 
+def eval_batch(sequences, structures, temperature = 37.0, lonelyPairs = True, pkStrategy = 'A', pkMinHairpin = 2, shapeLevel = 2):
+    '''
+    Batch version of eval. All pairs of sequence and structure are evaluated by one pKiss process
+    using a multi-record FASTA input.
+
+    :param sequences: List of strings containing the RNA sequences [AUGC]
+    :param structures: List of strings containing the dot-bracket structures [.(){}[]<>]
+    :param temperature: Float temperature in degree celsius (default: 37.0)
+    :param lonelyPairs: Boolean stating whether lonely pairs are allowed (default: True)
+    :param pkStrategy: String stating the pseudoknot evaluation strategy [A,B,C,D,P] (default: A)
+    :param pkMinHairpin: Integer length of initial PK hairpin, less is better but slower. (default: 2)
+    :param shapeLevel: Int abstraction level of the shape representation (default: 2)
+    :return: List of tuples of string, float and string representing the shape, energy and structure
+    '''
+    if len(sequences) != len(structures):
+        raise IOError('Number of sequences and structures differ!')
+    for sequence, structure in zip(sequences, structures):
+        if len(structure) != len(sequence):
+            raise IOError('Sequence and Structure have unequal length!')
+    if not sequences:
+        return []
+
+    args, cmd_input = \
+    _setup_args(mode = 'eval', sequence = '', structure = '', temperature = temperature, lonelyPairs = lonelyPairs, pkStrategy = pkStrategy, pkMinHairpin = pkMinHairpin, shapeLevel = shapeLevel)
+
+    output = _call_with_file(args, _fasta_input(zip(sequences, structures)))
+
+    return _parse_batch_output(output, len(sequences), multistate=False)
+
 def abstract(structure, shapeLevel = 2):
     '''
     Converts a Vienna-Dot-Bracket representation of a secondary structure into a
@@ -488,8 +598,11 @@ def abstract(structure, shapeLevel = 2):
 
     return output.rstrip('\n')
 
-# Test for binary precense
-try:
-    output = _call_with_pipe(['--help'], '')
-except:
-    raise ImportError('pKiss not found. Please install pKiss!')
+def _check_binaries():
+    '''
+    Tests for the presence of the pKiss binary, raises an ImportError otherwise.
+    '''
+    try:
+        output = _call_with_pipe(['--help'], '')
+    except:
+        raise ImportError('pKiss not found. Please install pKiss!')
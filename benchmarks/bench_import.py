@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+'''
+    bench_import.py: Measures the time needed to import RNAsketch in a fresh interpreter
+    and counts the subprocesses started meanwhile, so startup regressions show up.
+'''
+
+from __future__ import print_function
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import argparse
+import os
+import subprocess
+import sys
+
+# runs in the fresh interpreter, counts all Popen calls during the import
+CODE = '''
+import subprocess
+import time
+calls = [0]
+_Popen = subprocess.Popen
+class CountingPopen(_Popen):
+    def __init__(self, *args, **kwargs):
+        calls[0] += 1
+        _Popen.__init__(self, *args, **kwargs)
+subprocess.Popen = CountingPopen
+start = time.time()
+import RNAsketch
+print('{0:f} {1:d}'.format(time.time() - start, calls[0]))
+'''
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of RNAsketch.')
+    parser.add_argument("-r", "--repeat", type=int, default=10, help='Number of fresh interpreters to measure (default: 10)')
+    args = parser.parse_args()
+
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join([os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'), env.get('PYTHONPATH', '')])
+
+    times = []
+    processes = []
+    for _ in range(0, args.repeat):
+        output = subprocess.check_output([sys.executable, '-c', CODE], env=env)
+        t, p = output.split()[-2:]
+        times.append(float(t))
+        processes.append(int(p))
+    times.sort()
+
+    print('# import RNAsketch, {0:d} runs'.format(args.repeat))
+    print('min:    {0:8.4f} s'.format(times[0]))
+    print('median: {0:8.4f} s'.format(times[len(times) // 2]))
+    print('max:    {0:8.4f} s'.format(times[-1]))
+    print('subprocesses started: {0:d}'.format(max(processes)))
+
+if __name__ == "__main__":
+    main()
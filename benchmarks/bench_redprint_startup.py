@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+'''
+    bench_redprint_startup.py: Microbenchmark of the startup of RPSampler objects, which link the shared
+    RNARedPrint project folder into a scratch directory, compared to copying the whole project folder per instance.
+'''
+
+from __future__ import print_function
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+import uuid
+from distutils.dir_util import copy_tree
+
+from RNAsketch import RPSampler
+
+def fake_project(files, size):
+    '''
+    Creates a folder with the layout of the RNARedPrint project folder.
+
+    :param files: Number of files in the project folder
+    :param size: Size of every file in bytes
+    :return: String of the project path
+    '''
+    folder = tempfile.mkdtemp(prefix='bench-RNARedPrint-')
+    for sub in ['bin', 'src', 'lib']:
+        os.mkdir(os.path.join(folder, sub))
+    for i in range(0, files):
+        sub = ['bin', 'src', 'lib'][i % 3]
+        with open(os.path.join(folder, sub, 'file' + str(i)), 'wb') as f:
+            f.write(os.urandom(size))
+    return folder
+
+def copy_startup(folder):
+    # behaviour before the scratch directories: one copy of the project folder per instance
+    toDirectory = os.path.join(tempfile.gettempdir(), 'RNARedPrint-' + str(uuid.uuid4()))
+    copy_tree(folder, toDirectory)
+    shutil.rmtree(toDirectory)
+
+def link_startup(folder):
+    sampler = RPSampler(['((((....))))'], RedPrintFolder=folder)
+    del sampler
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup of RPSampler objects.')
+    parser.add_argument("-f", "--folder", type=str, default=None, help='RNARedPrint project folder (default: a generated fake project)')
+    parser.add_argument("--files", type=int, default=300, help='Number of files of the generated fake project (default: 300)')
+    parser.add_argument("--size", type=int, default=65536, help='Size in bytes of the files of the generated fake project (default: 65536)')
+    parser.add_argument("-n", "--number", type=int, default=20, help='Number of instances per measurement (default: 20)')
+    args = parser.parse_args()
+
+    folder = args.folder
+    if folder is None:
+        folder = fake_project(args.files, args.size)
+    try:
+        print('{0:>10}\t{1:>12}'.format('startup', 'ms per instance'))
+        for (name, function) in [('copy', copy_startup), ('link', link_startup)]:
+            t = min(timeit.repeat(lambda: function(folder), number=args.number, repeat=3))
+            print('{0:>10}\t{1:12.3f}'.format(name, t / args.number * 1e3))
+    finally:
+        if args.folder is None:
+            shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
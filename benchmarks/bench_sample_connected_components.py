@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+'''
+    bench_sample_connected_components.py: Microbenchmark of the weighted draw of connected
+    components used by the sample_clocal moves, on fake dependency graphs with thousands of components,
+    compared to the linear scan over all components it replaced.
+'''
+
+from __future__ import print_function
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import argparse
+import random
+import timeit
+
+from RNAsketch import _sample_connected_components
+
+class FakeDependencyGraph(object):
+    '''
+    Mimics the parts of a RNAblueprint dependency graph needed to draw connected components.
+
+    :param components: Number of connected components
+    '''
+    def __init__(self, components):
+        self._nos = [random.choice([1, 4, 16, 64, 2**20]) for _ in range(0, components)]
+
+    def number_of_connected_components(self):
+        return len(self._nos)
+
+    def number_of_sequences(self, c):
+        return self._nos[c]
+
+def linear_draw(dg, amount=1):
+    # behaviour before the Fenwick tree: a linear scan over the cumulative weights of the remaining components per draw
+    noslist = [(c, dg.number_of_sequences(c)) for c in range(0, dg.number_of_connected_components())]
+    result = []
+    for _ in range(0, min(amount, len(noslist))):
+        rand = random.randint(0, sum([nos for (_, nos) in noslist])-1)
+        cumulative = 0
+        for i, (c, nos) in enumerate(noslist):
+            cumulative += nos
+            if rand < cumulative:
+                result.append(c)
+                del noslist[i]
+                break
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the weighted draw of connected components.')
+    parser.add_argument("-c", "--components", type=int, nargs='+', default=[100, 1000, 5000], help='Numbers of connected components (default: 100 1000 5000)')
+    parser.add_argument("-a", "--amount", type=int, nargs='+', default=[1, 10], help='Numbers of components drawn at once (default: 1 10)')
+    parser.add_argument("-n", "--number", type=int, default=1000, help='Number of draws per measurement (default: 1000)')
+    args = parser.parse_args()
+
+    random.seed(1)
+    print('{0:>10}\t{1:>6}\t{2:>12}\t{3:>12}'.format('components', 'amount', 'linear us', 'fenwick us'))
+    for components in args.components:
+        dg = FakeDependencyGraph(components)
+        for amount in args.amount:
+            linear = min(timeit.repeat(lambda: linear_draw(dg, amount), number=args.number, repeat=3))
+            fenwick = min(timeit.repeat(lambda: _sample_connected_components(dg, amount), number=args.number, repeat=3))
+            print('{0:10d}\t{1:6d}\t{2:12.2f}\t{3:12.2f}'.format(components, amount, linear / args.number * 1e6, fenwick / args.number * 1e6))
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ import RNAblueprint as rbp
 import argparse
 import sys
 import time
+import functools
 
 try:
     from RNAsketch import *
@@ -33,12 +34,16 @@ def main():
     parser.add_argument("-T", "--temperature", type=float, default=37.0, help='Temperature of the energy calculations.')
     parser.add_argument("-n", "--number", type=int, default=4, help='Number of designs to generate')
     parser.add_argument("-s", "--stop", type=int, default=500, help='Stop optimization run if no better solution is aquired after (stop) trials.')
-    parser.add_argument("-m", "--mode", type=str, default='random', help='Mode for getting a new sequence: sample, sample_plocal, sample_clocal, random')
+    parser.add_argument("-m", "--mode", type=str, default='random', help='Mode for getting a new sequence: sample, sample_plocal, sample_clocal, random, adaptive')
     parser.add_argument("-k", "--kill", type=int, default=0, help='Timeout value of graph construction in seconds. (default: infinite)')
     parser.add_argument("-g", "--graphml", type=str, default=None, help='Write a graphml file with the given filename.')
     parser.add_argument("-c", "--csv", default=False, action='store_true', help='Write output as semi-colon csv file to stdout')
     parser.add_argument("-p", "--progress", default=False, action='store_true', help='Show progress of optimization')
     parser.add_argument("-d", "--debug", default=False, action='store_true', help='Show debug information of library')
+    parser.add_argument("--jobs", type=int, default=1, help='Number of optimization runs done in parallel processes (default: 1)')
+    parser.add_argument("--checkpoint", type=str, default=None, help='Regularly write the state of every optimization run to files with this name and the run number as suffix')
+    parser.add_argument("--resume", default=False, action='store_true', help='Resume the optimization runs from the files given by --checkpoint')
+    parser.add_argument("--checkpoint-memo", default=False, action='store_true', help='Cache the evaluated states and store the cache in the files given by --checkpoint, so resumed runs do not evaluate them again')
     parser.add_argument("-r", "--reporter", type = str, default='CGTAAGGGCGAAGAGCTTTTTACCGGTGTTGTGCCTATTCTCGTAGAGTTAGATGGCGACGTTAAT', help='The coding sequence context, excluding the start codon that should be part of the sequence constraint. Default are the first 66 nucleotides of eGFP.')
     args = parser.parse_args()
 
@@ -137,45 +142,51 @@ def main():
                         design.write_csv_header()] +
                         graph_properties.keys()))
 
-        # main loop from zero to number of solutions
-        for _ in range(0, args.number):
-            # reset the design object
-            design = get_Design(structures, start_sequence, args.package, args.temperature)
-
-            # set fold constraints
-            design.foldconstraints = fold_constraints
-            design.context = context
-            #to evaluate binding site in standard output
-            design.newState('binding', fold_constraints[0], constraint=fold_constraints[0], temperature=args.temperature)
+        # each optimization run gets a fresh design object
+        design_factory = functools.partial(get_cofold_design, structures, start_sequence, args.package, args.temperature, fold_constraints, context)
+        if args.checkpoint_memo and State.memo is None:
+            State.memo = EvaluationMemo()
+        checkpoint = Checkpoint(args.checkpoint, resume=args.resume, memo=args.checkpoint_memo) if args.checkpoint is not None else None
 
-            if (start_sequence):
-                score=cofold_objective(design,printDetails=True)
-                print(design.write_out(score))
+        if (start_sequence):
+            design = design_factory()
+            score=cofold_objective(design,printDetails=True)
+            print(design.write_out(score))
 
-            start = time.clock()
+        # main loop from zero to number of solutions
+        try:
             # now do the optimization based on the chosen mode for args.stop iterations
-            try:
-                (score, number_of_mutations) = adaptive_walk_optimization(dg, design, objective_function=cofold_objective, stop=args.stop, mode=args.mode, avoid_motifs=avoid_motifs, white_positions=white_positions, progress=args.progress)
-            except ValueError as e:
-                print (e.value)
-                exit(1)
-            # stop time counter
-            sample_time = time.clock() - start
-            score=cofold_objective(design,printDetails=True)
-            if (args.csv):
-                print(args.stop,
-                        "\"" + args.mode + "\"",
-                        score,
-                        number_of_mutations,
-                        construction_time,
-                        sample_time,
-                        design.write_csv(),
-                        *graph_properties.values(), sep=";")
-            else:
-                print(design.write_out(score))
+            for (design, score, number_of_mutations, sample_time) in run_designs(args.number, adaptive_walk_optimization, structures, constraint,
+                    design_factory=design_factory, jobs=args.jobs, objective_function=cofold_objective, stop=args.stop, mode=args.mode,
+                    avoid_motifs=avoid_motifs, white_positions=white_positions, checkpoint=checkpoint, progress=args.progress):
+                score=cofold_objective(design,printDetails=True)
+                if (args.csv):
+                    print(args.stop,
+                            "\"" + args.mode + "\"",
+                            score,
+                            number_of_mutations,
+                            construction_time,
+                            sample_time,
+                            design.write_csv(),
+                            *graph_properties.values(), sep=";")
+                else:
+                    print(design.write_out(score))
+        except ValueError as e:
+            print (e)
+            exit(1)
     else:
         print('# Construction time out reached!')
 
+def get_cofold_design(structures, start_sequence, package, temperature, fold_constraints, context):
+    design = get_Design(structures, start_sequence, package, temperature)
+
+    # set fold constraints
+    design.foldconstraints = fold_constraints
+    design.context = context
+    #to evaluate binding site in standard output
+    design.newState('binding', fold_constraints[0], constraint=fold_constraints[0], temperature=temperature)
+    return design
+
 def cofold_objective(design, weight1=1, weight2=1, weight3=1, printDetails=False):
     '''
     1 - [S AB ]/[A 0 ] + weight1 * P (RBS unpaired ) + weight2 * P(sRNA binding site unpaired) + weight3 * P(mRNA folds locally)
@@ -12,7 +12,6 @@ import argparse
 import sys
 import os
 import time
-from collections import Counter
 from scipy import stats
 
 def main():
@@ -30,6 +29,10 @@ def main():
     parser.add_argument("-k", "--kill", type=int, default=0, help='Timeout value of graph construction in seconds. (default: infinite)')
     parser.add_argument("-p", "--progress", default=False, action='store_true', help='Show progress of optimization')
     parser.add_argument("-d", "--debug", default=False, action='store_true', help='Show debug information of library')
+    parser.add_argument("--jobs", type=int, default=1, help='Number of worker processes evaluating the sample for the energy offsets and of RNARedPrint processes sampling in parallel (default: 1)')
+    parser.add_argument("--prefetch", type=float, default=1.0, help='Factor of sequences requested from RNARedPrint per call, the surplus is used by the next call with unchanged weights (default: 1.0)')
+    parser.add_argument("--checkpoint", type=str, default=None, help='Write the admissible sample and the number of designs written out so far to this file')
+    parser.add_argument("--resume", default=False, action='store_true', help='Resume from the file given by --checkpoint instead of sampling again')
     args = parser.parse_args()
     
     if args.debug:
@@ -77,31 +80,41 @@ def main():
                     "sample_time",
                     design.write_csv_header()]))
 
-    # read target energies
-    target_energies = {}
-    if args.energies:
-        for i, w in enumerate(args.energies.split(',')):
-            target_energies[i] = -1*float(w)
+    # an interrupted run continues with its admissible sample after the last design written out
+    checkpoint = Checkpoint(args.checkpoint, resume=args.resume) if args.checkpoint is not None else None
+    resumed = checkpoint.load('design-energyshift') if checkpoint is not None else None
+    if resumed is not None:
+        AdmissibleSample = resumed['sample']
+        done = resumed['done']
     else:
-        exit(1)
-    if args.debug:
-        print("# Turner Target Energies are: ", target_energies)
-    # get energy offsets
-    slope, intercept = getEnergyOffsets(structures, args)
-    # correct target energies with offsets
-    for t in range(0, len(structures)):
-        target_energies[t]  = (target_energies[t] - intercept[t]) / slope[t]
+        # read target energies
+        target_energies = {}
+        if args.energies:
+            for i, w in enumerate(args.energies.split(',')):
+                target_energies[i] = -1*float(w)
+        else:
+            exit(1)
+        if args.debug:
+            print("# Turner Target Energies are: ", target_energies)
+        # get energy offsets
+        slope, intercept = getEnergyOffsets(structures, args)
+        # correct target energies with offsets
+        for t in range(0, len(structures)):
+            target_energies[t]  = (target_energies[t] - intercept[t]) / slope[t]
 
-    if args.debug:
-        print("# Simple Target Energies are: ", target_energies)
+        if args.debug:
+            print("# Simple Target Energies are: ", target_energies)
 
-    nstr = len(structures)
-    wastefactor = 20
-    sampler = RPSampler(structures, model=args.model, weights=([1.0] * nstr), gcweight=1.0, temperature=args.temperature, stacksize=(wastefactor*args.number))
+        nstr = len(structures)
+        wastefactor = 20
+        sampler = RPSampler(structures, model=args.model, weights=([1.0] * nstr), gcweight=1.0, temperature=args.temperature, stacksize=(wastefactor*args.number), prefetch=args.prefetch, shards=args.jobs)
 
-    AdmissibleSample = Sample(sampler, nstr, target_energies, target_GC=0.5, number=args.number, args=args)
+        AdmissibleSample = Sample(sampler, nstr, target_energies, target_GC=0.5, number=args.number, args=args)
+        done = 0
 
-    for a in AdmissibleSample:
+    for d, a in enumerate(AdmissibleSample):
+        if d < done:
+            continue
         design = get_Design(structures, a['seq'], args.package, args.temperature)
         #out = '$;'
         #for i in range(0, design.number_of_structures):
@@ -128,6 +141,9 @@ def main():
                     design.write_csv(), sep=";")
         else:
             print(design.write_out(score))
+        if checkpoint is not None:
+            sys.stdout.flush()
+            checkpoint.save('design-energyshift', sample=AdmissibleSample, done=d+1)
 
 def getEnergyOffsets(structures, args):
     sampler = RPSampler(structures, model=args.model, temperature=args.temperature, stacksize=1000, StopConstruct=True, debug=args.debug)
@@ -136,19 +152,10 @@ def getEnergyOffsets(structures, args):
     newsample, energies = sampler.dump_new_stack()
 
     nstr = len(structures)
-    simple = np.zeros( (len(newsample), nstr) )
-    turner = np.zeros( (len(newsample), nstr) )
-    # iterate over sample
-    for i, s in enumerate(newsample):
-        # get design object
-        design = get_Design(structures, s, args.package, args.temperature)
-        # iterate over structures
-        for t in range(0, nstr):
-            # calculate offset between turner eos and simple model eos
-            #print(structures[t], s, design.eos[str(t)], energies[i][t])
-            simple[i,t] = energies[i][t]
-            turner[i,t] = design.eos[str(t)]
-            #print(i, t, energies[i][t], design.eos[str(t)], structures[t], s)
+    simple = np.array([[energies[i][t] for t in range(0, nstr)] for i in range(0, len(newsample))], dtype=float).reshape(len(newsample), nstr)
+    # calculate turner eos of the whole sample with one design object
+    design = get_Design(structures, '', args.package, args.temperature)
+    turner = design.evaluate_many(newsample, properties=['eos'], jobs=args.jobs, keys=[str(t) for t in range(0, nstr)])['eos']
     #turner = np.where(turner > 1000, np.nan, turner)
     # get linear regression
     slope = {}
@@ -208,44 +215,18 @@ def Sample(sampler, nstr, target_energies, target_GC, args, target_energy_eps =
             print('# GC weight: ', sampler.gcweight)
         newsample, energies = sampler.dump_new_stack()
 
-        # get average structue energies for newsample
-        eos = np.zeros( (len(newsample), nstr) )
-        GC_freq = []
-
-        for i, s in enumerate(newsample):
-            # count GC content
-            c = Counter(s)
-            sigma = 2.0 # one per nucleotide, laplace
-            GC = (c['G'] + c['C'] + sigma) / (len(s) + 2*sigma)
-            GC_freq.append(GC)
-            # add if it is eps-admissible
-            admissible = True
-            if not (1-target_GC_eps <= GC/target_GC <= 1+target_GC_eps):
-                admissible = False
-            for t in range(0, nstr):
-                # add to eos np array in any case
-                eos[i,t] = energies[i][t]
-                # check if eps admissible
-                #print(eos[i,t], eos[i,t]/target_energies[t], target_energies[t])
-                if not (1-target_energy_eps <= eos[i,t]/target_energies[t] <= 1+target_energy_eps):
-                    admissible = False
-            if admissible:
-                #print('# is admissible:', eos[i,:], GC)
-                AdmissibleSample.append({'seq': s, 'energies': energies[i]})
-        # update weights
-        for t in range(0, nstr):
-            e_mean = np.mean(eos[:,t])
-            if args.debug:
-                print('# Energy mean: ', str(t), e_mean)
-            # exp version
-            sampler.weights[t] = sampler.weights[t] * (1.1**(e_mean-target_energies[t]))
-            # Yann old version without positive e_mean
-            #weights[t] = weights[t]*target_energies[t]/e_mean
-        # update gcweight
-        GC_mean = np.mean(GC_freq)
+        # check admissibility of all sequences at once
+        eos = np.array([[e[t] for t in range(0, nstr)] for e in energies])
+        admissible, weight_factors, gcweight_factor = sample_admissibility(newsample, eos, target_energies, target_GC, target_energy_eps=target_energy_eps, target_GC_eps=target_GC_eps)
+        for i in np.flatnonzero(admissible):
+            AdmissibleSample.append({'seq': newsample[i], 'energies': energies[i]})
+        # update weights and gcweight
         if args.debug:
-            print('# GC mean: ', GC_mean)
-        sampler.gcweight = sampler.gcweight * target_GC/GC_mean
+            print('# Weight factors: ', weight_factors)
+            print('# GC weight factor: ', gcweight_factor)
+        for t in range(0, nstr):
+            sampler.weights[t] = sampler.weights[t] * float(weight_factors[t])
+        sampler.gcweight = sampler.gcweight * float(gcweight_factor)
         # return if large enough
         if args.debug:
             print('# Found for current Target: ', len(AdmissibleSample)/float(number), '%')
@@ -19,6 +19,7 @@ import RNAblueprint as rbp
 import argparse
 import sys
 import time
+import functools
 
 try:
     from RNAsketch import *
@@ -36,12 +37,16 @@ def main():
     parser.add_argument("-T", "--temperature", type=float, default=37.0, help='Temperature of the energy calculations.')
     parser.add_argument("-n", "--number", type=int, default=4, help='Number of designs to generate')
     parser.add_argument("-s", "--stop", type=int, default=500, help='Stop optimization run if no better solution is aquired after (stop) trials.')
-    parser.add_argument("-m", "--mode", type=str, default='random', help='Mode for getting a new sequence: sample, sample_plocal, sample_clocal, random')
+    parser.add_argument("-m", "--mode", type=str, default='random', help='Mode for getting a new sequence: sample, sample_plocal, sample_clocal, random, adaptive')
     parser.add_argument("-k", "--kill", type=int, default=0, help='Timeout value of graph construction in seconds. (default: infinite)')
     parser.add_argument("-g", "--graphml", type=str, default=None, help='Write a graphml file with the given filename.')
     parser.add_argument("-c", "--csv", default=False, action='store_true', help='Write output as semi-colon csv file to stdout')
     parser.add_argument("-p", "--progress", default=False, action='store_true', help='Show progress of optimization')
     parser.add_argument("-d", "--debug", default=False, action='store_true', help='Show debug information of library')
+    parser.add_argument("--jobs", type=int, default=1, help='Number of optimization runs done in parallel processes (default: 1)')
+    parser.add_argument("--checkpoint", type=str, default=None, help='Regularly write the state of every optimization run to files with this name and the run number as suffix')
+    parser.add_argument("--resume", default=False, action='store_true', help='Resume the optimization runs from the files given by --checkpoint')
+    parser.add_argument("--checkpoint-memo", default=False, action='store_true', help='Cache the evaluated states and store the cache in the files given by --checkpoint, so resumed runs do not evaluate them again')
     args = parser.parse_args()
 
     print("# Options: number={0:d}, stop={1:d}, mode={2:}, temperature={3:}, ratio={4:}, ligand={5:}".format(args.number, args.stop, args.mode, args.temperature, args.ratio, args.ligand))
@@ -110,33 +115,30 @@ def main():
                         design.write_csv_header()] +
                         graph_properties.keys()))
 
-        # main loop from zero to number of solutions
-        for n in range(0, args.number):
-            # reset the design object
-            design = get_design(structures, start_sequence, constraint, args)
-
-            start = time.clock()
-            try:
-                (score, number_of_mutations) = adaptive_walk_optimization(dg, design, objective_function=ligand_objective, stop=args.stop, mode=args.mode, progress=args.progress)
-            except ValueError as e:
-                print (e.value)
-                exit(1)
-
-            ligand_objective(design, printDetails=True)
-            # stop time counter
-            sample_time = time.clock() - start
-
-            if (args.csv):
-                print(args.stop,
-                        "\"" + args.mode + "\"",
-                        score,
-                        number_of_mutations,
-                        construction_time,
-                        sample_time,
-                        design.write_csv(),
-                        *graph_properties.values(), sep=";")
-            else:
-                print(design.write_out(score))
+        # main loop from zero to number of solutions, each run gets a fresh design object
+        design_factory = functools.partial(get_design, structures, start_sequence, constraint, args)
+        if args.checkpoint_memo and State.memo is None:
+            State.memo = EvaluationMemo()
+        checkpoint = Checkpoint(args.checkpoint, resume=args.resume, memo=args.checkpoint_memo) if args.checkpoint is not None else None
+        try:
+            for (design, score, number_of_mutations, sample_time) in run_designs(args.number, adaptive_walk_optimization, structures, constraint,
+                    design_factory=design_factory, jobs=args.jobs, objective_function=ligand_objective, stop=args.stop, mode=args.mode, checkpoint=checkpoint, progress=args.progress):
+                ligand_objective(design, printDetails=True)
+
+                if (args.csv):
+                    print(args.stop,
+                            "\"" + args.mode + "\"",
+                            score,
+                            number_of_mutations,
+                            construction_time,
+                            sample_time,
+                            design.write_csv(),
+                            *graph_properties.values(), sep=";")
+                else:
+                    print(design.write_out(score))
+        except ValueError as e:
+            print (e)
+            exit(1)
     else:
         print('# Construction time out reached!')
 
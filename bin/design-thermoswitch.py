@@ -19,6 +19,7 @@ import RNAblueprint as rbp
 import argparse
 import sys
 import time
+import functools
 import re
 
 try:
@@ -32,12 +33,16 @@ def main():
     parser.add_argument("-q", "--package", type=str, default='vrna', help='Chose the calculation package: hotknots, pkiss, nupack, or vrna/ViennaRNA (default: vrna)')
     parser.add_argument("-n", "--number", type=int, default=4, help='Number of designs to generate')
     parser.add_argument("-e", "--stop", type=int, default=500, help='Stop optimization run if no better solution is aquired after (stop) trials.')
-    parser.add_argument("-m", "--mode", type=str, default='random', help='Mode for getting a new sequence: sample, sample_plocal, sample_clocal, random')
+    parser.add_argument("-m", "--mode", type=str, default='random', help='Mode for getting a new sequence: sample, sample_plocal, sample_clocal, random, adaptive')
     parser.add_argument("-k", "--kill", type=int, default=0, help='Timeout value of graph construction in seconds. (default: infinite)')
     parser.add_argument("-g", "--graphml", type=str, default=None, help='Write a graphml file with the given filename.')
     parser.add_argument("-c", "--csv", default=False, action='store_true', help='Write output as semi-colon csv file to stdout')
     parser.add_argument("-p", "--progress", default=False, action='store_true', help='Show progress of optimization')
     parser.add_argument("-d", "--debug", default=False, action='store_true', help='Show debug information of library')
+    parser.add_argument("--jobs", type=int, default=1, help='Number of optimization runs done in parallel processes (default: 1)')
+    parser.add_argument("--checkpoint", type=str, default=None, help='Regularly write the state of every optimization run to files with this name and the run number as suffix')
+    parser.add_argument("--resume", default=False, action='store_true', help='Resume the optimization runs from the files given by --checkpoint')
+    parser.add_argument("--checkpoint-memo", default=False, action='store_true', help='Cache the evaluated states and store the cache in the files given by --checkpoint, so resumed runs do not evaluate them again')
     args = parser.parse_args()
 
     print("# Options: number={0:d}, stop={1:d}, mode={2:}, package={3:}".format(args.number, args.stop, args.mode, args.package))
@@ -109,32 +114,29 @@ def main():
                         design.write_csv_header()] +
                         graph_properties.keys()))
 
-        # main loop from zero to number of solutions
-        for n in range(0, args.number):
-            # reset the design object
-            design = build_molecule(structures, start_sequence, temperatures, args.package)
-            start = time.clock()
-
+        # main loop from zero to number of solutions, each run gets a fresh design object
+        design_factory = functools.partial(build_molecule, structures, start_sequence, temperatures, args.package)
+        if args.checkpoint_memo and State.memo is None:
+            State.memo = EvaluationMemo()
+        checkpoint = Checkpoint(args.checkpoint, resume=args.resume, memo=args.checkpoint_memo) if args.checkpoint is not None else None
+        try:
             # now do the optimization based on the chose mode for args.stop iterations
-            try:
-                (score, number_of_mutations) = adaptive_walk_optimization(dg, design, objective_function=temp_objective, stop=args.stop, mode=args.mode, progress=args.progress)
-            except Exception as e:
-                print (e)
-                exit(1)
-            # stop time counter
-            sample_time = time.clock() - start
-
-            if (args.csv):
-                print(args.stop,
-                        "\"" + args.mode + "\"",
-                        score,
-                        number_of_mutations,
-                        construction_time,
-                        sample_time,
-                        design.write_csv(),
-                        *graph_properties.values(), sep=";")
-            else:
-                print(design.write_out(score))
+            for (design, score, number_of_mutations, sample_time) in run_designs(args.number, adaptive_walk_optimization, structures, constraint,
+                    design_factory=design_factory, jobs=args.jobs, objective_function=temp_objective, stop=args.stop, mode=args.mode, checkpoint=checkpoint, progress=args.progress):
+                if (args.csv):
+                    print(args.stop,
+                            "\"" + args.mode + "\"",
+                            score,
+                            number_of_mutations,
+                            construction_time,
+                            sample_time,
+                            design.write_csv(),
+                            *graph_properties.values(), sep=";")
+                else:
+                    print(design.write_out(score))
+        except Exception as e:
+            print (e)
+            exit(1)
     else:
         print('# Construction time out reached!')
 
@@ -154,6 +156,9 @@ def build_molecule(structures, start_sequence, temperatures, package):
 def temp_objective(design, weight=1):
     return calculate_objective_1(design) + weight * temp_objective_2(design)
 
+# pairs of state keys compared by temp_objective_2, for every combination of keys and temperatures
+_key_pairs = {}
+
 def temp_objective_2(design):
     '''
     Calculates the objective function given a Design object containing the designed sequence and input structures.
@@ -164,18 +169,36 @@ def temp_objective_2(design):
     '''
     objective_difference_part = 0
     # print (design.state.keys())
-    for k in design.state.keys():
-        # first iterate over all desired structures with their target temperature
-        if re.match(re.compile("^[^\:]$"), k, flags=0):
-            for kk in design.state.keys():
-                if re.match(re.compile("^[^" + k + "]\:" + str(design.state[k].temperature)), kk, flags=0):
-                    objective_difference_part += (design.state[k].eos - design.state[kk].eos)
-                    # print (" + ( " + k + " - " + kk + ")")
+    for (k, kk) in get_key_pairs(design):
+        objective_difference_part += (design.state[k].eos - design.state[kk].eos)
+        # print (" + ( " + k + " - " + kk + ")")
     # print ("\n\n")
     if design.number_of_structures == 1:
         return objective_difference_part
     else:
         return objective_difference_part * 2 / (design.number_of_structures * (design.number_of_structures-1))
 
+def get_key_pairs(design):
+    '''
+    Finds the pairs of a desired structure at its target temperature and the other structures at this temperature.
+    The pairs only depend on the state keys and temperatures, so the patterns are matched only once for every design layout.
+
+    :param design: Design object containing the sequence and structures
+    :return: List of tuples of state keys
+    '''
+    layout = tuple((k, design.state[k].temperature) for k in design.state.keys())
+    if layout not in _key_pairs:
+        pairs = []
+        desired = re.compile("^[^\:]$")
+        for k, temperature in layout:
+            # first iterate over all desired structures with their target temperature
+            if desired.match(k):
+                other = re.compile("^[^" + k + "]\:" + str(temperature))
+                for kk, _ in layout:
+                    if other.match(kk):
+                        pairs.append((k, kk))
+        _key_pairs[layout] = pairs
+    return _key_pairs[layout]
+
 if __name__ == "__main__":
     main()
@@ -10,9 +10,42 @@ __maintainer__ = "Stefan Hammer"
 __email__ = "s.hammer@univie.ac.at"
 
 from RNAsketch import *
+from RNAsketch import _sample_connected_components, _component_samplers
+
+def calculate_objective_2_bound(design, threshold):
+    # the eos difference part is cheap, it is its own lower bound
+    return calculate_objective_2(design)
+
+def rejecting_bound(design, threshold):
+    # a bound always higher than the threshold, so candidates are never calculated completely
+    return threshold + 1.0
+
+def optimization_fixture(structures=None):
+    '''
+    Creates the objects an optimization run of the tests starts from.
+    Defined before the test modules are imported, as they import it from here.
+
+    :param structures: List of structures in dot-bracket notation (default: two small hairpins)
+    :return: Tuple of the structures, a new dependency graph and a new vrnaDesign object without a sequence
+    '''
+    if structures is None:
+        structures = ['((((....))))', '..((....))..']
+    return (structures, rbp.DependencyGraphMT(structures), vrnaDesign(structures))
+
 from test_State import TestStateClass
 from test_Design import TestDesignClass
+from test_Memo import TestMemoClass
+from test_Motifs import TestMotifsClass
+from test_Budget import TestBudgetClass
+from test_Checkpoint import TestCheckpointClass
+from test_MoveSelector import TestMoveSelectorClass
+from test_nupack import TestNupackClass
+from test_pKiss import TestPKissClass
+from test_RNARedPrintSampler import TestRNARedPrintSamplerClass
 import tempfile
+import functools
+import random
+from multiprocessing.pool import ThreadPool
 import unittest
 
 class TestRNAsketch(unittest.TestCase):
@@ -62,11 +95,142 @@ class TestRNAsketch(unittest.TestCase):
     def test_constraint_generation_optimization(self):
         pass
 
+    def test_run_designs(self):
+        results = list(run_designs(2, adaptive_walk_optimization, ['((((....))))', '............'], jobs=2, seed=1, stop=10))
+        self.assertEqual(len(results), 2)
+        for (design, score, number_of_samples, sample_time) in results:
+            self.assertEqual(len(design.sequence), 12)
+            self.assertEqual(score, calculate_objective(design))
+        # every run constructs its own seeded dependency graph, runs in this process give the same results
+        sequential = list(run_designs(2, adaptive_walk_optimization, ['((((....))))', '............'], jobs=1, seed=1, stop=10))
+        self.assertEqual(sorted((d.sequence, score) for (d, score, _, _) in sequential), sorted((d.sequence, score) for (d, score, _, _) in results))
+
+    def test_parallel_tempering_optimization(self):
+        structures = ['((((....))))', '............']
+        results = []
+        for _ in range(0, 2):
+            (score, number_of_samples, statistics) = parallel_tempering_optimization(functools.partial(rbp.DependencyGraphMT, structures, ''),
+                    functools.partial(vrnaDesign, structures), [0.5, 1.0, 2.0], swap_interval=5, rounds=4, seed=1)
+            self.assertEqual(number_of_samples, 60)
+            self.assertEqual(len(statistics['acceptance']), 3)
+            self.assertEqual(len(statistics['swap_acceptance']), 2)
+            self.assertEqual(score, calculate_objective(statistics['design']))
+            results.append((score, statistics['sequence'], statistics['acceptance'], statistics['swap_acceptance']))
+        # runs with the same seed are reproducible
+        self.assertEqual(results[0], results[1])
+
+    def test_genetic_optimization(self):
+        structures = ['((((....))))', '..((....))..']
+        dg = rbp.DependencyGraphMT(structures)
+        design = vrnaDesign(structures)
+        pool = ThreadPool(2)
+        (score, number_of_samples) = genetic_optimization(dg, design, population_size=4, generations=5, evaluator=pool)
+        pool.close()
+        self.assertTrue(number_of_samples > 0)
+        self.assertEqual(dg.get_sequence(), design.sequence)
+        self.assertEqual(score, calculate_objective(design))
+
+    def test_bounded_objective(self):
+        design = vrnaDesign(['((((....))))', '..((....))..'], 'GGGGAAAACCCC')
+        self.assertAlmostEqual(calculate_objective_lower_bound(design), calculate_objective(design))
+        self.assertTrue(calculate_objective_lower_bound(design, threshold=-1.0) <= calculate_objective(design))
+        objective = BoundedObjective()
+        self.assertEqual(objective(design), calculate_objective(design))
+        self.assertTrue(objective(design, -1.0) > -1.0)
+        self.assertEqual(objective.saved, 1)
+        self.assertAlmostEqual(objective(design, 1000.0), calculate_objective(design))
+        self.assertEqual(objective.saved, 1)
+        # the default lower bound belongs to calculate_objective only
+        with self.assertRaises(ValueError):
+            BoundedObjective(calculate_objective_2)
+        with self.assertRaises(ValueError):
+            BoundedObjective(functools.partial(calculate_objective, weight=1.0))
+        self.assertEqual(BoundedObjective(calculate_objective_2, calculate_objective_2_bound)(design, 1000.0), calculate_objective_2(design))
+        # states with a hard constraint are always part of the bound
+        design.state['1'].constraint = 'xx..........'
+        self.assertAlmostEqual(calculate_objective_lower_bound(design, threshold=-1000.0),
+            0.5 * calculate_objective_2(design) + (design.eos['1'] - design.state['1'].pf_energy) / 2)
+        # the dimer ensemble does not contain structures without intermolecular pairs, the bound must stay below the objective
+        design = vrnaDesign(['((((..&..))))', '(..)..&..(..)'], 'GGGGAA&AACCCC')
+        for threshold in [None, -1000.0, 0.0, 1000.0]:
+            self.assertTrue(calculate_objective_lower_bound(design, threshold) <= calculate_objective(design) + 1e-9)
+        self.assertAlmostEqual(calculate_objective_lower_bound(design, threshold=-1000.0), calculate_objective(design))
+
+    def test_bounded_objective_workers(self):
+        structures = ['((((....))))', '..((....))..']
+        # every candidate evaluated with a threshold is rejected early
+        objective = BoundedObjective(calculate_objective, rejecting_bound)
+        results = list(run_designs(2, adaptive_walk_optimization, structures, jobs=2, seed=1, stop=10, objective_function=objective))
+        self.assertEqual(objective.saved, sum(number_of_samples for (design, score, number_of_samples, sample_time) in results))
+        objective = BoundedObjective(calculate_objective, rejecting_bound)
+        (score, number_of_samples, statistics) = parallel_tempering_optimization(functools.partial(rbp.DependencyGraphMT, structures, ''),
+                functools.partial(vrnaDesign, structures), [0.5, 1.0], swap_interval=5, rounds=2, objective_function=objective, seed=1)
+        self.assertEqual(objective.saved, number_of_samples)
+
+    def test_objective_batch(self):
+        structures = ['((((....))))', '..((....))..', '............']
+        designs = [vrnaDesign(structures, s) for s in ['GGGGAAAACCCC', 'CCGCAAAAGCGG', 'AAGGAAAACCUU']]
+        (eos, pf) = get_energy_matrices(designs)
+        self.assertEqual(eos.shape, (3, 3))
+        for i, d in enumerate(designs):
+            self.assertAlmostEqual(calculate_objective_batch(eos, pf)[i], calculate_objective(d))
+            self.assertAlmostEqual(calculate_objective_1_batch(eos, pf)[i], calculate_objective_1(d))
+            self.assertAlmostEqual(calculate_objective_2_batch(eos)[i], calculate_objective_2(d))
+            self.assertAlmostEqual(calculate_objective_2_squared_batch(eos)[i], calculate_objective_2_squared(d))
+
+    def test_sample_admissibility(self):
+        sequences = ['GGGGAAAACCCC', 'AAAAAAAAAAAA', 'GCAUGCAUGCAU']
+        energies = [[-10.0, -5.0], [-10.0, -5.0], [-10.5, -5.2]]
+        (admissible, weight_factors, gcweight_factor) = sample_admissibility(sequences, energies, [-10.0, -5.0], 0.5)
+        self.assertEqual(list(admissible), [False, False, True])
+        self.assertAlmostEqual(weight_factors[0], 1.1**(-0.5/3))
+        self.assertAlmostEqual(weight_factors[1], 1.1**(-0.2/3))
+        self.assertAlmostEqual(gcweight_factor, 0.5 / ((0.625 + 0.125 + 0.5) / 3))
+        # target energies as written by design-energyshift.py, a dict with the structure indices as keys
+        (admissible, weight_factors, gcweight_factor) = sample_admissibility(sequences, energies, {1: -5.0, 0: -10.0}, 0.5)
+        self.assertEqual(list(admissible), [False, False, True])
+        self.assertAlmostEqual(weight_factors[1], 1.1**(-0.2/3))
+
     def test_sample_sequence(self):
         pass
 
-    def _sample_connected_components(self):
-        pass
+    def test_sample_connected_components(self):
+        class FakeDependencyGraph(object):
+            def __init__(self, nos):
+                self._nos = nos
+            def number_of_connected_components(self):
+                return len(self._nos)
+            def number_of_sequences(self, c):
+                return self._nos[c]
+        def linear_draw(nos, amount):
+            # weighted draw without replacement by a linear scan over the remaining components
+            remaining = list(enumerate(nos))
+            result = []
+            for _ in range(0, min(amount, len(remaining))):
+                rand = random.randint(0, sum([n for (_, n) in remaining])-1)
+                cumulative = 0
+                for i, (c, n) in enumerate(remaining):
+                    cumulative += n
+                    if rand < cumulative:
+                        result.append(c)
+                        del remaining[i]
+                        break
+            return result
+        nos = [1, 4, 16, 1, 64, 2**20, 4, 1, 16, 2**20, 64, 1, 1]
+        dg = FakeDependencyGraph(nos)
+        for amount in [1, 3, len(nos), 20]:
+            for seed in range(0, 20):
+                random.seed(seed)
+                expected = linear_draw(nos, amount)
+                random.seed(seed)
+                self.assertEqual(_sample_connected_components(dg, amount), expected)
+        # the cached tree is restored after every draw
+        self.assertEqual(sorted(_sample_connected_components(dg, len(nos))), list(range(0, len(nos))))
+        # the cached sampler does not keep the graph alive
+        self.assertTrue(dg in _component_samplers)
+        size = len(_component_samplers)
+        del dg
+        self.assertEqual(len(_component_samplers), size - 1)
 
     def test_sample_count_unique_solutions(self):
         self.assertEqual(sample_count_unique_solutions(6, 6), 14.7)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+'''
+    test_Budget.py: UNIT tests for Budget.py
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+from RNAsketch import *
+from tests import optimization_fixture
+import unittest
+
+class TestBudgetClass(unittest.TestCase):
+
+    def test_unlimited(self):
+        b = Budget()
+        self.assertFalse(b.exhausted(0.0))
+        self.assertEqual(b.reason, None)
+
+    def test_target(self):
+        b = Budget(target_score=1.0)
+        self.assertFalse(b.exhausted(1.5))
+        self.assertTrue(b.exhausted(1.0))
+        self.assertEqual(b.reason, 'target')
+
+    def test_time(self):
+        b = Budget(max_seconds=0)
+        self.assertTrue(b.exhausted())
+        self.assertEqual(b.reason, 'time')
+        b.max_seconds = 1000
+        b.start()
+        self.assertFalse(b.exhausted())
+
+    def test_evaluations(self):
+        b = Budget(max_evaluations=3)
+        a = vrnaDesign(['((((....))))'], 'CCGCAAAAGCGG')
+        a.eos
+        self.assertFalse(b.exhausted())
+        a.mfe_energy
+        a.pf_energy
+        self.assertTrue(b.exhausted())
+        self.assertEqual(b.reason, 'evaluations')
+
+    def test_optimization(self):
+        (structures, dg, design) = optimization_fixture()
+        b = Budget(max_evaluations=20)
+        (score, number_of_samples) = adaptive_walk_optimization(dg, design, stop=10000, budget=b)
+        self.assertEqual(b.reason, 'evaluations')
+        self.assertTrue(b.evaluations >= 20)
+        self.assertTrue(number_of_samples < 20)
+        self.assertEqual(score, calculate_objective(design))
+        # the reason of the first limit reached stays, the run stops before the first move
+        self.assertEqual(adaptive_walk_optimization(dg, design, stop=10000, budget=b), (score, 0))
+        self.assertEqual(b.reason, 'evaluations')
+
+    def test_optimization_target(self):
+        (structures, dg, design) = optimization_fixture()
+        b = Budget(max_seconds=1000, target_score=1000.0)
+        (score, number_of_samples) = adaptive_walk_optimization(dg, design, stop=10000, budget=b)
+        self.assertEqual(b.reason, 'target')
+        self.assertEqual(number_of_samples, 0)
+        (structures, dg, design) = optimization_fixture()
+        b = Budget(max_seconds=0)
+        (score, number_of_samples) = adaptive_walk_fixed(dg, design, number=10000, budget=b)
+        self.assertEqual(b.reason, 'time')
+        self.assertEqual(number_of_samples, 0)
+
+if __name__ == '__main__':
+    unittest.main()
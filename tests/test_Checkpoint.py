@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+'''
+    test_Checkpoint.py: UNIT tests for Checkpoint.py
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+from RNAsketch import *
+from tests import optimization_fixture
+import numpy as np
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+class TestCheckpointClass(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'run.checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_load(self):
+        c = Checkpoint(self.filename)
+        self.assertEqual(c.load('test'), None)
+        random.seed(1)
+        c.save('test', sequence='GGGGAAAACCCC', score=1.5)
+        number = random.random()
+        values = c.load('test')
+        self.assertEqual(values, {'sequence': 'GGGGAAAACCCC', 'score': 1.5})
+        self.assertEqual(random.random(), number)
+        with self.assertRaises(ValueError):
+            c.load('other')
+        self.assertEqual(os.listdir(self.directory), ['run.checkpoint'])
+
+    def test_resume(self):
+        c = Checkpoint(self.filename, resume=False)
+        c.save('test', score=1.5)
+        self.assertEqual(c.load('test'), None)
+        self.assertEqual(c.derive(3).filename, self.filename + '.3')
+
+    def test_interval(self):
+        c = Checkpoint(self.filename, interval=1000)
+        c.update('test', score=1.5)
+        self.assertFalse(os.path.exists(self.filename))
+        c.interval = 0
+        c.update('test', score=1.5)
+        self.assertTrue(os.path.exists(self.filename))
+
+    def test_optimization(self):
+        (structures, dg, design) = optimization_fixture()
+        c = Checkpoint(self.filename)
+        (score, number_of_samples) = adaptive_walk_optimization(dg, design, stop=10, checkpoint=c)
+        sequence = design.sequence
+        # a finished run is not continued
+        (structures, dg, design) = optimization_fixture()
+        self.assertEqual(adaptive_walk_optimization(dg, design, stop=10, checkpoint=c), (score, number_of_samples))
+        self.assertEqual(design.sequence, sequence)
+
+    def test_resume_random_state(self):
+        (structures, dg, design) = optimization_fixture()
+        c = Checkpoint(self.filename)
+        # the budget interrupts the run, so it is saved as not finished
+        (score, number_of_samples) = adaptive_walk_optimization(dg, design, stop=10000, budget=Budget(max_evaluations=10), checkpoint=c)
+        sequence = design.sequence
+        state = (random.getstate(), np.random.get_state())
+        # another run changes the random number generators in between
+        random.seed(2)
+        np.random.seed(2)
+        (structures, dg, design) = optimization_fixture()
+        (resumed_score, resumed_samples) = adaptive_walk_optimization(dg, design, stop=10000, budget=Budget(max_seconds=0), checkpoint=c)
+        self.assertEqual((resumed_score, resumed_samples), (score, number_of_samples))
+        self.assertEqual(design.sequence, sequence)
+        # the resumed run continues with the random number generators of the interrupted one
+        self.assertEqual(random.getstate(), state[0])
+        self.assertTrue(all(np.array_equal(a, b) for a, b in zip(np.random.get_state(), state[1])))
+
+    def test_memo(self):
+        memo = State.memo
+        try:
+            State.memo = EvaluationMemo()
+            State.memo['a'] = 1
+            Checkpoint(self.filename, memo=True).save('test', score=1.5)
+            # the saved entries are added to an installed memo
+            State.memo = EvaluationMemo()
+            State.memo['b'] = 2
+            Checkpoint(self.filename).load('test')
+            self.assertEqual(sorted(State.memo.items()), [('a', 1), ('b', 2)])
+            # or to a new one
+            State.memo = None
+            Checkpoint(self.filename).load('test')
+            self.assertEqual(State.memo.items(), [('a', 1)])
+        finally:
+            State.memo = memo
+
+    def test_resume_evaluations(self):
+        (structures, dg, design) = optimization_fixture()
+        c = Checkpoint(self.filename)
+        adaptive_walk_optimization(dg, design, stop=10000, budget=Budget(max_evaluations=10), checkpoint=c)
+        # the start sequence of a resumed run is not evaluated
+        (structures, dg, design) = optimization_fixture()
+        backend_calls = State.backend_calls
+        adaptive_walk_optimization(dg, design, stop=10000, budget=Budget(max_seconds=0), checkpoint=c)
+        self.assertEqual(State.backend_calls, backend_calls)
+
+if __name__ == '__main__':
+    unittest.main()
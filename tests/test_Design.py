@@ -10,7 +10,31 @@ __email__ = "s.hammer@univie.ac.at"
 
 from RNAsketch import *
 import unittest
+import sys
 import RNA
+import multiprocessing
+import numpy as np
+from multiprocessing.pool import ThreadPool
+from test_State import FakeNupack
+
+class FakePKiss(object):
+    '''
+    Replaces the pKiss wrapper module, the calls return fixed values and are recorded.
+    '''
+    def __init__(self):
+        self.calls = []
+
+    def mfe(self, sequence, **kwargs):
+        self.calls.append('mfe')
+        return ('((((....))))', -5.2)
+
+    def eval_batch(self, sequences, structures, **kwargs):
+        self.calls.append('eval_batch')
+        return [('[]', -3.1, structure) for structure in structures]
+
+    def mfe_batch(self, sequences, **kwargs):
+        self.calls.append('mfe_batch')
+        return [('((((....))))', -5.2) for sequence in sequences]
 
 class TestDesignClass(unittest.TestCase):
 
@@ -64,6 +88,147 @@ class TestDesignClass(unittest.TestCase):
         self.assertEqual(a.eos_diff_mfe, {'0': 0.0})
         self.assertEqual(a.ensemble_defect, {'0': 0.0})
 
+    def test_evaluate(self):
+        a = vrnaDesign(['((((((((((....))))))))))', '........................'], 'GCCCCCCCCGGAAACGGGGGGGGC')
+        b = vrnaDesign(['((((((((((....))))))))))', '........................'], 'GCCCCCCCCGGAAACGGGGGGGGC')
+        a.evaluate()
+        self.assertEqual(a.mfe_energy, b.mfe_energy)
+        self.assertEqual(a.mfe_structure, b.mfe_structure)
+        self.assertEqual(a.pf_structure, b.pf_structure)
+        for s in a.state:
+            self.assertAlmostEqual(a.pf_energy[s], b.pf_energy[s], places=5)
+            self.assertAlmostEqual(a.ensemble_defect[s], b.ensemble_defect[s], places=5)
+
+    def test_executor(self):
+        a = vrnaDesign(['((((((((((....))))))))))', '........................', '((((....))))............'], 'GCCCCCCCCGGAAACGGGGGGGGC')
+        b = vrnaDesign(['((((((((((....))))))))))', '........................', '((((....))))............'], 'GCCCCCCCCGGAAACGGGGGGGGC')
+        pool = ThreadPool(3)
+        a.executor = pool
+        self.assertEqual(a.eos, b.eos)
+        self.assertEqual(a.mfe_structure, b.mfe_structure)
+        for s in a.state:
+            self.assertAlmostEqual(a.pf_energy[s], b.pf_energy[s], places=5)
+        a.sequence = 'GGGGAAAACCCCGCCCCCCCCGGA'
+        a.evaluate()
+        b.sequence = 'GGGGAAAACCCCGCCCCCCCCGGA'
+        self.assertEqual(a.mfe_energy, b.mfe_energy)
+        pool.close()
+
+    def test_executor_backend_calls(self):
+        structures = ['((((((((((....))))))))))', '........................', '((((....))))............']
+        for pool in [ThreadPool(3), multiprocessing.Pool(3)]:
+            a = vrnaDesign(structures, 'GCCCCCCCCGGAAACGGGGGGGGC')
+            a.executor = pool
+            backend_calls = State.backend_calls
+            a.eos
+            # one eos call per state, no matter in which thread or process it was done
+            self.assertEqual(State.backend_calls - backend_calls, 3)
+            pool.close()
+            pool.join()
+
+    def test_pkiss_evaluate(self):
+        backends = sys.modules['RNAsketch.State']._backends
+        fake = FakePKiss()
+        original = backends.get('pKiss')
+        backends['pKiss'] = fake
+        memo = State.memo
+        State.memo = EvaluationMemo()
+        try:
+            a = pkissDesign(['((((....))))', '..((....))..'], 'GGGGAAAACCCC')
+            backend_calls = State.backend_calls
+            a.evaluate()
+            # one mfe call and one eval batch for both states
+            self.assertEqual(fake.calls, ['mfe', 'eval_batch'])
+            self.assertEqual(State.backend_calls - backend_calls, 2)
+            self.assertEqual(a.eos, {'0': -3.1, '1': -3.1})
+            self.assertEqual(a.pf_energy, {'0': -5.2, '1': -5.2})
+            # another design with the same sequence gets all values from the memo
+            b = pkissDesign(['((((....))))', '..((....))..'], 'GGGGAAAACCCC')
+            backend_calls = State.backend_calls
+            b.evaluate()
+            self.assertEqual(fake.calls, ['mfe', 'eval_batch'])
+            self.assertEqual(State.backend_calls - backend_calls, 0)
+            self.assertEqual(b.mfe_energy, a.mfe_energy)
+            # only the requested values are calculated
+            c = pkissDesign(['((((....))))', '..((....))..'], 'CCGCAAAAGCGG')
+            c.evaluate(['eos'])
+            self.assertEqual(fake.calls, ['mfe', 'eval_batch', 'eval_batch'])
+            self.assertEqual(c.state['0']._mfe_energy, None)
+        finally:
+            State.memo = memo
+            if original is None:
+                del backends['pKiss']
+            else:
+                backends['pKiss'] = original
+
+    def test_evaluate_many(self):
+        structures = ['((((....))))', '..((....))..']
+        sequences = ['CCGCAAAAGCGG', 'GGGGAAAACCCC', 'AAGGAAAACCUU']
+        a = vrnaDesign(structures)
+        for jobs in [None, 2]:
+            result = a.evaluate_many(sequences, jobs=jobs)
+            self.assertEqual(result.shape, (3, 2))
+            self.assertEqual(result.dtype.names, ('eos', 'mfe', 'pf'))
+            for i, s in enumerate(sequences):
+                b = vrnaDesign(structures, s)
+                for j, k in enumerate(['0', '1']):
+                    self.assertAlmostEqual(result['eos'][i, j], b.eos[k], places=5)
+                    self.assertAlmostEqual(result['mfe'][i, j], b.mfe_energy[k], places=5)
+                    self.assertAlmostEqual(result['pf'][i, j], b.pf_energy[k], places=5)
+        self.assertEqual(a.sequence, None)
+        result = a.evaluate_many(sequences[:1], properties=['ensemble_defect'], keys=['1'])
+        self.assertEqual(result.shape, (1, 1))
+
+    def test_evaluate_many_batch(self):
+        backends = sys.modules['RNAsketch.State']._backends
+        original = (backends.get('pKiss'), backends.get('nupack'))
+        (backends['pKiss'], backends['nupack']) = (FakePKiss(), FakeNupack())
+        structures = ['((((....))))', '..((....))..']
+        sequences = ['GGGGAAAACCCC', 'CCGCAAAAGCGG', 'AAGGAAAACCUU']
+        try:
+            a = pkissDesign(structures)
+            backend_calls = State.backend_calls
+            result = a.evaluate_many(sequences, properties=['eos', 'pf', 'mfe_structure'])
+            # one mfe call for all sequences and one eval call for all sequences and states
+            self.assertEqual(backends['pKiss'].calls, ['mfe_batch', 'eval_batch'])
+            self.assertEqual(State.backend_calls - backend_calls, 2)
+            self.assertEqual(result.dtype['eos'], np.dtype(float))
+            self.assertEqual(result.dtype['mfe_structure'], np.dtype(object))
+            self.assertEqual(result['eos'].tolist(), [[-3.1, -3.1]] * 3)
+            self.assertEqual(result['pf'].tolist(), [[-5.2, -5.2]] * 3)
+            self.assertEqual(result['mfe_structure'][2, 1], '((((....))))')
+            a = nupackDesign(structures)
+            backend_calls = State.backend_calls
+            result = a.evaluate_many(sequences, properties=['eos', 'pf'])
+            # energy and pfunc calls of all sequences and states in one batch
+            self.assertEqual(len(backends['nupack'].batches), 1)
+            self.assertEqual(len(backends['nupack'].batches[0]), 12)
+            self.assertEqual(State.backend_calls - backend_calls, 12)
+            self.assertEqual(result['eos'].tolist(), [[-3.2, -3.2]] * 3)
+            self.assertEqual(result['pf'].tolist(), [[-4.2, -4.2]] * 3)
+            with self.assertRaises(ValueError):
+                a.evaluate_many(sequences, properties=['energy'])
+        finally:
+            for name, backend in zip(['pKiss', 'nupack'], original):
+                if backend is None:
+                    del backends[name]
+                else:
+                    backends[name] = backend
+
+    def test_snapshot(self):
+        a = vrnaDesign(['((((....))))'], 'CCGCAAAAGCGG')
+        mfe_energy = a.mfe_energy
+        a.push_snapshot()
+        a.sequence = 'GGGGAAAACCCC'
+        self.assertNotEqual(a.mfe_energy, mfe_energy)
+        self.assertEqual(a.pop_snapshot(), 'CCGCAAAAGCGG')
+        self.assertEqual(a.sequence, 'CCGCAAAAGCGG')
+        self.assertEqual(a.state['0']._mfe_energy, mfe_energy['0'])
+        a.push_snapshot()
+        a.sequence = 'GGGGAAAACCCC'
+        self.assertEqual(a.pop_snapshot(restore=False), 'CCGCAAAAGCGG')
+        self.assertEqual(a.sequence, 'GGGGAAAACCCC')
+
     def test_print(self):
         a = vrnaDesign(['((((....))))','..((....))..'], 'AAGGACGUCCUU')
         print('\n')
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+'''
+    test_Memo.py: UNIT tests for Memo.py
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+from RNAsketch import *
+import os
+import pickle
+import tempfile
+import unittest
+
+class TestMemoClass(unittest.TestCase):
+
+    def test_lru(self):
+        m = EvaluationMemo(maxsize=2)
+        m['a'] = 1
+        m['b'] = 2
+        self.assertEqual(m['a'], 1)
+        m['c'] = 3
+        self.assertEqual(len(m), 2)
+        self.assertTrue('a' in m)
+        self.assertFalse('b' in m)
+        with self.assertRaises(KeyError):
+            m['b']
+        self.assertEqual(m.hits, 1)
+        self.assertEqual(m.misses, 1)
+        self.assertEqual(m.hit_rate, 0.5)
+        with self.assertRaises(ValueError):
+            EvaluationMemo(maxsize=0)
+
+    def test_spill(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'memo')
+        m = EvaluationMemo(maxsize=1, spill=filename)
+        m[('vrna', 'GGGAAACCC')] = -1.2
+        m[('vrna', 'CCCAAAGGG')] = -0.8
+        self.assertEqual(len(m), 1)
+        self.assertEqual(m[('vrna', 'GGGAAACCC')], -1.2)
+        self.assertEqual(m.hits, 1)
+        m.close()
+
+    def test_drop_spill(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'memo')
+        m = EvaluationMemo(maxsize=1, spill=filename)
+        m['a'] = 1
+        m['b'] = 2
+        m.drop_spill()
+        with self.assertRaises(KeyError):
+            m['a']
+        m['c'] = 3
+        self.assertFalse('b' in m)
+        m._dropped_spill.close()
+        # the evicted entry was not written to the shelve anymore
+        m = EvaluationMemo(maxsize=1, spill=filename)
+        self.assertTrue('a' in m)
+        self.assertFalse('b' in m)
+        m.close()
+
+    def test_pickle(self):
+        m = EvaluationMemo(maxsize=2)
+        m['a'] = 1
+        c = pickle.loads(pickle.dumps(m))
+        self.assertEqual(c['a'], 1)
+        c['b'] = 2
+        self.assertEqual(len(c), 2)
+
+    def test_items(self):
+        m = EvaluationMemo(maxsize=2)
+        m['a'] = 1
+        m['b'] = 2
+        self.assertEqual(m.items(), [('a', 1), ('b', 2)])
+        c = EvaluationMemo(maxsize=2)
+        c['c'] = 3
+        c.update(m.items())
+        self.assertEqual(c.items(), [('a', 1), ('b', 2)])
+
+    def test_state_memo(self):
+        State.memo = EvaluationMemo()
+        try:
+            a = vrnaDesign(['((((....))))'], 'CCGCAAAAGCGG')
+            b = vrnaDesign(['((((....))))'], 'CCGCAAAAGCGG')
+            self.assertEqual(a.eos, b.eos)
+            self.assertEqual(a.mfe_energy, b.mfe_energy)
+            self.assertEqual(State.memo.hits, 2)
+            self.assertEqual(State.memo.misses, 2)
+        finally:
+            State.memo = None
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+'''
+    test_Motifs.py: UNIT tests for Motifs.py
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+from RNAsketch import *
+import unittest
+
+class TestMotifsClass(unittest.TestCase):
+
+    def test_reject(self):
+        f = MotifFilter(['AAAA', 'GG[AU]C'])
+        self.assertTrue(f.reject('CCAAAACC'))
+        self.assertTrue(f.reject('CCGGUCCC'))
+        self.assertFalse(f.reject('CCAAACCGGCC'))
+
+    def test_empty(self):
+        f = MotifFilter()
+        self.assertFalse(f)
+        self.assertFalse(f.reject('AAAAAAAA'))
+
+    def test_white_positions(self):
+        f = MotifFilter(['AAAA', 'UUU|CCC'], [[2, 5], [0, 1], [8, 12]])
+        self.assertFalse(f.reject('CCAAAAGGCCCUU'))
+        # hit overlaps the end of a white interval
+        self.assertTrue(f.reject('GGAAAAAG'))
+        # hit spans two white intervals
+        self.assertTrue(f.reject('GAAAAGGG'))
+        # hit starts before the white interval
+        self.assertTrue(f.reject('GGGGGGGUUUU'))
+
+    def test_incremental(self):
+        f = MotifFilter(['AAAA', 'GG[AU]C'], [[0, 3]])
+        self.assertFalse(f.reject('AAAACCCCCCCC'))
+        self.assertTrue(f.reject('AAAACCCAAAAC', 'AAAACCCCCCCC'))
+        self.assertFalse(f.reject('AAAACCCCCGGC', 'AAAACCCCCCCC'))
+        self.assertTrue(f.reject('AAAACCCCGGUC', 'AAAACCCCCGGC'))
+        # unknown previous sequences are scanned completely
+        self.assertTrue(f.reject('CAAAACCCCCCC', 'GGUCCCCCCCCC'))
+
+    def test_incremental_window(self):
+        class RecordingPattern(object):
+            '''
+            Records the ranges of the sequence the wrapped pattern is applied to.
+            '''
+            def __init__(self, pattern, ranges):
+                self.pattern = pattern
+                self.ranges = ranges
+            def finditer(self, sequence, pos, endpos):
+                self.ranges.append((pos, endpos))
+                return self.pattern.finditer(sequence, pos, endpos)
+            def match(self, sequence, pos, endpos):
+                self.ranges.append((pos, endpos))
+                return self.pattern.match(sequence, pos, endpos)
+        f = MotifFilter(['AAAA', 'GG[AU]C'])
+        ranges = []
+        f._prefilter = RecordingPattern(f._prefilter, ranges)
+        f._detail = RecordingPattern(f._detail, ranges)
+        previous = 'C' * 100
+        self.assertFalse(f.reject(previous))
+        del ranges[:]
+        # changes at positions 47 to 50, hits touching them start at 43 to 50 and end before position 55
+        self.assertTrue(f.reject('C' * 47 + 'AAAA' + 'C' * 49, previous))
+        self.assertTrue(len(ranges) > 1)
+        for (pos, endpos) in ranges:
+            self.assertTrue(pos >= 43)
+            self.assertTrue(endpos <= 55)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+'''
+    test_MoveSelector.py: UNIT tests for MoveSelector.py
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+from RNAsketch import *
+from tests import optimization_fixture
+import unittest
+
+class TestMoveSelectorClass(unittest.TestCase):
+
+    def test_untried_first(self):
+        m = MoveSelector()
+        chosen = []
+        for _ in m.modes:
+            chosen.append(m.choose())
+            m.reward(0)
+        self.assertEqual(chosen, m.modes)
+        with self.assertRaises(ValueError):
+            MoveSelector().reward(1.0)
+
+    def test_reward(self):
+        m = MoveSelector(['sample', 'sample_clocal'], exploration=0.1)
+        for _ in range(0, 100):
+            if m.choose() == 'sample_clocal':
+                m.reward(1.0, 2)
+            else:
+                m.reward(-1.0, 2)
+        statistics = m.statistics
+        self.assertEqual(statistics['sample']['improved'], 0)
+        self.assertTrue(statistics['sample_clocal']['moves'] > statistics['sample']['moves'])
+        self.assertEqual(statistics['sample_clocal']['evaluations'], 2 * statistics['sample_clocal']['moves'])
+        self.assertEqual(len(m.write_out().split('\n')), 2)
+
+    def test_arm_counts(self):
+        m = MoveSelector(['sample', 'sample_clocal', 'sample_plocal'], exploration=0.0)
+        for _ in range(0, 30):
+            m.reward(1.0 if m.choose() == 'sample_clocal' else 0.0)
+        # every arm is tried once, afterwards only the improving one is chosen without exploration
+        self.assertEqual(dict((k, v['moves']) for k, v in m.statistics.items()), {'sample': 1, 'sample_clocal': 28, 'sample_plocal': 1})
+        self.assertEqual(m.statistics['sample_clocal']['improved'], 28)
+        m = MoveSelector(['sample', 'sample_clocal'], exploration=100.0)
+        for _ in range(0, 30):
+            m.reward(1.0 if m.choose() == 'sample_clocal' else 0.0)
+        # with a dominating exploration term both arms are chosen alternately
+        self.assertEqual([v['moves'] for v in m.statistics.values()], [15, 15])
+
+    def test_optimization(self):
+        (structures, dg, design) = optimization_fixture()
+        m = MoveSelector()
+        (score, number_of_samples) = adaptive_walk_fixed(dg, design, number=20, mode='adaptive', move_selector=m)
+        self.assertEqual(sum([v['moves'] for v in m.statistics.values()]), 20)
+        for v in m.statistics.values():
+            self.assertTrue(v['moves'] >= 1)
+            self.assertTrue(v['improved'] <= v['moves'])
+            self.assertTrue(v['evaluations'] >= v['moves'])
+        with self.assertRaises(ValueError):
+            sample_sequence(dg, design, 'adaptive')
+        # samples rejected because of motifs are retried with the chosen mode and do not count as moves
+        m = MoveSelector()
+        for _ in range(0, 10):
+            sample_sequence(dg, design, 'adaptive', avoid_motifs=['A'], move_selector=m)
+            m.reward(0)
+        self.assertEqual(sum([v['moves'] for v in m.statistics.values()]), 10)
+
+if __name__ == '__main__':
+    unittest.main()
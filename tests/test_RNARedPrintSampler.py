@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+'''
+    test_RNARedPrintSampler.py: UNIT tests for RNARedPrintSampler.py
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+from RNAsketch import *
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+# fake RNARedPrint writing the structures and --num sequences, every one an A longer than the one before,
+# the arguments of every call are appended to the log file and written to a file in the working directory
+script = '''#!/bin/sh
+echo "$@" >> {log}
+echo "$@" > last_call.txt
+n=0; prev=""
+for a in "$@"; do if [ "$prev" = "--num" ]; then n=$a; fi; prev=$a; done
+echo "((....))"
+echo "........"
+i=0; s=""
+while [ $i -lt $n ]; do echo "GG${{s}}CC E1=-1.5 E2=0"; s="${{s}}A"; i=$((i+1)); done
+'''
+
+class TestRNARedPrintSamplerClass(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.log = os.path.join(self.folder, 'calls.log')
+        os.mkdir(os.path.join(self.folder, 'bin'))
+        filename = os.path.join(self.folder, 'bin', 'RNARedPrint')
+        with open(filename, 'w') as f:
+            f.write(script.format(log=self.log))
+        os.chmod(filename, stat.S_IRWXU)
+        self.structures = ['((....))', '........']
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def calls(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            return [l.split() for l in f]
+
+    def test_stream(self):
+        sampler = RPSampler(self.structures, RedPrintFolder=self.folder, stacksize=5)
+        stream = sampler.stream_new_stack()
+        self.assertEqual(next(stream), ('GGCC', {0: -1.5, 1: 0.0}))
+        self.assertEqual(next(stream), ('GGACC', {0: -1.5, 1: 0.0}))
+        # closing the stream early stops RNARedPrint and keeps the sampling time
+        stream.close()
+        self.assertTrue(sampler.sample_time > 0)
+        (sequences, energies) = sampler.dump_new_stack()
+        self.assertEqual(sequences, ['GG' + 'A' * i + 'CC' for i in range(0, 5)])
+        self.assertEqual(len(self.calls()), 2)
+
+    def test_surplus(self):
+        sampler = RPSampler(self.structures, RedPrintFolder=self.folder, prefetch=3)
+        self.assertEqual([s for (s, _) in sampler.stream_new_stack(4)], ['GG' + 'A' * i + 'CC' for i in range(0, 4)])
+        self.assertEqual(self.calls()[-1][self.calls()[-1].index('--num') + 1], '12')
+        # the surplus of the first call is used in the order RNARedPrint wrote it
+        self.assertEqual([s for (s, _) in sampler.stream_new_stack(8)], ['GG' + 'A' * i + 'CC' for i in range(4, 12)])
+        self.assertEqual(len(self.calls()), 1)
+        self.assertEqual([s for (s, _) in sampler.stream_new_stack(2)], ['GGCC', 'GGACC'])
+        self.assertEqual(len(self.calls()), 2)
+        # a sample with other weights does not use the surplus
+        sampler.weights = [2.0, 1.0]
+        self.assertEqual([s for (s, _) in sampler.stream_new_stack(1)], ['GGCC'])
+        self.assertEqual(len(self.calls()), 3)
+
+    def test_shared_folder(self):
+        a = RPSampler(self.structures, RedPrintFolder=self.folder, weights=[1.0, 1.0])
+        b = RPSampler(self.structures, RedPrintFolder=self.folder, weights=[2.0, 2.0])
+        stream = a.stream_new_stack(3)
+        next(stream)
+        b.dump_new_stack()
+        list(stream)
+        # every sampler writes to its own scratch directory, the project folder stays untouched
+        self.assertNotEqual(a._scratch, b._scratch)
+        for sampler, weight in [(a, '1.0'), (b, '2.0')]:
+            with open(os.path.join(sampler._scratch, 'bin', 'last_call.txt')) as f:
+                args = f.read().split()
+            self.assertEqual(args[args.index('--weights') + 1], weight)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'bin', 'last_call.txt')))
+        scratch = a._scratch
+        del a
+        self.assertFalse(os.path.exists(scratch))
+
+    def test_missing_folder(self):
+        tempdir = tempfile.tempdir
+        tempfile.tempdir = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(OSError):
+                RPSampler(self.structures, RedPrintFolder=os.path.join(self.folder, 'missing'))
+            # the scratch directory is removed again
+            self.assertEqual(os.listdir(tempfile.tempdir), [])
+        finally:
+            shutil.rmtree(tempfile.tempdir)
+            tempfile.tempdir = tempdir
+
+    def test_shards(self):
+        sampler = RPSampler(self.structures, RedPrintFolder=self.folder, stacksize=7, shards=3)
+        sampler.min_shard = 2
+        (sequences, energies) = sampler.dump_new_stack()
+        self.assertEqual(len(sequences), 7)
+        self.assertEqual(len(sampler.shard_times), 3)
+        # the construction time is the longest one of the shards, as it is for the sampling time
+        self.assertEqual(len(sampler.shard_construction_times), 3)
+        self.assertEqual(sampler.construction_time, max(sampler.shard_construction_times))
+        self.assertTrue(sampler.construction_time > 0)
+        # one process per shard, each with its own seed
+        calls = self.calls()
+        self.assertEqual(sorted(int(c[c.index('--num') + 1]) for c in calls), [2, 2, 3])
+        self.assertEqual(len(set(c[c.index('--seed') + 1] for c in calls)), 3)
+        # requests too small for several shards are sampled by one process seeded by RNARedPrint
+        sampler.min_shard = 500
+        sampler.dump_new_stack()
+        self.assertEqual(len(self.calls()), 4)
+        self.assertFalse('--seed' in self.calls()[-1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,35 @@ __maintainer__ = "Stefan Hammer"
 __email__ = "s.hammer@univie.ac.at"
 
 from RNAsketch import *
+import os
+import sys
+import subprocess
 import unittest
+import RNAsketch.pKiss
+
+class FakeNupack(object):
+    '''
+    Replaces the nupack wrapper module, the calls return fixed values and are recorded by batch.
+    '''
+    def __init__(self):
+        self.batches = []
+
+    def energy_call(self, sequences, structure, **kwargs):
+        return ('energy', structure)
+
+    def mfe_call(self, sequences, **kwargs):
+        return ('mfe',)
+
+    def pfunc_call(self, sequences, **kwargs):
+        return ('pfunc',)
+
+    def defect_call(self, sequences, structure, **kwargs):
+        return ('defect', structure)
+
+    def run_batch(self, calls, jobs=None):
+        self.batches.append(calls)
+        values = {'energy': -3.2, 'mfe': [('((((....))))', '-5.2')], 'pfunc': -4.2, 'defect': 1.034}
+        return [values[c[0]] for c in calls]
 
 class TestStateClass(unittest.TestCase):
 
@@ -108,6 +136,54 @@ class TestStateClass(unittest.TestCase):
         print('vrna ed: {0:4.7f}'.format(ed))
         self.assertEqual(round(ed, 7), 0.0592835)
 
+    def test_calculate_ensemble_defects(self):
+        bpp = create_bpp_array(((0, 0, 0, 0, 0), (0, 0, 0, 0, 0.9), (0, 0, 0, 0, 0), (0, 0, 0, 0, 0), (0, 0, 0, 0, 0)))
+        self.assertAlmostEqual(calculate_ensemble_defect(bpp, '(..)'), 0.2)
+        self.assertAlmostEqual(calculate_ensemble_defect(bpp, '....'), 1.8)
+        eds = calculate_ensemble_defects(bpp, ['(..)', '....', '.().'])
+        self.assertEqual([round(ed, 5) for ed in eds], [0.2, 1.8, 3.8])
+        with self.assertRaises(ValueError):
+            calculate_ensemble_defect(bpp, '(...)')
+
+    def test_fold_compound_cache(self):
+        a = vrnaDesign(['((((....))))'], 'CCGCAAAAGCGG')
+        a.state['0'].eos
+        # eos alone only needs an eval only compound
+        self.assertEqual([k[-1] for k in a.state['0']._fold_compounds], [RNA.OPTION_MFE | RNA.OPTION_EVAL_ONLY])
+        a.state['0'].mfe_energy
+        a.state['0'].pf_energy
+        self.assertEqual(len(a.state['0']._fold_compounds), 2)
+        # the partition function compound is reused for eos of a new sequence
+        a.sequence = 'GGGGAAAACCCC'
+        a.state['0'].pf_energy
+        a.state['0'].eos
+        self.assertEqual(len(a.state['0']._fold_compounds), 1)
+        a.sequence = 'CCGCAAAAGCGG'
+        self.assertEqual(len(a.state['0']._fold_compounds), 0)
+
+    def test_nupack_evaluate(self):
+        backends = sys.modules['RNAsketch.State']._backends
+        fake = FakeNupack()
+        original = backends.get('nupack')
+        backends['nupack'] = fake
+        try:
+            a = nupackDesign(['((((....))))', '............'], 'GGGGAAAACCCC')
+            backend_calls = State.backend_calls
+            self.assertAlmostEqual(calculate_objective_1(a), 1.0)
+            # one batch per state with the energy and pfunc calls
+            self.assertEqual([[c[0] for c in calls] for calls in fake.batches], [['energy', 'pfunc'], ['energy', 'pfunc']])
+            self.assertEqual(State.backend_calls - backend_calls, 4)
+            a.state['0'].evaluate()
+            self.assertEqual([c[0] for c in fake.batches[-1]], ['defect', 'mfe'])
+            self.assertEqual(a.state['0'].mfe_structure, '((((....))))')
+            self.assertEqual(a.state['0'].mfe_energy, -5.2)
+            self.assertEqual(a.state['0'].ensemble_defect, 1.034)
+        finally:
+            if original is None:
+                del backends['nupack']
+            else:
+                backends['nupack'] = original
+
     def test_temperature(self):
         a = vrnaDesign(['((((....))))','((((....))))'], 'CCGCAAAAGCGG')
         self.assertEqual(a.state['0'].pf_energy, a.state['1'].pf_energy)
@@ -139,6 +215,45 @@ class TestStateClass(unittest.TestCase):
         self.assertNotEqual(cpf, ecpf)
         self.assertNotEqual(pf, ecpf)
 
+    def test_get_backend_failure(self):
+        module = sys.modules['RNAsketch.State']
+        checks = []
+        def _check_binaries():
+            checks.append(True)
+            raise ImportError('pKiss not found. Please install pKiss!')
+        original = (RNAsketch.pKiss._check_binaries, module._backends.pop('pKiss', None))
+        RNAsketch.pKiss._check_binaries = _check_binaries
+        try:
+            for _ in range(0, 3):
+                with self.assertRaises(ImportError):
+                    module.get_backend('pKiss')
+            # the binaries are probed once only
+            self.assertEqual(len(checks), 1)
+        finally:
+            RNAsketch.pKiss._check_binaries = original[0]
+            module._backend_errors.pop('pKiss', None)
+            if original[1] is not None:
+                module._backends['pKiss'] = original[1]
+
+    def test_import_without_backends(self):
+        # a fresh interpreter must neither probe a backend nor start any process on import
+        code = '''
+import subprocess
+calls = []
+_Popen = subprocess.Popen
+class CountingPopen(_Popen):
+    def __init__(self, *args, **kwargs):
+        calls.append(args)
+        _Popen.__init__(self, *args, **kwargs)
+subprocess.Popen = CountingPopen
+import sys
+import RNAsketch
+print(len(calls), len(sys.modules['RNAsketch.State']._backends), len(sys.modules['RNAsketch.State']._backend_errors))
+'''
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join([os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'), env.get('PYTHONPATH', '')])
+        output = subprocess.check_output([sys.executable, '-c', code], env=env)
+        self.assertEqual(output.split()[-3:], [b'0', b'0', b'0'])
 
 if __name__ == '__main__':
     unittest.main()
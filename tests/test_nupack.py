@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+'''
+    test_nupack.py: UNIT tests for the batch layer and the output parsers of nupack.py
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import RNAsketch.nupack as nupack
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+# output of the executables as written by NUPACK 3.0.6, shortened to the lines the parsers look at
+pfunc_output = ['% NUPACK 3.0.6', '% Program: pfunc', '% Sequence:  GGGGAAAACCCC', '% Temperature (C): 37.0', '',
+    '% Free energy (kcal/mol) and partition function:', '-4.21534063e+00', '9.23812754e+02', '']
+energy_output = ['% NUPACK 3.0.6', '% Program: energy', '% Energy (kcal/mol):', '-3.20', '']
+defect_output = ['% NUPACK 3.0.6', '% Program: complexdefect',
+    '% Ensemble defect n(s1) and normalized ensemble defect n(s1)/N:', '1.034e+00', '8.617e-02', '']
+mfe_output = ['% NUPACK 3.0.6\n', '% Program: mfe\n', '% %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n', '12\n', '-5.200\n',
+    '((((....))))\n', '% %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\n']
+
+class TestNupackClass(unittest.TestCase):
+
+    def test_parse_pfunc(self):
+        self.assertAlmostEqual(nupack._parse_pfunc(pfunc_output, T=37, N=1), -4.21534063)
+        self.assertAlmostEqual(nupack._parse_pfunc(pfunc_output, T=37, N=2), -4.21534063 + nupack.dGadjust(37, 2))
+        with self.assertRaises(NameError):
+            nupack._parse_pfunc(energy_output, T=37, N=1)
+
+    def test_parse_energy(self):
+        self.assertEqual(nupack._parse_energy(energy_output), -3.2)
+        with self.assertRaises(ValueError):
+            nupack._parse_energy(pfunc_output)
+
+    def test_parse_defect(self):
+        self.assertEqual(nupack._parse_defect(defect_output), 1.034)
+        with self.assertRaises(ValueError):
+            nupack._parse_defect(energy_output)
+
+    def test_parse_structures(self):
+        self.assertEqual(nupack._parse_structures(mfe_output), [('((((....))))', '-5.200')])
+
+    def test_run_batch(self):
+        folder = tempfile.mkdtemp()
+        os.mkdir(os.path.join(folder, 'bin'))
+        # fake executables writing the output above, mfe writes to the file given by the first input line
+        scripts = {'energy': "cat > /dev/null\nprintf '" + '\\n'.join(energy_output).replace('%', '%%') + "'\n",
+            'mfe': "read prefix\ncat > /dev/null\nprintf '" + ''.join(mfe_output).replace('%', '%%').replace('\n', '\\n') + "' > \"$prefix.mfe\"\n"}
+        for name, script in scripts.items():
+            filename = os.path.join(folder, 'bin', name)
+            with open(filename, 'w') as f:
+                f.write('#!/bin/sh\n' + script)
+            os.chmod(filename, stat.S_IRWXU)
+        home = os.environ.get('NUPACKHOME')
+        os.environ['NUPACKHOME'] = folder
+        try:
+            calls = [nupack.energy_call(['GGGGAAAACCCC'], '((((....))))'), nupack.mfe_call(['GGGGAAAACCCC']),
+                nupack.energy_call(['CCGCAAAAGCGG'], '((((....))))')]
+            self.assertEqual(nupack.run_batch(calls, jobs=2), [-3.2, [('((((....))))', '-5.200')], -3.2])
+        finally:
+            if home is None:
+                del os.environ['NUPACKHOME']
+            else:
+                os.environ['NUPACKHOME'] = home
+            shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+'''
+    test_pKiss.py: UNIT tests for the batch calls and the output parsers of pKiss.py
+'''
+
+__author__ = "Stefan Hammer"
+__copyright__ = "Copyright 2018"
+__maintainer__ = "Stefan Hammer"
+__email__ = "s.hammer@univie.ac.at"
+
+import RNAsketch.pKiss as pKiss
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+# output of pKiss --mode=eval for a multi-record FASTA input
+eval_output = '>0\n1  GGGGAAAACCCC  12\n-5.20  ((((....))))  []\n>1\n1  CCGCAAAAGCGG  12\n-3.10  ((((....))))  []\n'
+# output of pKiss --mode=mfe for a multi-record FASTA input
+mfe_output = '>0\n1  GGGGAAAACCCC  12\n-5.20  ((((....))))\n>1\n1  CCGCAAAAGCGG  12\n-3.10  ((((....))))\n'
+
+class TestPKissClass(unittest.TestCase):
+
+    def test_fasta_input(self):
+        self.assertEqual(pKiss._fasta_input([['GGGG', '(..)'], ['CCCC', '....']]), '>0\nGGGG\n(..)\n>1\nCCCC\n....\n')
+
+    def test_parse_output(self):
+        self.assertEqual(pKiss._parse_output('1  GGGGAAAACCCC  12\n-5.20  ((((....))))\n'), ('((((....))))', -5.2))
+        with self.assertRaises(IOError):
+            pKiss._parse_output('')
+
+    def test_parse_batch_output(self):
+        self.assertEqual(pKiss._parse_batch_output(eval_output, 2), [('[]', -5.2, '((((....))))'), ('[]', -3.1, '((((....))))')])
+        self.assertEqual(pKiss._parse_batch_output(mfe_output, 2), [('((((....))))', -5.2), ('((((....))))', -3.1)])
+        with self.assertRaises(IOError):
+            pKiss._parse_batch_output(mfe_output, 3)
+
+    def test_batch(self):
+        folder = tempfile.mkdtemp()
+        # fake pKiss writing the output above, depending on the mode argument
+        with open(os.path.join(folder, 'pKiss'), 'w') as f:
+            f.write("#!/bin/sh\ncase \"$*\" in\n*eval*) printf '" + eval_output.replace('\n', '\\n') + "';;\n" +
+                "*) printf '" + mfe_output.replace('\n', '\\n') + "';;\nesac\n")
+        os.chmod(os.path.join(folder, 'pKiss'), stat.S_IRWXU)
+        path = os.environ['PATH']
+        os.environ['PATH'] = folder + os.pathsep + path
+        try:
+            sequences = ['GGGGAAAACCCC', 'CCGCAAAAGCGG']
+            self.assertEqual(pKiss.mfe_batch(sequences), [('((((....))))', -5.2), ('((((....))))', -3.1)])
+            self.assertEqual([eos for (_, eos, _) in pKiss.eval_batch(sequences, ['((((....))))'] * 2)], [-5.2, -3.1])
+            self.assertEqual(pKiss.mfe_batch([]), [])
+        finally:
+            os.environ['PATH'] = path
+            shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    unittest.main()